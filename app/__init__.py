@@ -6,6 +6,12 @@ from flask_login import login_required, current_user
 
 from .config import Config, ensure_instance
 from .extensions import db, migrate, login_manager
+from . import schema
+from .engine import init_engine
+from .query_advisor import explain_hot_command
+from .cashier_summary import rebuild_cashier_summary_command
+from .stock_ledger import rebuild_stock_ledger_command, stock_checkpoint_command
+from .dashboard import club_metrics, totals as dashboard_totals
 
 # блюпринты
 from .auth import auth_bp
@@ -13,10 +19,11 @@ from .modules.cashier_report import bp as cashier_bp
 from .modules.schedule import bp as schedule_bp
 from .modules.payroll import bp as payroll_bp
 from .modules.admin_debts import bp as debts_bp
-from .modules.inventory import bp as inventory_bp
+from .modules.inventory import bp as inventory_bp, inventory_snapshots_command
 from .modules.debt_ops import bp as debtops_bp
 from .admin import bp as admin_bp
 from .admin_mgmt import bp as admin_mgmt_bp
+from .jobs import bp as jobs_bp, fail_stale_jobs
 
 # ACL
 from .acl import clubs_for_toolbar, get_active_club_id, set_active_club_id
@@ -35,6 +42,13 @@ def create_app():
     db.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
+    init_engine(app)
+
+    # схема БД проверяется (без DDL) один раз на процесс, дальше хелперы смотрят в реестр
+    schema.bootstrap(app)
+    # ...и перечитывается, если flask db upgrade из другого процесса сдвинул версию схемы
+    app.before_request(schema.check_shared_version)
+    fail_stale_jobs(app)
 
     # --- jinja-фильтры ---
     @app.template_filter("fmt_date")
@@ -109,6 +123,13 @@ def create_app():
         set_active_club_id(current_user, cid)
         return redirect(request.referrer or url_for("cashier.index"))
 
+    # --- CLI ---
+    app.cli.add_command(explain_hot_command)
+    app.cli.add_command(rebuild_cashier_summary_command)
+    app.cli.add_command(stock_checkpoint_command)
+    app.cli.add_command(rebuild_stock_ledger_command)
+    app.cli.add_command(inventory_snapshots_command)
+
     # --- блюпринты ---
     app.register_blueprint(auth_bp)
     app.register_blueprint(cashier_bp)
@@ -119,11 +140,23 @@ def create_app():
     app.register_blueprint(debtops_bp)
     app.register_blueprint(admin_bp, url_prefix="/admin")
     app.register_blueprint(admin_mgmt_bp)
+    app.register_blueprint(jobs_bp)
 
     # --- главная ---
     @app.route("/")
     @login_required
     def home():
-        return render_template("dashboard.html")
+        # сводка по клубам — только тем, кто видит выручку (как итоги месяца в кассе)
+        if getattr(current_user, "role", "") not in ("superadmin", "owner"):
+            return render_template("dashboard.html", clubs=[])
+        clubs = clubs_for_toolbar(current_user)
+        metrics = club_metrics(c["id"] for c in clubs)
+        return render_template(
+            "dashboard.html",
+            clubs=clubs,
+            metrics=metrics,
+            totals=dashboard_totals(metrics),
+            month_label=f"{date.today():%m.%Y}",
+        )
 
     return app
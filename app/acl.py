@@ -1,53 +1,200 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
 from typing import List, Dict, Any, Set
-from flask import session
-from sqlalchemy import text
+from flask import session, g, has_app_context, current_app
+from sqlalchemy import (
+    CheckConstraint, Column, Index, Integer, MetaData, Table, Text, UniqueConstraint, text,
+)
 from .extensions import db
+from . import schema
+from .sqlcompat import table_columns
+from .query_advisor import hot_query
+
+# Таблица членств живёт вне ORM-моделей (и вне автогенерации миграций),
+# поэтому описана отдельной метаданной; DDL строит SQLAlchemy под диалект.
+_user_club = Table(
+    "user_club", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=False),
+    Column("club_id", Integer, nullable=False),
+    Column("role", Text, nullable=False),
+    CheckConstraint("role IN ('owner','club_admin','staff')"),
+    UniqueConstraint("user_id", "club_id"),
+    Index("ix_user_club_user", "user_id"),
+    Index("ix_user_club_club", "club_id"),
+    sqlite_autoincrement=True,
+)
 
 # — создание таблицы членств при первом обращении —
 def _ensure_user_club_table() -> None:
-    cols = {r[1] for r in db.session.execute(text('PRAGMA table_info("user_club")')).all()}
+    if schema.has_table("user_club"):
+        return
+    cols = table_columns("user_club")
     if cols:
+        schema.mark("user_club", cols)
         return
-    db.session.execute(text("""
-        CREATE TABLE IF NOT EXISTS "user_club"(
-          id INTEGER PRIMARY KEY AUTOINCREMENT,
-          user_id INTEGER NOT NULL,
-          club_id INTEGER NOT NULL,
-          role TEXT NOT NULL CHECK(role IN ('owner','club_admin','staff')),
-          UNIQUE(user_id, club_id)
-        );
-    """))
-    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_user_club_user ON "user_club"(user_id);'))
-    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_user_club_club ON "user_club"(club_id);'))
-    db.session.commit()
+    _user_club.create(bind=db.session.get_bind(), checkfirst=True)
+    schema.mark("user_club", (c.name for c in _user_club.columns))
+    bump_membership_version()
 
 # — выборки клубов —
 def _all_active_clubs() -> List[Dict[str, Any]]:
-    sql = 'SELECT id, name FROM "club" WHERE is_active=1 ORDER BY name'
+    sql = 'SELECT id, name FROM "club" WHERE is_active = TRUE ORDER BY name'
     return list(db.session.execute(text(sql)).mappings().all())
 
-def _user_memberships(user_id: int) -> List[Dict[str, Any]]:
-    _ensure_user_club_table()
-    sql = """
-      SELECT c.id AS id, c.name AS name, uc.role AS role
+_MEMBERSHIPS_SQL = hot_query("acl.memberships", """
+      SELECT c.id AS id, c.name AS name, uc.role AS role, c.is_active AS is_active
       FROM "user_club" uc
       JOIN "club" c ON c.id = uc.club_id
-      WHERE uc.user_id = :uid AND c.is_active=1
+      WHERE uc.user_id = :uid
       ORDER BY c.name
+    """, uid=1)
+
+def _user_memberships(user_id: int) -> List[Dict[str, Any]]:
+    _ensure_user_club_table()
+    return list(db.session.execute(text(_MEMBERSHIPS_SQL), {"uid": user_id}).mappings().all())
+
+# — членства в рамках одного запроса —
+_G_KEY = "_acl_membership"
+
+class Membership:
+    """
+    Клубы пользователя и его роли в них; живёт не дольше одного запроса.
+    clubs/ids — только активные клубы, roles — роли во всех клубах (как в user_club).
     """
-    return list(db.session.execute(text(sql), {"uid": user_id}).mappings().all())
+    __slots__ = ("clubs", "ids", "roles")
 
-def clubs_for_toolbar(user) -> List[Dict[str, Any]]:
+    def __init__(self, clubs: List[Dict[str, Any]], roles: Dict[int, str]):
+        self.clubs = clubs
+        self.ids = {int(c["id"]) for c in clubs}
+        self.roles = roles
+
+    def role(self, club_id: int) -> str | None:
+        return self.roles.get(int(club_id))
+
+def _load_membership(user) -> Membership:
     if getattr(user, "role", "") == "superadmin":
-        return _all_active_clubs()
-    return _user_memberships(getattr(user, "id", 0))
+        return Membership([dict(r) for r in _all_active_clubs()], {})
+    rows = _user_memberships(getattr(user, "id", 0))
+    clubs = [{"id": r["id"], "name": r["name"]} for r in rows if r["is_active"]]
+    return Membership(clubs, {int(r["id"]): r["role"] for r in rows})
+
+# — кэш членств на процесс —
+# Членства меняет только superadmin (admin_mgmt), поэтому каждая запись
+# увеличивает версию, и все ранее закэшированные значения становятся
+# недействительными. Версия общая для всех воркеров — mtime файла
+# instance/acl.version: bump его сдвигает, каждый запрос сверяет (один stat).
+# TTL ограничивает устаревание только после правок в БД в обход приложения.
+_cache_lock = threading.Lock()
+_cache: "OrderedDict[tuple[int, str], tuple[int, float, Membership]]" = OrderedDict()
+_cache_version = 0
+_seen_shared = None
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+def _version_file() -> str:
+    return os.path.join(current_app.instance_path, "acl.version")
+
+def _shared_version() -> int:
+    try:
+        return os.stat(_version_file()).st_mtime_ns
+    except OSError:
+        return 0
+
+def _bump_shared_version() -> None:
+    path = _version_file()
+    try:
+        # mtime ставим явно и строго больше прежнего: грубое время ФС не склеит две записи подряд
+        t = max(time.time_ns(), _shared_version() + 1)
+        with open(path, "a"):
+            pass
+        os.utime(path, ns=(t, t))
+    except OSError:
+        pass
+
+def _invalidate() -> None:
+    global _cache_version
+    with _cache_lock:
+        _cache_version += 1
+        _cache.clear()
+        _cache_stats["invalidations"] += 1
+
+def bump_membership_version() -> None:
+    """Вызывать после любой записи в user_club/club/роли пользователя."""
+    _invalidate()
+    if has_app_context():
+        _bump_shared_version()
+    reset_membership()
+
+def _check_shared_version() -> None:
+    # версию сдвинул другой воркер — локальный кэш устарел
+    global _seen_shared
+    shared = _shared_version()
+    if shared != _seen_shared:
+        if _seen_shared is not None:
+            _invalidate()
+        _seen_shared = shared
+
+def membership_cache_stats() -> Dict[str, Any]:
+    with _cache_lock:
+        return dict(_cache_stats, size=len(_cache), version=_cache_version)
+
+def _cached_membership(user) -> Membership:
+    key = (int(getattr(user, "id", 0) or 0), getattr(user, "role", ""))
+    ttl = float(current_app.config.get("ACL_CACHE_TTL", 0) or 0)
+    max_size = int(current_app.config.get("ACL_CACHE_SIZE", 0) or 0)
+    if ttl <= 0 or max_size <= 0:
+        return _load_membership(user)
+
+    _check_shared_version()
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit and hit[0] == _cache_version and hit[1] > now:
+            _cache.move_to_end(key)
+            _cache_stats["hits"] += 1
+            return hit[2]
+        _cache_stats["misses"] += 1
+        version = _cache_version
+
+    m = _load_membership(user)
+    with _cache_lock:
+        # пока шёл запрос в БД, членства могли поменяться — такое не кладём
+        if version == _cache_version:
+            _cache[key] = (version, now + ttl, m)
+            _cache.move_to_end(key)
+            while len(_cache) > max_size:
+                _cache.popitem(last=False)
+                _cache_stats["evictions"] += 1
+    return m
+
+def membership(user) -> Membership:
+    """Членства пользователя, запомненные на flask.g до конца запроса."""
+    if not has_app_context():
+        return _load_membership(user)
+    key = (int(getattr(user, "id", 0) or 0), getattr(user, "role", ""))
+    cached = g.get(_G_KEY)
+    if cached is None or cached[0] != key:
+        cached = (key, _cached_membership(user))
+        setattr(g, _G_KEY, cached)
+    return cached[1]
+
+def reset_membership() -> None:
+    """Сбросить запомненные членства (после изменений в user_club/club)."""
+    if has_app_context():
+        g.pop(_G_KEY, None)
+
+def membership_role(user, club_id: int) -> str | None:
+    return membership(user).role(club_id)
+
+def clubs_for_toolbar(user) -> List[Dict[str, Any]]:
+    return membership(user).clubs
 
 def allowed_club_ids(user) -> Set[int]:
-    if getattr(user, "role", "") == "superadmin":
-        return {row["id"] for row in _all_active_clubs()}
-    return {row["id"] for row in _user_memberships(getattr(user, "id", 0))}
+    return set(membership(user).ids)
 
 # — активный клуб в сессии —
 _SESSION_KEY = "club_id"
@@ -75,10 +222,7 @@ def set_active_club_id(user, club_id: int) -> None:
 def can_edit_report(user, report_club_id: int) -> bool:
     if getattr(user, "role", "") == "superadmin":
         return True
-    if report_club_id not in allowed_club_ids(user):
+    # роли хранятся и для неактивных клубов — их отчёты не редактируются
+    if int(report_club_id) not in allowed_club_ids(user):
         return False
-    row = db.session.execute(
-        text('SELECT role FROM "user_club" WHERE user_id=:u AND club_id=:c'),
-        {"u": getattr(user, "id", 0), "c": report_club_id},
-    ).first()
-    return bool(row and row[0] in ("owner", "club_admin"))
+    return membership_role(user, report_club_id) in ("owner", "club_admin")
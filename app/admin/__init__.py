@@ -1,25 +1,24 @@
 from __future__ import annotations
 
-from datetime import date
-import io, csv, re
+from datetime import date, timedelta
+import re
 
 from flask import Blueprint, render_template, request, redirect, url_for, Response, flash
-from flask_login import login_required
+from flask_login import current_user, login_required
 from sqlalchemy import and_, text
 
 from ..extensions import db
-from ..models import CashierReport
+from ..sqlcompat import string_agg, upsert
+from ..cashier_summary import month_summaries, refresh_month
+from ..exports import cashier_export_response
+from ..models import CashierReport, Club
 from ..security import roles_required  # superadmin
 from ..models.inventory import Product, ClubProductBarcode, ensure_club_barcode_price_column
+from ..jobs import get_job, save_upload, submit
+from .product_import import PLACEHOLDER_PREFIX, run_import, placeholder_barcode as _placeholder_barcode
 
 bp = Blueprint("admin", __name__, url_prefix="/admin")
 
-
-PLACEHOLDER_PREFIX = "__AUTO_EMPTY_BARCODE__"
-
-def _placeholder_barcode(product_id: int) -> str:
-    return f"{PLACEHOLDER_PREFIX}{int(product_id)}"
-
 def _ensure_placeholder_mapping(club_id: int, product_id: int, purchase: float = 0.0) -> None:
     placeholder = _placeholder_barcode(product_id)
     mp = ClubProductBarcode.query.filter_by(club_id=club_id, barcode=placeholder).first()
@@ -37,13 +36,6 @@ def _ensure_placeholder_mapping(club_id: int, product_id: int, purchase: float =
             except Exception:
                 pass
 
-def _remove_placeholder_mapping(club_id: int, product_id: int) -> None:
-    placeholder = _placeholder_barcode(product_id)
-    db.session.execute(
-        text('DELETE FROM "club_product_barcode" WHERE club_id=:c AND product_id=:p AND barcode=:b'),
-        {"c": club_id, "p": product_id, "b": placeholder},
-    )
-
 
 
 def _month_bounds(m: str | None):
@@ -58,6 +50,25 @@ def _month_bounds(m: str | None):
     return start, end
 
 
+def _parse_day(s: str | None) -> date | None:
+    try:
+        return date.fromisoformat((s or "").strip())
+    except ValueError:
+        return None
+
+
+def _export_filters(start: date, end: date) -> tuple[date, date, list[int]]:
+    """
+    Период и клубы выгрузки: ?from=YYYY-MM-DD&to=YYYY-MM-DD (включительно)
+    и ?club_id=… (можно несколько). По умолчанию — месяц m по всем клубам.
+    """
+    d1 = _parse_day(request.args.get("from")) or start
+    d2 = _parse_day(request.args.get("to"))
+    d2 = d2 + timedelta(days=1) if d2 else end
+    club_ids = [int(c) for c in request.args.getlist("club_id") if c.strip().isdigit()]
+    return d1, d2, club_ids
+
+
 @bp.route("/")
 @login_required
 @roles_required("superadmin")
@@ -71,7 +82,7 @@ def index():
 @login_required
 @roles_required("superadmin")
 def cashier_admin():
-    """Список отчётов кассира за месяц + экспорт CSV."""
+    """Список отчётов кассира за месяц + экспорт CSV/XLSX (произвольный период и клубы)."""
     m = request.args.get("m")
     start, end = _month_bounds(m)
 
@@ -83,61 +94,38 @@ def cashier_admin():
         )
     )
 
-    if request.args.get("export") == "csv":
-        buf = io.StringIO(newline="")
-        w = csv.writer(buf, delimiter=";")
-        w.writerow(
-            [
-                "Дата",
-                "Смена",
-                "Администратор",
-                "Игровое+PS",
-                "Бар",
-                "Нал",
-                "Расширенная оплата",
-                "СБП эквайринг",
-                "CLS",
-                "Эквайринг",
-                "Расход",
-                "Возврат нал",
-                "Возврат безнал",
-                "Равно?",
-                "Остаток нал",
-                "Инкассация",
-            ]
-        )
-        for r in q.all():
-            user = getattr(r, "user", None)
-            fio = getattr(user, "full_name", None) or getattr(user, "username", None) or ""
-            w.writerow(
-                [
-                    r.shift_date.isoformat(),
-                    "День" if getattr(r, "shift_type", "") == "day" else "Ночь",
-                    fio,
-                    float(getattr(r, "game_ps", 0) or 0),
-                    float(getattr(r, "bar", 0) or 0),
-                    float(getattr(r, "cash", 0) or 0),
-                    float(getattr(r, "extended", 0) or 0),
-                    float(getattr(r, "sbp_acq", 0) or 0),
-                    float(getattr(r, "cls", 0) or 0),
-                    float(getattr(r, "acquiring", 0) or 0),
-                    float(getattr(r, "expense", 0) or 0),
-                    float(getattr(r, "refund_cash", 0) or 0),
-                    float(getattr(r, "refund_noncash", 0) or 0),
-                    getattr(r, "is_equal", None) or "",
-                    float(getattr(r, "cash_left", 0) or 0),
-                    float(getattr(r, "encashment", 0) or 0),
-                ]
-            )
-        data = buf.getvalue().encode("utf-8-sig")
-        filename = f"cashier_{start:%Y-%m}.csv"
-        return Response(
-            data,
-            mimetype="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={filename}"},
-        )
+    export = request.args.get("export")
+    if export in ("csv", "xlsx"):
+        d1, d2, club_ids = _export_filters(start, end)
+        if (d1, d2) == (start, end):
+            filename = f"cashier_{start:%Y-%m}"
+        else:
+            filename = f"cashier_{d1:%Y-%m-%d}_{d2 - timedelta(days=1):%Y-%m-%d}"
+        return cashier_export_response(export, d1, d2, club_ids, filename)
+
+    # итоги по клубам за месяц и тренд за 12 месяцев — из свёртки cashier_month_summary
+    clubs = {c.id: c.name for c in Club.query.order_by(Club.name.asc()).all()}
+    y, mm = (start.year, start.month - 11) if start.month > 11 else (start.year - 1, start.month + 1)
+    rollup = month_summaries(clubs.keys(), date(y, mm, 1), end)
+    by_club = [s for s in rollup if s.month == start]
+    trend: dict[date, dict] = {}
+    for s in rollup:
+        t = trend.setdefault(s.month, {"reports": 0, "z": 0, "bar": 0, "cash": 0, "extended": 0, "fee": 0})
+        t["reports"] += s.reports or 0
+        t["z"] += s.z_report
+        t["bar"] += s.bar or 0
+        t["cash"] += s.cash or 0
+        t["extended"] += s.extended or 0
+        t["fee"] += s.acquiring_fee or 0
 
-    return render_template("admin/reports.html", items=q.all(), month_str=f"{start:%Y-%m}")
+    return render_template(
+        "admin/reports.html",
+        items=q.all(),
+        month_str=f"{start:%Y-%m}",
+        clubs=clubs,
+        by_club=by_club,
+        trend=sorted(trend.items()),
+    )
 
 
 @bp.route("/cashier/<int:rid>/delete", methods=["POST"])
@@ -149,7 +137,10 @@ def cashier_delete(rid: int):
     if not r:
         flash("Отчёт не найден", "warning")
         return redirect(url_for("admin.cashier_admin", m=request.args.get("m")))
+    club_id, shift_date = r.club_id, r.shift_date
     db.session.delete(r)
+    db.session.flush()
+    refresh_month(club_id, shift_date)
     db.session.commit()
     flash("Отчёт удалён", "success")
     return redirect(url_for("admin.cashier_admin", m=request.args.get("m")))
@@ -163,20 +154,6 @@ def debts_import():
     return redirect(url_for("admin.debts_products"))
 
 
-def _parse_barcodes(text_val: str) -> list[str]:
-    s = "" if text_val is None else str(text_val).strip()
-    if not s:
-        return []
-    tokens = re.split(r"[,;\s|/\\]+", s)
-    out, seen = [], set()
-    for t in tokens:
-        b = re.sub(r"\D", "", str(t))
-        if b and b not in seen:
-            seen.add(b)
-            out.append(b)
-    return out
-
-
 @bp.route("/debts-products", methods=["GET", "POST"])
 @login_required
 @roles_required("superadmin")
@@ -184,7 +161,7 @@ def debts_products():
     ensure_club_barcode_price_column()
 
     clubs = db.session.execute(
-        text('SELECT id,name FROM "club" WHERE COALESCE(is_active,1)=1 ORDER BY name')
+        text('SELECT id,name FROM "club" WHERE COALESCE(is_active,TRUE) ORDER BY name')
     ).mappings().all()
 
     # Current club id
@@ -235,13 +212,16 @@ def debts_products():
             {"c": cid, "p": pid},
         )
         if uniq:
-            for bc in uniq:
-                db.session.execute(
-                    text(
-                        'INSERT OR REPLACE INTO "club_product_barcode"(club_id,product_id,barcode) VALUES (:c,:p,:b)'
-                    ),
-                    {"c": cid, "p": pid, "b": bc},
-                )
+            # штрих-код мог принадлежать другому товару клуба — перепривязываем
+            db.session.execute(
+                upsert(
+                    "club_product_barcode",
+                    ("club_id", "product_id", "barcode", "purchase_price"),
+                    ("club_id", "barcode"),
+                    ("product_id", "purchase_price"),
+                ),
+                [{"club_id": cid, "product_id": pid, "barcode": bc, "purchase_price": purchase} for bc in uniq],
+            )
         else:
             _ensure_placeholder_mapping(cid, pid, purchase)
         db.session.commit()
@@ -255,156 +235,37 @@ def debts_products():
         if not cid or not f:
             flash("Выберите клуб и файл .xlsx/.csv", "warning")
             return redirect(url_for("admin.debts_products", club_id=cid))
-        filename = (getattr(f, "filename", "") or "").lower()
-        content = f.read()
-
-        rows: list[dict] = []
-        if filename.endswith(".xlsx"):
-            try:
-                import openpyxl
-
-                wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
-                ws = wb.active
-                it = ws.iter_rows(values_only=True)
-                try:
-                    next(it)  # skip title row
-                except Exception:
-                    pass
-                headers = list(next(it, []) or [])
-
-                def norm(h: object) -> str:
-                    return str(h or "").strip().lower().replace("\n", " ")
-
-                idx = {norm(headers[i]): i for i in range(len(headers))}
-                name_i = idx.get("название") or idx.get("наименование") or idx.get("name")
-                price_i = idx.get("цена закупки") or idx.get("purchase_price") or idx.get("закупка")
-                art_i = (
-                    idx.get("артикулы")
-                    or idx.get("штрихкод")
-                    or idx.get("штрих-код")
-                    or idx.get("barcode")
-                )
-                cat_i = idx.get("категория") or idx.get("category")
-                for r in it:
-                    if not r:
-                        continue
-                    cat = (
-                        str(r[cat_i]).strip()
-                        if cat_i is not None and cat_i < len(r) and r[cat_i] is not None
-                        else ""
-                    )
-                    if cat == "-":
-                        continue
-                    name = (
-                        str(r[name_i]).strip()
-                        if name_i is not None and name_i < len(r) and r[name_i] is not None
-                        else ""
-                    )
-                    price_raw = (
-                        str(r[price_i]).strip()
-                        if price_i is not None and price_i < len(r) and r[price_i] is not None
-                        else "0"
-                    )
-                    arts_raw = r[art_i] if art_i is not None and art_i < len(r) else ""
-                    rows.append(
-                        {"name": name, "purchase_price": price_raw, "barcode": arts_raw}
-                    )
-            except Exception as e:
-                flash(f"Не удалось прочитать XLSX: {e}", "danger")
-                return redirect(url_for("admin.debts_products", club_id=cid))
-        else:
-            # CSV: try utf-8-sig first, then cp1251, then lenient utf-8
-            text_data: str
-            try:
-                text_data = content.decode("utf-8-sig")
-            except Exception:
-                try:
-                    text_data = content.decode("cp1251")
-                except Exception:
-                    text_data = content.decode(errors="ignore")
-
-            reader = csv.DictReader(io.StringIO(text_data), delimiter=";")
-            if not reader.fieldnames:
-                reader = csv.DictReader(io.StringIO(text_data))
-            rows.extend(list(reader))
-
-        new_products = linked = updated_links = skipped = 0
-        for row in rows:
-            # Normalize keys coming from CSV to be robust
-            rnorm = {str(k or "").strip().lower(): v for k, v in dict(row).items()}
-            name = (
-                (rnorm.get("name") or rnorm.get("название") or rnorm.get("наименование") or "").strip()
-            )
-            barcode_cell = rnorm.get("barcode") or rnorm.get("артикулы") or rnorm.get("штрихкод") or rnorm.get("штрих-код") or ""
-            price_raw = (
-                rnorm.get("purchase_price")
-                or rnorm.get("цена закупки")
-                or rnorm.get("закупка")
-                or "0"
-            )
-            try:
-                purchase = float(str(price_raw).replace(",", "."))
-            except Exception:
-                purchase = 0.0
-
-
-            barcodes = _parse_barcodes(barcode_cell)
-            if not name:
-                skipped += 1
-                continue
-            p = Product.query.filter_by(name=name).first()
-            if not p:
-                p = Product(name=name, purchase_price=purchase, sell_price=0, is_active=True)  # type: ignore[arg-type]
-                db.session.add(p)
-                db.session.flush()
-                new_products += 1
-            if barcodes:
-                _remove_placeholder_mapping(cid, p.id)
-                for bc in barcodes:
-                    mp = ClubProductBarcode.query.filter_by(club_id=cid, barcode=bc).first()
-                    if not mp:
-                        db.session.add(
-                            ClubProductBarcode(
-                                club_id=cid, product_id=p.id, barcode=bc, purchase_price=purchase
-                            )
-                        )
-                        linked += 1
-                    else:
-                        if mp.product_id != p.id:
-                            mp.product_id = p.id
-                            updated_links += 1
-                        try:
-                            if purchase:
-                                mp.purchase_price = purchase
-                        except Exception:
-                            pass
-            else:
-                existing_map = ClubProductBarcode.query.filter_by(club_id=cid, product_id=p.id).first()
-                if existing_map is None:
-                    _ensure_placeholder_mapping(cid, p.id, purchase)
-                    linked += 1
-                elif purchase:
-                    try:
-                        db.session.execute(
-                            text('UPDATE "club_product_barcode" SET purchase_price=:price WHERE club_id=:c AND product_id=:p'),
-                            {"price": purchase, "c": cid, "p": p.id},
-                        )
-                    except Exception:
-                        pass
-        db.session.commit()
+        # обработка — фоновой задачей, страница опрашивает её по ?job=<id>
+        path = save_upload(f)
+        job_id = submit(
+            "product_import", run_import, cid, path, f.filename,
+            club_id=cid, user_id=current_user.id, upload=path,
+        )
+        return redirect(url_for("admin.debts_products", club_id=cid, job=job_id))
+
+    job = get_job(request.args.get("job"), current_user) if request.args.get("job") else None
+    if job and job.status == "failed":
+        flash(job.error or "Импорт не выполнен.", "danger")
+    elif job and job.status == "done":
+        res = job.result_data
+        received = f", оприходовано {res['received']} шт." if res.get("received") else "."
+        if res.get("repeated"):
+            received += f" Приход из этого файла уже проведён, {res['repeated']} шт. повторно не оприходовано."
         flash(
-            f"Импорт завершён: товаров создано {new_products}, связей добавлено {linked}, обновлено {updated_links}, пропущено {skipped}.",
+            f"Импорт завершён: товаров создано {res.get('created', 0)}, связей добавлено {res.get('linked', 0)}, "
+            f"обновлено {res.get('updated', 0)}, пропущено {res.get('skipped', 0)}{received}",
             "primary",
         )
 
     ensure_club_barcode_price_column()
+    barcodes_sql = string_agg("CASE WHEN cb.barcode LIKE :placeholder THEN NULL ELSE cb.barcode END")
     q = (
         db.session.execute(
             text(
-                """
+                f"""
         SELECT p.id, p.name,
                COALESCE(MAX(cb.purchase_price), COALESCE(p.purchase_price,0)) AS purchase_price,
-               GROUP_CONCAT(CASE WHEN cb.barcode LIKE :placeholder THEN NULL ELSE cb.barcode END, ', ') AS barcodes
+               {barcodes_sql} AS barcodes
         FROM club_product_barcode cb
         JOIN product p ON p.id = cb.product_id
         WHERE cb.club_id = :c
@@ -418,6 +279,6 @@ def debts_products():
         else []
     )
     return render_template(
-        "admin/debts_products.html", clubs=clubs, club_id=cid, items=q, edit_id=edit_id
+        "admin/debts_products.html", clubs=clubs, club_id=cid, items=q, edit_id=edit_id, job=job
     )
 
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Импорт товаров клуба (номенклатура + штрих-коды + закупочные цены).
+
+Вместо запросов на каждую строку/штрих-код:
+  1) словари name→product и barcode→привязка клуба грузятся одним запросом каждый;
+  2) строки файла проигрываются по этим словарям в памяти — с той же логикой,
+     что и построчный импорт (новые товары, привязка/перепривязка кодов,
+     заглушки для товаров без кода);
+  3) разница применяется executemany после каждой пачки строк (файл целиком
+     в памяти не держится), всё — в одной транзакции.
+
+Строки приходят пачками из import_reader.read_batches (ключи IMPORT_FIELDS);
+из загрузки на странице импорт идёт фоновой задачей run_import (app/jobs.py).
+Если в файле есть колонка «Приход», количество оприходуется в складской журнал —
+один раз на файл: повторная загрузка того же файла (stock_receipt) прихода не проводит.
+"""
+from __future__ import annotations
+
+import hashlib
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import bindparam, text
+
+from ..extensions import db
+from ..import_reader import parse_barcodes, read_batches
+from ..sqlcompat import insert_ignore
+from ..stock_ledger import apply_moves
+
+PLACEHOLDER_PREFIX = "__AUTO_EMPTY_BARCODE__"
+
+# колонки файла, которые читает импорт (синонимы заголовков — import_reader.FIELD_ALIASES)
+IMPORT_FIELDS = ("name", "purchase_price", "barcode", "category", "purchase_qty")
+
+
+def placeholder_barcode(product_id: int) -> str:
+    return f"{PLACEHOLDER_PREFIX}{int(product_id)}"
+
+
+def _price(raw) -> float:
+    try:
+        return float(str(raw if raw is not None else "0").replace(",", "."))
+    except Exception:
+        return 0.0
+
+
+def normalize_row(row: dict) -> tuple[str, float, list[str]]:
+    """(название, закупочная цена, штрих-коды) из строки import_reader."""
+    name = str(row.get("name") or "").strip()
+    return name, _price(row.get("purchase_price") or "0"), parse_barcodes(row.get("barcode"))
+
+
+@dataclass
+class ImportResult:
+    created: int = 0   # товаров создано
+    linked: int = 0    # связей добавлено
+    updated: int = 0   # связей перепривязано
+    skipped: int = 0   # строк без названия
+    received: int = 0  # штук оприходовано (колонка «Приход»)
+    repeated: int = 0  # штук не оприходовано: приход из этого файла уже проведён
+
+
+def _product_ids(names: Iterable[str] | None = None) -> dict[str, int]:
+    """name -> id всех товаров (или только товаров с названиями names)."""
+    # при дублях названия — самый ранний товар (как .filter_by(name=...).first())
+    stmt, params = text('SELECT id, name FROM "product" ORDER BY id'), {}
+    if names is not None:
+        stmt = text('SELECT id, name FROM "product" WHERE name IN :names ORDER BY id').bindparams(
+            bindparam("names", expanding=True))
+        params = {"names": list(names)}
+    ids: dict[str, int] = {}
+    for pid, name in db.session.execute(stmt, params).all():
+        ids.setdefault(name, int(pid))
+    return ids
+
+
+def _claim_receipt(club_id: int, digest: str, filename: str, job_id: int | None, qty: int) -> bool:
+    """Записать приход файла digest; False — такой файл уже оприходован в этом клубе."""
+    stmt = insert_ignore("stock_receipt", ("club_id", "digest", "filename", "job_id", "qty", "created_at"),
+                         ("club_id", "digest"))
+    return db.session.execute(stmt, {"club_id": club_id, "digest": digest, "filename": filename[:255],
+                                     "job_id": job_id, "qty": qty, "created_at": datetime.utcnow()}).rowcount > 0
+
+
+def import_products(club_id: int, batches: Iterable[list[dict]], digest: str | None = None,
+                    filename: str = "", job_id: int | None = None) -> ImportResult:
+    """
+    Импортировать пачки строк в номенклатуру клуба club_id. Коммитит транзакцию.
+    digest — отпечаток файла: приход по нему проводится один раз (None — без проверки).
+    Каждая пачка применяется сразу (executemany), в памяти — только текущая пачка
+    строк и привязки клуба.
+    """
+    res = ImportResult()
+    ids = _product_ids()
+
+    # текущие привязки клуба: barcode -> [product_id, price]; before — то, что уже записано в БД
+    before = {
+        str(bc): (int(pid), float(pp or 0))
+        for bc, pid, pp in db.session.execute(
+            text('SELECT barcode, product_id, purchase_price FROM "club_product_barcode" WHERE club_id=:c'),
+            {"c": club_id},
+        ).all()
+    }
+    state = {bc: list(v) for bc, v in before.items()}
+    by_pid: dict[int, set[str]] = {}
+    for bc, (pid, _pp) in before.items():
+        by_pid.setdefault(pid, set()).add(bc)
+    dirty: set[str] = set()  # коды, изменённые с последней записи
+    received: dict[int, int] = {}
+
+    def bind(bc: str, pid: int) -> None:
+        old = state.get(bc)
+        if old is not None:
+            by_pid.get(old[0], set()).discard(bc)
+        by_pid.setdefault(pid, set()).add(bc)
+        dirty.add(bc)
+
+    for batch in batches:
+        parsed: list[tuple[str, float, list[str], int]] = []
+        for row in batch:
+            # категория «-» в выгрузке веб-админки — удалённые товары
+            if str(row.get("category") or "").strip() == "-":
+                continue
+            name, purchase, codes = normalize_row(row)
+            if not name:
+                res.skipped += 1
+                continue
+            parsed.append((name, purchase, codes, int(_price(row.get("purchase_qty") or "0"))))
+
+        # 1) новые товары — одним executemany на пачку, цена — из первой строки с этим названием
+        new: dict[str, float] = {}
+        for name, purchase, _codes, _qty in parsed:
+            if name not in ids and name not in new:
+                new[name] = purchase
+        if new:
+            db.session.execute(
+                text('INSERT INTO "product"(name, purchase_price, sell_price, is_active) VALUES (:name, :price, 0, :active)'),
+                [{"name": n, "price": p, "active": True} for n, p in new.items()],
+            )
+            ids.update(_product_ids(new))
+            res.created += len(new)
+
+        # 2) строки пачки проигрываются по привязкам в памяти
+        for name, purchase, codes, qty in parsed:
+            pid = ids[name]
+            if qty > 0:
+                received[pid] = received.get(pid, 0) + qty
+            if codes:
+                ph = placeholder_barcode(pid)
+                if ph in state and state[ph][0] == pid:
+                    by_pid[pid].discard(ph)
+                    del state[ph]
+                    dirty.add(ph)
+                for bc in codes:
+                    cur = state.get(bc)
+                    if cur is None:
+                        bind(bc, pid)
+                        state[bc] = [pid, purchase]
+                        res.linked += 1
+                        continue
+                    if cur[0] != pid:
+                        bind(bc, pid)
+                        cur[0] = pid
+                        res.updated += 1
+                    if purchase:
+                        cur[1] = purchase
+                        dirty.add(bc)
+            elif not by_pid.get(pid):
+                ph = placeholder_barcode(pid)
+                bind(ph, pid)
+                state[ph] = [pid, purchase]
+                res.linked += 1
+            elif purchase:
+                for bc in by_pid[pid]:
+                    state[bc][1] = purchase
+                    dirty.add(bc)
+
+        # 3) разница пачки -> executemany
+        _write_barcodes(club_id, before, state, dirty)
+
+    if received:
+        total = sum(received.values())
+        if digest is None or _claim_receipt(club_id, digest, filename, job_id, total):
+            apply_moves(club_id, received.items(), "purchase")
+            res.received = total
+        else:
+            res.repeated = total
+    db.session.commit()
+    return res
+
+
+def _write_barcodes(club_id: int, before: dict, state: dict, dirty: set[str]) -> None:
+    """Записать изменённые привязки dirty (state против before) и отметить их записанными."""
+    deletes, updates, inserts = [], [], []
+    for bc in dirty:
+        old, cur = before.get(bc), state.get(bc)
+        if cur is None:
+            if old is not None:
+                deletes.append({"c": club_id, "b": bc})
+                del before[bc]
+            continue
+        pid, pp = cur
+        if old is None:
+            inserts.append({"c": club_id, "p": pid, "b": bc, "price": pp})
+        elif old != (pid, pp):
+            updates.append({"c": club_id, "p": pid, "b": bc, "price": pp})
+        before[bc] = (pid, pp)
+    dirty.clear()
+    if deletes:
+        db.session.execute(text('DELETE FROM "club_product_barcode" WHERE club_id=:c AND barcode=:b'), deletes)
+    if updates:
+        db.session.execute(
+            text('UPDATE "club_product_barcode" SET product_id=:p, purchase_price=:price WHERE club_id=:c AND barcode=:b'),
+            updates,
+        )
+    if inserts:
+        db.session.execute(
+            text('INSERT INTO "club_product_barcode"(club_id, product_id, barcode, purchase_price) VALUES (:c, :p, :b, :price)'),
+            inserts,
+        )
+
+
+def run_import(job, club_id: int, path: str, filename: str) -> dict:
+    """Фоновая задача: импорт сохранённого файла в номенклатуру клуба."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 16), b""):
+            digest.update(chunk)
+        fh.seek(0)
+        res = import_products(club_id, job.track(read_batches(fh, filename, IMPORT_FIELDS)),
+                              digest=digest.hexdigest(), filename=filename or "", job_id=job.id)
+    return asdict(res)
@@ -2,15 +2,18 @@
 from __future__ import annotations
 
 from typing import Optional
-from flask import Blueprint, render_template, request, redirect, url_for, flash, abort
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, jsonify
 from flask_login import login_required, current_user
 from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash
 
 from .extensions import db
+from . import schema
+from .sqlcompat import insert_ignore, table_columns
 from .models.user import User
 from .models.club import Club
-from .acl import _ensure_user_club_table
+from .acl import _ensure_user_club_table, bump_membership_version, membership_cache_stats
 
 bp = Blueprint("admin_mgmt", __name__)
 
@@ -20,12 +23,29 @@ def _sa_only():
         abort(403)
 
 # ---------- helpers ----------
+# Колонки таблицы user и SQL-выражение ФИО вычисляются один раз на процесс;
+# schema.refresh() (старт приложения, миграции) сбрасывает кэш.
+_fio_expr_cache: dict[str, str] = {}
+
+@schema.on_refresh
+def _reset_user_columns_cache() -> None:
+    _fio_expr_cache.clear()
+
 def _user_columns() -> set[str]:
-    rows = db.session.execute(text('PRAGMA table_info("user")')).mappings().all()
-    return {r["name"] for r in rows}
+    cols = schema.columns("user")
+    if cols is not None:
+        return cols
+    cols = table_columns("user")
+    schema.mark("user", cols)
+    return cols
 
 def _fio_sql_expr_dynamic() -> str:
-    cols = _user_columns()
+    expr = _fio_expr_cache.get("u")
+    if expr is None:
+        expr = _fio_expr_cache["u"] = _build_fio_sql_expr(_user_columns())
+    return expr
+
+def _build_fio_sql_expr(cols: set[str]) -> str:
     if "full_name" in cols:
         return "COALESCE(u.full_name,'')"
     if "first_name" in cols or "last_name" in cols:
@@ -62,7 +82,7 @@ def _set_fio(u: User, fio: str) -> None:
 
 def _find_user_by_login(login: str) -> Optional[dict]:
     row = db.session.execute(
-        text('SELECT id, username, COALESCE(role,"user") AS role FROM "user" WHERE username=:u'),
+        text('SELECT id, username, COALESCE(role,\'user\') AS role FROM "user" WHERE username=:u'),
         {"u": (login or "").strip()},
     ).mappings().first()
     return dict(row) if row else None
@@ -71,6 +91,13 @@ def _already_member(user_id: int, club_id: int) -> bool:
     sql = 'SELECT 1 FROM "user_club" WHERE user_id=:u AND club_id=:c'
     return db.session.execute(text(sql), {"u": user_id, "c": club_id}).first() is not None
 
+# ---------- acl cache ----------
+@bp.get("/admin/acl-cache")
+@login_required
+def acl_cache():
+    _sa_only()
+    return jsonify(membership_cache_stats())
+
 # ---------- timezones ----------
 TZ_RU = [
     {"id":"Europe/Moscow","label":"Европа / Москва (UTC+3)"},
@@ -146,11 +173,18 @@ def clubs():
                 db.session.execute(text('DELETE FROM "user_club" WHERE club_id=:c'), {"c": cid})
                 c = db.session.get(Club, cid)
                 if c: db.session.delete(c)
-                db.session.commit(); flash("Клуб удалён","primary")
+                try:
+                    db.session.commit(); flash("Клуб удалён","primary")
+                except IntegrityError:
+                    # SQLITE_FOREIGN_KEYS=1: на клуб ссылаются смены, долги, товары и т.п.
+                    db.session.rollback()
+                    flash("Есть данные. Снимите активность вместо удаления.","warning")
+        # название/активность клуба входят в закэшированные членства
+        bump_membership_version()
         return redirect(url_for("admin_mgmt.clubs"))
 
     clubs = db.session.execute(
-        text('SELECT id,name,timezone,COALESCE(is_active,1) AS is_active FROM "club" ORDER BY name')
+        text('SELECT id,name,timezone,COALESCE(is_active,TRUE) AS is_active FROM "club" ORDER BY name')
     ).mappings().all()
     return render_template("admin/clubs.html", clubs=clubs, tz_opts=TZ_RU)
 
@@ -176,10 +210,11 @@ def users():
             _set_password(u, password); _set_fio(u, fio)
             db.session.add(u); db.session.commit()
             db.session.execute(
-                text('INSERT OR IGNORE INTO "user_club"(user_id,club_id,role) VALUES (:u,:c,:r)'),
-                {"u":u.id,"c":int(club_id),"r":club_role}
+                insert_ignore("user_club", ("user_id", "club_id", "role"), ("user_id", "club_id")),
+                {"user_id":u.id,"club_id":int(club_id),"role":club_role}
             )
-            db.session.commit(); flash("Пользователь создан","primary")
+            db.session.commit(); bump_membership_version()
+            flash("Пользователь создан","primary")
             return redirect(url_for("admin_mgmt.users"))
 
         if op == "create_superadmin":
@@ -207,7 +242,8 @@ def users():
             if new_username: setattr(u,"username",new_username)
             _set_fio(u, new_fio)
             if new_pass: _set_password(u, new_pass)
-            db.session.commit(); flash("Пользователь обновлён","primary")
+            db.session.commit(); bump_membership_version()
+            flash("Пользователь обновлён","primary")
             return redirect(url_for("admin_mgmt.users"))
 
         if op == "delete_user":
@@ -224,7 +260,14 @@ def users():
                 flash("Пользователь не найден","warning")
             else:
                 db.session.delete(u)
-            db.session.commit()
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # SQLITE_FOREIGN_KEYS=1: на пользователя ссылаются смены, долги и т.п.
+                db.session.rollback()
+                flash("Нельзя удалить: есть связанные данные (смены, долги).","warning")
+                return redirect(url_for("admin_mgmt.users"))
+            bump_membership_version()
             flash("Пользователь удалён","primary")
             return redirect(url_for("admin_mgmt.users"))
 
@@ -232,7 +275,7 @@ def users():
 
     fio_expr = _fio_sql_expr_dynamic()
     users = db.session.execute(
-        text(f'SELECT u.id, u.username, COALESCE(u.role,"user") AS role, {fio_expr} AS fio FROM "user" u ORDER BY u.id')
+        text(f'SELECT u.id, u.username, COALESCE(u.role,\'user\') AS role, {fio_expr} AS fio FROM "user" u ORDER BY u.id')
     ).mappings().all()
 
     memberships = db.session.execute(text("""
@@ -247,7 +290,7 @@ def users():
         per_user.setdefault(r["user_id"], []).append({"club": club_name, "role": r["role"]})
 
     clubs = db.session.execute(
-        text('SELECT id,name FROM "club" WHERE COALESCE(is_active,1)=1 ORDER BY name')
+        text('SELECT id,name FROM "club" WHERE COALESCE(is_active,TRUE) ORDER BY name')
     ).mappings().all()
     return render_template("admin/users.html", users=users, clubs=clubs, per_user=per_user)
 
@@ -268,7 +311,8 @@ def memberships():
         if op == "del_member":
             mid = int(request.form.get("id") or 0)
             db.session.execute(text('DELETE FROM "user_club" WHERE id=:id'), {"id": mid})
-            db.session.commit(); flash("Доступ удалён","primary")
+            db.session.commit(); bump_membership_version()
+            flash("Доступ удалён","primary")
             return redirect(url_for("admin_mgmt.memberships"))
 
         if op in ("add_owner", "add_admin"):
@@ -282,7 +326,7 @@ def memberships():
             if uid:
                 try:
                     user = db.session.execute(
-                        text('SELECT id, username, COALESCE(role,"user") AS role FROM "user" WHERE id=:id'),
+                        text('SELECT id, username, COALESCE(role,\'user\') AS role FROM "user" WHERE id=:id'),
                         {"id": int(uid)}
                     ).mappings().first()
                 except Exception:
@@ -315,17 +359,18 @@ def memberships():
                 return redirect(url_for("admin_mgmt.memberships"))
 
             db.session.execute(
-                text('INSERT OR IGNORE INTO "user_club"(user_id,club_id,role) VALUES (:u,:c,:r)'),
-                {"u": user["id"], "c": cid, "r": role},
+                insert_ignore("user_club", ("user_id", "club_id", "role"), ("user_id", "club_id")),
+                {"user_id": user["id"], "club_id": cid, "role": role},
             )
-            db.session.commit(); flash("Доступ выдан","primary")
+            db.session.commit(); bump_membership_version()
+            flash("Доступ выдан","primary")
             return redirect(url_for("admin_mgmt.memberships"))
 
         return redirect(url_for("admin_mgmt.memberships"))
 
     # GET
     clubs = db.session.execute(
-        text('SELECT id,name FROM "club" WHERE COALESCE(is_active,1)=1 ORDER BY name')
+        text('SELECT id,name FROM "club" WHERE COALESCE(is_active,TRUE) ORDER BY name')
     ).mappings().all()
     fio_expr = _fio_sql_expr_dynamic()
 
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Свёртка отчётов кассира по месяцам (таблица cashier_month_summary).
+
+Итоги месяца и тренды по месяцам читаются из свёртки, а не пересчитываются по
+сырым отчётам. Строка свёртки обновляется в той же транзакции, что и отчёт:
+refresh_month() пересчитывает только затронутый клуб-месяц (≤ 62 отчёта по индексу).
+
+Полный пересчёт (после ручных правок в БД или импорта):
+  flask rebuild-cashier-summary [--club-id N]
+"""
+from __future__ import annotations
+
+from datetime import date
+from typing import Iterable
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+from .extensions import db
+from .sqlcompat import upsert
+from .models.report import CashierMonthSummary
+
+SUM_COLS = (
+    "bar", "cash", "extended", "sbp_acq", "sbp_cls", "acquiring",
+    "acquiring_fee", "refund_cash", "refund_noncash", "encashment",
+)
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def next_month(d: date) -> date:
+    return date(d.year + (1 if d.month == 12 else 0), 1 if d.month == 12 else d.month + 1, 1)
+
+
+def _to_date(x) -> date:
+    if isinstance(x, date):
+        return x
+    y, m, d = map(int, str(x)[:10].split("-"))
+    return date(y, m, d)
+
+
+# по дням -> по месяцу: суммы колонок и полные сутки (есть и день, и ночь)
+_DAY_SUMS = ", ".join(f"SUM(COALESCE({c},0)) AS {c}" for c in SUM_COLS)
+_MONTH_SUMS = ", ".join(f"COALESCE(SUM({c}),0) AS {c}" for c in SUM_COLS)
+_MONTH_SQL = f'''
+    SELECT COALESCE(SUM(n),0) AS reports,
+           COALESCE(SUM(CASE WHEN has_day=1 AND has_night=1 THEN 1 ELSE 0 END),0) AS full_days,
+           COALESCE(SUM(CASE WHEN has_day=1 AND has_night=1 THEN cash + extended ELSE 0 END),0) AS full_days_z,
+           {_MONTH_SUMS}
+    FROM (
+        SELECT shift_date, COUNT(*) AS n, {_DAY_SUMS},
+               MAX(CASE WHEN shift_type=\'day\' THEN 1 ELSE 0 END) AS has_day,
+               MAX(CASE WHEN shift_type=\'night\' THEN 1 ELSE 0 END) AS has_night
+        FROM "cashier_report"
+        WHERE club_id=:c AND shift_date>=:d1 AND shift_date<:d2
+        GROUP BY shift_date
+    ) t
+'''
+
+_COLS = ("club_id", "month", "reports", "full_days", "full_days_z", *SUM_COLS)
+
+
+def refresh_month(club_id: int, day) -> None:
+    """Пересчитать строку свёртки клуба за месяц, в который попадает day (без commit)."""
+    try:
+        start = month_start(_to_date(day))
+    except (TypeError, ValueError):
+        return
+    row = db.session.execute(
+        text(_MONTH_SQL),
+        {"c": int(club_id), "d1": start.isoformat(), "d2": next_month(start).isoformat()},
+    ).mappings().first()
+
+    if not row or not row["reports"]:
+        db.session.execute(
+            text('DELETE FROM "cashier_month_summary" WHERE club_id=:c AND month=:m'),
+            {"c": int(club_id), "m": start.isoformat()},
+        )
+        return
+
+    params = {k: row[k] for k in _COLS[2:]}
+    params.update(club_id=int(club_id), month=start.isoformat())
+    db.session.execute(upsert("cashier_month_summary", _COLS, ("club_id", "month"), _COLS[2:]), params)
+
+
+def rebuild(club_id: int | None = None) -> int:
+    """Пересобрать свёртку целиком (или по одному клубу). Возвращает число клуб-месяцев."""
+    where = "WHERE club_id=:c" if club_id else ""
+    params = {"c": club_id} if club_id else {}
+    db.session.execute(text(f'DELETE FROM "cashier_month_summary" {where}'), params)
+
+    spans = db.session.execute(
+        text(f'SELECT club_id, MIN(shift_date), MAX(shift_date) FROM "cashier_report" {where} GROUP BY club_id'),
+        params,
+    ).all()
+    n = 0
+    for cid, first, last in spans:
+        m, last_m = month_start(_to_date(first)), month_start(_to_date(last))
+        while m <= last_m:
+            refresh_month(cid, m)
+            m = next_month(m)
+            n += 1
+    db.session.commit()
+    return n
+
+
+def month_summaries(club_ids: Iterable[int], start: date, end: date) -> list[CashierMonthSummary]:
+    """Строки свёртки клубов за месяцы [start, end), по месяцу и клубу."""
+    ids = [int(c) for c in club_ids]
+    if not ids:
+        return []
+    return (
+        CashierMonthSummary.query
+        .filter(
+            CashierMonthSummary.club_id.in_(ids),
+            CashierMonthSummary.month >= month_start(start),
+            CashierMonthSummary.month < end,
+        )
+        .order_by(CashierMonthSummary.month.asc(), CashierMonthSummary.club_id.asc())
+        .all()
+    )
+
+
+@click.command("rebuild-cashier-summary")
+@click.option("--club-id", type=int, default=None, help="Только этот клуб.")
+@with_appcontext
+def rebuild_cashier_summary_command(club_id: int | None) -> None:
+    """Пересобрать cashier_month_summary из cashier_report."""
+    n = rebuild(club_id)
+    click.echo(f"Пересчитано клуб-месяцев: {n}")
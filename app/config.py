@@ -1,4 +1,3 @@
-
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -11,10 +10,118 @@ INSTANCE_DIR.mkdir(parents=True, exist_ok=True)
 def _default_sqlite_uri():
     return f"sqlite:///{(INSTANCE_DIR / 'colizeum.db').as_posix()}"
 
+def _database_uri():
+    uri = os.getenv("DATABASE_URL") or _default_sqlite_uri()
+    # postgres:// (Heroku и т.п.) SQLAlchemy 2 не понимает
+    if uri.startswith("postgres://"):
+        uri = "postgresql://" + uri[len("postgres://"):]
+    return uri
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = (os.getenv(name) or "").strip().lower()
+    if not raw:
+        return default
+    return raw in ("1", "true", "yes", "on")
+
+def _engine_options(uri: str) -> dict:
+    """
+    Параметры движка/пула по бэкенду; любое значение переопределяется через env:
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS, DB_CONNECT_TIMEOUT.
+    """
+    if uri.startswith("sqlite"):
+        if uri in ("sqlite://", "sqlite:///:memory:"):
+            return {}  # БД в памяти: у SQLAlchemy свой пул без настроек
+        # файл один, писатель один: большой пул бесполезен, ожидание блокировки
+        # задаётся PRAGMA busy_timeout (см. SQLITE_PROFILES)
+        return {
+            "pool_size": _env_int("DB_POOL_SIZE", 5),
+            "max_overflow": _env_int("DB_MAX_OVERFLOW", 10),
+            "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+            "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", False),
+        }
+
+    opts = {
+        "pool_size": _env_int("DB_POOL_SIZE", 5),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 10),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        # серверы и балансировщики рвут простаивающие соединения
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+    }
+    stmt_ms = _env_int("DB_STATEMENT_TIMEOUT_MS", 30000)
+    connect_timeout = _env_int("DB_CONNECT_TIMEOUT", 10)
+    if uri.startswith("postgresql"):
+        connect_args = {"connect_timeout": connect_timeout}
+        if stmt_ms > 0:
+            connect_args["options"] = f"-c statement_timeout={stmt_ms}"
+        opts["connect_args"] = connect_args
+    elif uri.startswith("mysql"):
+        opts["connect_args"] = {"connect_timeout": connect_timeout}
+    return opts
+
+# Профили PRAGMA для SQLite: применяются к каждому новому соединению пула
+# (см. app/engine.py). Выбор — SQLITE_PROFILE, точечные правки — SQLITE_PRAGMAS
+# в виде "busy_timeout=10000,mmap_size=0". Профили — только производительность;
+# проверка внешних ключей меняет поведение удаления и включается отдельно
+# (SQLITE_FOREIGN_KEYS=1).
+SQLITE_PROFILES = {
+    "off": {},
+    "safe": {
+        "busy_timeout": 5000,
+    },
+    "production": {
+        "journal_mode": "WAL",       # читатели не блокируют запись кассира
+        "synchronous": "NORMAL",     # в режиме WAL безопасно и заметно быстрее FULL
+        "busy_timeout": 5000,        # мс ожидания блокировки вместо "database is locked"
+        "cache_size": -20000,        # ~20 МБ страничного кэша на соединение
+        "mmap_size": 268435456,      # 256 МБ
+        "temp_store": "MEMORY",
+    },
+}
+
+def _parse_pragmas(raw: str) -> dict:
+    out = {}
+    for part in (raw or "").split(","):
+        if "=" not in part:
+            continue
+        k, v = part.split("=", 1)
+        if k.strip():
+            out[k.strip().lower()] = v.strip()
+    return out
+
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret")
-    SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL") or _default_sqlite_uri()
+    SQLALCHEMY_DATABASE_URI = _database_uri()
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # проверка схемы (реестр таблиц/колонок) один раз при старте процесса (0 — выключить)
+    SCHEMA_BOOTSTRAP = os.getenv("SCHEMA_BOOTSTRAP", "1") != "0"
+    # кэш членств пользователей в клубах (секунды / кол-во пользователей); 0 — выключен.
+    # Между воркерами сбрасывается по instance/acl.version; TTL — страховка от правок в обход приложения
+    ACL_CACHE_TTL = int(os.getenv("ACL_CACHE_TTL", "30"))
+    ACL_CACHE_SIZE = int(os.getenv("ACL_CACHE_SIZE", "1024"))
+    # кэш сводки по клубам на главной (секунды); 0 — выключен
+    DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "60"))
+    # потоки фоновых задач (импорт файлов); 0 — выполнять сразу в запросе
+    JOB_WORKERS = _env_int("JOB_WORKERS", 2)
+    # задача без обновлений дольше стольких минут при старте считается прерванной; 0 — не проверять
+    JOB_STALE_MINUTES = _env_int("JOB_STALE_MINUTES", 30)
+    # снимок складского журнала ставится на столько секунд раньше текущего момента:
+    # дольше этого транзакции запросов с движениями не живут. Фоновые задачи (импорт)
+    # могут идти дольше — для них снимок клуба не позже старта running-задачи
+    # (см. app/stock_ledger.py)
+    STOCK_CHECKPOINT_LAG = _env_int("STOCK_CHECKPOINT_LAG", 300)
+    # SQLite: профиль PRAGMA (off|safe|production) и точечные переопределения
+    SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+    SQLITE_PRAGMAS = _parse_pragmas(os.getenv("SQLITE_PRAGMAS", ""))
+    SQLITE_FOREIGN_KEYS = _env_bool("SQLITE_FOREIGN_KEYS", False)
 
 def ensure_instance(app):
     # Flask instance path
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Сводка по клубам для главной страницы: выручка с начала месяца, открытые долги
+и недостача по текущей инвентаризации.
+
+Каждая метрика — один сгруппированный по club_id запрос сразу по всем клубам
+пользователя (а не цикл по клубам). Результат кэшируется в процессе на
+DASHBOARD_CACHE_TTL секунд по набору клубов и месяцу.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, Iterable, List
+
+from flask import current_app
+from sqlalchemy import bindparam, text
+
+from .extensions import db
+from .query_advisor import hot_query
+
+_CACHE_MAX = 256
+_cache_lock = threading.Lock()
+_cache: Dict[tuple, tuple[float, Dict[int, Dict[str, float]]]] = {}
+
+
+def _by_clubs(name: str, sql: str, **params):
+    """Запрос по списку клубов (:ids раскрывается в IN (...)); регистрируется для explain-hot."""
+    return hot_query(name, text(sql).bindparams(bindparam("ids", expanding=True)), ids=[1], **params)
+
+
+def _grouped(stmt, ids: List[int], **params) -> Dict[int, Any]:
+    rows = db.session.execute(stmt, {"ids": ids, **params}).all()
+    return {int(r[0]): r[1:] for r in rows}
+
+
+# из свёртки cashier_month_summary: одна строка на клуб
+_REVENUE_SQL = _by_clubs("dashboard.revenue", '''
+        SELECT club_id, COALESCE(cash,0) + COALESCE(extended,0) AS z, COALESCE(bar,0) AS bar
+        FROM "cashier_month_summary"
+        WHERE club_id IN :ids AND month = :m
+''', m="2025-01-01")
+
+# долги по товарам (как на странице операций) + открытые денежные долги
+_DEBTS_SQL = _by_clubs("dashboard.debts", '''
+        SELECT club_id, COALESCE(SUM(amount),0) FROM (
+            SELECT club_id, price * qty AS amount
+            FROM "debt_transaction"
+            WHERE club_id IN :ids AND COALESCE(kind,\'normal\')=\'normal\'
+            UNION ALL
+            SELECT club_id, amount
+            FROM "admin_debt"
+            WHERE club_id IN :ids AND status = \'open\'
+        ) d
+        GROUP BY club_id
+''')
+
+# та же формула, что в inventory._reconcile: (ожидалось − посчитано − в долгах) × закупочная цена;
+# долги — с закрытия предыдущей сессии клуба
+_SHORTAGE_SQL = _by_clubs("dashboard.shortage", '''
+        SELECT s.club_id,
+               COALESCE(SUM((COALESCE(ic.expected_qty,0) - COALESCE(ic.counted_qty,0) - COALESCE(d.q,0))
+                            * COALESCE(cb.pp, p.purchase_price, 0)), 0)
+        FROM "inventory_session" s
+        JOIN "inventory_count" ic ON ic.session_id = s.id
+        JOIN "product" p ON p.id = ic.product_id
+        LEFT JOIN (
+            SELECT dt.club_id, dt.product_id, SUM(dt.qty) AS q
+            FROM "debt_transaction" dt
+            LEFT JOIN (
+                SELECT club_id, MAX(closed_at) AS since FROM "inventory_session"
+                WHERE club_id IN :ids GROUP BY club_id
+            ) w ON w.club_id = dt.club_id
+            WHERE dt.club_id IN :ids AND (w.since IS NULL OR dt.created_at >= w.since)
+            GROUP BY dt.club_id, dt.product_id
+        ) d ON d.club_id = s.club_id AND d.product_id = ic.product_id
+        LEFT JOIN (
+            SELECT club_id, product_id, MAX(purchase_price) AS pp
+            FROM "club_product_barcode" WHERE club_id IN :ids
+            GROUP BY club_id, product_id
+        ) cb ON cb.club_id = s.club_id AND cb.product_id = ic.product_id
+        WHERE s.id IN (
+            SELECT MAX(id) FROM "inventory_session"
+            WHERE club_id IN :ids AND closed_at IS NULL
+            GROUP BY club_id
+        )
+        GROUP BY s.club_id
+''')
+
+
+def _revenue(ids: List[int], month: date) -> Dict[int, Any]:
+    return _grouped(_REVENUE_SQL, ids, m=month.isoformat())
+
+
+def _debts(ids: List[int]) -> Dict[int, Any]:
+    return _grouped(_DEBTS_SQL, ids)
+
+
+def _shortage(ids: List[int]) -> Dict[int, Any]:
+    return _grouped(_SHORTAGE_SQL, ids)
+
+
+def _load(ids: List[int], month: date) -> Dict[int, Dict[str, float]]:
+    revenue, debts, shortage = _revenue(ids, month), _debts(ids), _shortage(ids)
+    out: Dict[int, Dict[str, float]] = {}
+    for cid in ids:
+        z, bar = revenue.get(cid, (0, 0))
+        out[cid] = {
+            "z_report": float(z or 0),
+            "bar": float(bar or 0),
+            "game_ps": float(z or 0) - float(bar or 0),
+            "debts": float((debts.get(cid) or (0,))[0] or 0),
+            "shortage": round(float((shortage.get(cid) or (0,))[0] or 0), 2),
+        }
+    return out
+
+
+def club_metrics(club_ids: Iterable[int], today: date | None = None) -> Dict[int, Dict[str, float]]:
+    """Метрики по клубам: {club_id: {z_report, bar, game_ps, debts, shortage}}."""
+    ids = sorted({int(c) for c in club_ids})
+    if not ids:
+        return {}
+    today = today or date.today()
+    month = date(today.year, today.month, 1)
+    ttl = float(current_app.config.get("DASHBOARD_CACHE_TTL", 0) or 0)
+    if ttl <= 0:
+        return _load(ids, month)
+
+    key = (tuple(ids), month)
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+
+    data = _load(ids, month)
+    with _cache_lock:
+        if len(_cache) >= _CACHE_MAX:
+            for k in [k for k, v in _cache.items() if v[0] <= now] or list(_cache)[: _CACHE_MAX // 2]:
+                _cache.pop(k, None)
+        _cache[key] = (now + ttl, data)
+    return data
+
+
+def totals(metrics: Dict[int, Dict[str, float]]) -> Dict[str, float]:
+    out = {"z_report": 0.0, "bar": 0.0, "game_ps": 0.0, "debts": 0.0, "shortage": 0.0}
+    for m in metrics.values():
+        for k in out:
+            out[k] += m.get(k, 0.0)
+    return out
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Настройка движка БД под нагрузку.
+
+Для SQLite на каждое новое соединение пула применяется профиль PRAGMA из
+конфигурации (WAL, busy_timeout и т.д.), а при старте в лог пишутся
+фактически действующие значения.
+"""
+from __future__ import annotations
+
+import logging
+import re
+
+from sqlalchemy import event
+
+from .config import SQLITE_PROFILES
+from .extensions import db
+
+log = logging.getLogger(__name__)
+
+_IDENT = re.compile(r"^[a-z_]+$")
+_VALUE = re.compile(r"^-?[A-Za-z0-9_]+$")
+
+
+def sqlite_pragmas(config) -> dict[str, str]:
+    """Итоговый набор PRAGMA: профиль + SQLITE_FOREIGN_KEYS + переопределения из SQLITE_PRAGMAS."""
+    name = (config.get("SQLITE_PROFILE") or "off").lower()
+    profile = SQLITE_PROFILES.get(name)
+    if profile is None:
+        log.warning("unknown SQLITE_PROFILE=%r, pragmas are not applied", name)
+        profile = {}
+    merged = {k: str(v) for k, v in profile.items()}
+    if config.get("SQLITE_FOREIGN_KEYS"):
+        merged["foreign_keys"] = "ON"
+    merged.update({k: str(v) for k, v in (config.get("SQLITE_PRAGMAS") or {}).items()})
+    for k, v in list(merged.items()):
+        if not _IDENT.match(k) or not _VALUE.match(v):
+            log.warning("ignoring malformed pragma %s=%s", k, v)
+            merged.pop(k)
+    return merged
+
+
+def _install_sqlite_pragmas(engine, pragmas: dict[str, str]) -> None:
+    @event.listens_for(engine, "connect")
+    def _apply(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        try:
+            # journal_mode первым: остальные настройки от него не зависят
+            for k, v in pragmas.items():
+                cur.execute(f"PRAGMA {k}={v}")
+        finally:
+            cur.close()
+
+
+def effective_pragmas(names) -> dict[str, object]:
+    with db.engine.connect() as conn:
+        return {k: conn.exec_driver_sql(f"PRAGMA {k}").scalar() for k in names}
+
+
+def init_engine(app) -> None:
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != "sqlite":
+            return
+        pragmas = sqlite_pragmas(app.config)
+        if not pragmas:
+            return
+        _install_sqlite_pragmas(engine, pragmas)
+        try:
+            eff = effective_pragmas(pragmas)
+        except Exception:
+            log.exception("failed to read back SQLite pragmas")
+            return
+        log.info(
+            "SQLite profile %s: %s",
+            app.config.get("SQLITE_PROFILE"),
+            ", ".join(f"{k}={v}" for k, v in eff.items()),
+        )
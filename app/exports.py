@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковые выгрузки отчётов кассира в CSV и XLSX.
+
+Строки читаются из БД батчами (yield_per) одним SELECT, ответ отдаётся
+генератором — память не растёт с периодом и числом клубов.
+XLSX собирается write-only книгой openpyxl во временный файл на диске
+и отдаётся кусками по XLSX_CHUNK байт.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import tempfile
+from datetime import date
+
+from flask import Response, stream_with_context
+from sqlalchemy import func
+
+from .extensions import db
+from .models import CashierReport, Club, User
+
+# строк на один yield_per-батч и на один кусок ответа при потоковой выгрузке
+EXPORT_BATCH = 500
+XLSX_CHUNK = 64 * 1024
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# колонки выгрузки отчётов кассира: (заголовок, поле строки cashier_export_query)
+CASHIER_COLUMNS = [
+    ("Дата", "shift_date"),
+    ("Клуб", "club"),
+    ("Смена", "shift_type"),
+    ("Администратор", "fio"),
+    ("Z-отчёт", "z_report"),
+    ("Игровое+PS", "game_ps"),
+    ("Бар", "bar"),
+    ("Нал", "cash"),
+    ("Расширенная оплата", "extended"),
+    ("СБП эквайринг", "sbp_acq"),
+    ("CLS", "sbp_cls"),
+    ("Эквайринг", "acquiring"),
+    ("Расход", "expense"),
+    ("Возврат нал", "refund_cash"),
+    ("Возврат безнал", "refund_noncash"),
+    ("Равно?", "is_equal"),
+    ("Остаток нал", "cash_left"),
+    ("Инкассация", "encashment"),
+]
+_TEXT_KEYS = {"shift_date", "club", "shift_type", "fio", "is_equal"}
+# индексы колонок, которые суммируются в строке «Итого»
+CASHIER_SUM_COLS = [i for i, (_t, key) in enumerate(CASHIER_COLUMNS) if key not in _TEXT_KEYS]
+
+
+def cashier_export_query(d1: date, d2: date, club_ids: list[int]):
+    """
+    Один SELECT для выгрузки: Z-отчёт, Игровое+PS и остаток нал — hybrid-выражения
+    модели, сверка «Равно?» считается в БД так же, как в календаре кассира.
+    """
+    cr = CashierReport
+    c0 = lambda col: func.coalesce(col, 0)
+    delta = c0(cr.extended) - (c0(cr.sbp_acq) + c0(cr.sbp_cls) + c0(cr.acquiring))
+    q = (
+        db.session.query(
+            cr.shift_date,
+            Club.name.label("club"),
+            cr.shift_type,
+            func.coalesce(func.nullif(User.full_name, ""), User.username).label("fio"),
+            cr.z_report.label("z_report"),
+            cr.game_ps.label("game_ps"),
+            cr.bar, cr.cash, cr.extended, cr.sbp_acq, cr.sbp_cls, cr.acquiring,
+            cr.acquiring_fee.label("expense"),
+            cr.refund_cash, cr.refund_noncash,
+            (func.abs(delta) < 0.01).label("is_equal"),
+            delta.label("delta"),
+            cr.cash_left.label("cash_left"),
+            cr.encashment,
+        )
+        .outerjoin(Club, Club.id == cr.club_id)
+        .outerjoin(User, User.id == cr.user_id)
+        .filter(cr.shift_date >= d1, cr.shift_date < d2)
+    )
+    if club_ids:
+        q = q.filter(cr.club_id.in_(club_ids))
+    return q.order_by(cr.shift_date.asc(), cr.club_id.asc(), cr.shift_type.asc(), cr.id.asc())
+
+
+def cashier_export_values(r) -> list:
+    """Строка выгрузки в типах Python: дата, строки, числа (float)."""
+    out = []
+    for _title, key in CASHIER_COLUMNS:
+        v = getattr(r, key)
+        if key == "shift_type":
+            v = "День" if v == "day" else "Ночь"
+        elif key == "is_equal":
+            v = "ДА" if v else round(float(r.delta or 0), 2)
+        elif key in ("club", "fio"):
+            v = v or ""
+        elif key != "shift_date":
+            v = float(v or 0)
+        out.append(v)
+    return out
+
+
+def stream_csv(header: list[str], rows):
+    """Генератор CSV (UTF-8 с BOM, «;»): отдаёт текст кусками по EXPORT_BATCH строк."""
+    buf = io.StringIO(newline="")
+    w = csv.writer(buf, delimiter=";")
+    buf.write("\ufeff")
+    w.writerow(header)
+    for i, row in enumerate(rows, 1):
+        w.writerow(row)
+        if i % EXPORT_BATCH == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+    yield buf.getvalue()
+
+
+def stream_xlsx(title: str, header: list[str], rows, sum_cols: list[int] = ()):
+    """
+    Генератор XLSX: write-only книга (строки сразу уходят во временные файлы openpyxl),
+    числа — числовыми ячейками с форматом, даты — датами; в конце строка «Итого»
+    по колонкам sum_cols. Готовый файл читается с диска кусками по XLSX_CHUNK.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title[:31])
+    bold = Font(bold=True)
+
+    def cell(value, font=None):
+        c = WriteOnlyCell(ws, value=value)
+        if isinstance(value, date):
+            c.number_format = "DD.MM.YYYY"
+        elif isinstance(value, (int, float)):
+            c.number_format = "#,##0.00"
+        if font:
+            c.font = font
+        return c
+
+    ws.append([cell(h, bold) for h in header])
+    sums = {i: 0.0 for i in sum_cols}
+    for row in rows:
+        for i in sums:
+            sums[i] += row[i] or 0
+        ws.append([cell(v) for v in row])
+    if sums:
+        total = [None] * len(header)
+        total[0] = "Итого"
+        for i, v in sums.items():
+            total[i] = round(v, 2)
+        ws.append([cell(v, bold) for v in total])
+
+    with tempfile.TemporaryFile() as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(XLSX_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+
+
+def cashier_export_response(fmt: str, d1: date, d2: date, club_ids: list[int], filename: str) -> Response:
+    """Потоковый ответ с выгрузкой отчётов за [d1, d2): fmt — csv | xlsx; filename — без расширения."""
+    q = cashier_export_query(d1, d2, club_ids)
+    header = [title for title, _key in CASHIER_COLUMNS]
+    # строки читаются батчами, в памяти — не больше EXPORT_BATCH
+    rows = (cashier_export_values(r) for r in q.yield_per(EXPORT_BATCH))
+    if fmt == "xlsx":
+        body, mimetype = stream_xlsx("Отчёты кассира", header, rows, CASHIER_SUM_COLS), XLSX_MIME
+    else:
+        body, mimetype = stream_csv(header, rows), "text/csv"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}.{fmt}"},
+    )
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковое чтение файлов импорта (.xlsx / .csv) для инвентаризации и номенклатуры.
+
+Файл не читается в память целиком: XLSX открывается openpyxl в режиме read_only
+прямо из загруженного потока, CSV читается построчно через текстовую обёртку.
+Строки отдаются пачками словарей с каноническими ключами (name, barcode, ...);
+заголовки сопоставляются по общему словарю синонимов FIELD_ALIASES.
+
+  batches = read_batches(f.stream, f.filename, ("name", "expected_qty"))
+  for batch in batches:
+      for row in batch: ...
+"""
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+import re
+from typing import IO, Iterable, Iterator
+
+# канонический ключ -> заголовки в файлах (в нижнем регистре)
+FIELD_ALIASES: dict[str, tuple[str, ...]] = {
+    "name": ("name", "название", "наименование"),
+    "barcode": ("barcode", "артикулы", "штрихкод", "штрих-код"),
+    "purchase_price": ("purchase_price", "цена закупки", "закупка"),
+    "category": ("category", "категория"),
+    "expected_qty": ("expected_qty", "ост. на складе", "остаток на складе", "остаток"),
+    "purchase_qty": ("purchase_qty", "приход", "кол-во прихода", "количество прихода"),
+}
+
+BATCH_SIZE = 500
+_SNIFF_BYTES = 64 * 1024
+_HEADER_SCAN_ROWS = 10  # в выгрузках веб-админки над заголовком бывает строка-название
+
+
+class ImportFileError(ValueError):
+    """Файл не удалось открыть/разобрать как XLSX или CSV."""
+
+
+def _norm_header(h: object) -> str:
+    return " ".join(str(h or "").strip().lower().split())
+
+
+def _column_map(headers: Iterable[object], fields: Iterable[str]) -> dict[str, int]:
+    """Канонический ключ -> индекс колонки (первый найденный синоним)."""
+    pos: dict[str, int] = {}
+    for i, h in enumerate(headers):
+        pos.setdefault(_norm_header(h), i)
+    out = {}
+    for key in fields:
+        for alias in FIELD_ALIASES.get(key, (key,)):
+            if alias in pos:
+                out[key] = pos[alias]
+                break
+    return out
+
+
+def parse_barcodes(text_val) -> list[str]:
+    """Штрих-коды из ячейки «Артикулы»: разделители — запятая, пробел, ; | /, только цифры."""
+    s = "" if text_val is None else str(text_val).strip()
+    if not s:
+        return []
+    tokens = re.split(r"[,;\s|/\\]+", s)
+    out, seen = [], set()
+    for t in tokens:
+        b = re.sub(r"\D", "", str(t))
+        if b and b not in seen:
+            seen.add(b)
+            out.append(b)
+    return out
+
+
+def detect_encoding(head: bytes) -> str:
+    """utf-8-sig, если начало файла — корректный UTF-8 (с BOM или без), иначе cp1251."""
+    try:
+        # неполный многобайтовый символ в конце куска ошибкой не считается
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1251"
+
+
+def _batched(rows: Iterator[dict], size: int) -> Iterator[list[dict]]:
+    batch: list[dict] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _xlsx_rows(stream: IO[bytes], fields: tuple[str, ...]) -> Iterator[dict]:
+    import openpyxl
+
+    try:
+        wb = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFileError(f"Не удалось прочитать XLSX: {e}") from e
+
+    def gen():
+        try:
+            it = wb.active.iter_rows(values_only=True)
+            cols: dict[str, int] = {}
+            for _ in range(_HEADER_SCAN_ROWS):
+                header = next(it, None)
+                if header is None:
+                    return
+                cols = _column_map(header, fields)
+                if "name" in cols:
+                    break
+            if "name" not in cols:
+                return
+            for r in it:
+                if not r or all(v is None for v in r):
+                    continue
+                yield {k: (r[i] if i < len(r) else None) for k, i in cols.items()}
+        finally:
+            wb.close()
+
+    return gen()
+
+
+def _csv_rows(stream: IO[bytes], fields: tuple[str, ...]) -> Iterator[dict]:
+    head = stream.read(_SNIFF_BYTES)
+    stream.seek(0)
+    enc = detect_encoding(head)
+    first_line = head.split(b"\n", 1)[0].decode(enc, errors="ignore")
+    delimiter = ";" if ";" in first_line or "," not in first_line else ","
+
+    def gen():
+        text_stream = io.TextIOWrapper(stream, encoding=enc, errors="replace", newline="")
+        try:
+            reader = csv.reader(text_stream, delimiter=delimiter)
+            cols = _column_map(next(reader, []), fields)
+            for r in reader:
+                if not any(v.strip() for v in r):
+                    continue
+                yield {k: (r[i] if i < len(r) else None) for k, i in cols.items()}
+        finally:
+            text_stream.detach()
+
+    return gen()
+
+
+def read_batches(stream: IO[bytes], filename: str, fields: Iterable[str],
+                 batch_size: int = BATCH_SIZE) -> Iterator[list[dict]]:
+    """
+    Пачки строк файла импорта с ключами из fields (нет колонки — ключа нет в строке).
+    Ошибка открытия файла поднимается сразу как ImportFileError.
+    """
+    fields = tuple(fields)
+    if (filename or "").lower().endswith(".xlsx"):
+        rows = _xlsx_rows(stream, fields)
+    else:
+        rows = _csv_rows(stream, fields)
+    return _batched(rows, batch_size)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновые задачи в процессе приложения: пул потоков + таблица job в БД.
+
+Долгий импорт не держит HTTP-запрос: маршрут сохраняет файл (save_upload),
+ставит задачу (submit) и сразу отвечает; страница опрашивает /jobs/<id>
+и по завершении показывает итог.
+
+  path = save_upload(f)
+  job_id = submit("inventory_import", _run_import, cid, path, f.filename,
+                  club_id=cid, user_id=current_user.id, upload=path)
+
+Функция задачи получает первым аргументом JobContext (прогресс — job.track()
+поверх пачек строк) и возвращает dict — он сохраняется в job.result как JSON.
+Исключение переводит задачу в failed с текстом ошибки.
+
+JOB_WORKERS — число потоков пула; 0 — выполнять задачу сразу в запросе.
+Пул живёт в процессе: задачи, прерванные перезапуском, при старте помечаются
+failed (fail_stale_jobs), если не обновлялись дольше JOB_STALE_MINUTES.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Iterator
+
+from flask import Blueprint, current_app, jsonify
+from flask_login import current_user, login_required
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from . import schema
+from .extensions import db
+from .import_reader import ImportFileError
+from .models.job import Job
+
+log = logging.getLogger(__name__)
+
+bp = Blueprint("jobs", __name__, url_prefix="/jobs")
+
+_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+
+
+def _update(job_id: int, **cols) -> None:
+    # отдельное соединение: строки задачи не попадают в транзакцию самой задачи;
+    # updated_at — признак жизни для fail_stale_jobs
+    cols["updated_at"] = datetime.utcnow()
+    sets = ", ".join(f"{k}=:{k}" for k in cols)
+    with db.engine.begin() as conn:
+        conn.execute(text(f'UPDATE "job" SET {sets} WHERE id=:id'), {**cols, "id": job_id})
+
+
+class JobContext:
+    def __init__(self, job_id: int):
+        self.id = job_id
+        self.processed = 0
+
+    def progress(self, processed: int) -> None:
+        """Записать прогресс; если БД занята записью задачи — пропустить, не ждать."""
+        self.processed = processed
+        try:
+            _update(self.id, processed=processed)
+        except OperationalError:
+            pass
+
+    def track(self, batches: Iterable[list]) -> Iterator[list]:
+        """Пачки строк как есть, с учётом прогресса после каждой пачки."""
+        for batch in batches:
+            yield batch
+            self.progress(self.processed + len(batch))
+
+
+def save_upload(f) -> str:
+    """Сохранить загруженный файл во instance/uploads; путь удаляется после задачи (upload=)."""
+    folder = os.path.join(current_app.instance_path, "uploads")
+    os.makedirs(folder, exist_ok=True)
+    _base, ext = os.path.splitext(f.filename or "")
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=ext.lower(), dir=folder)
+    with os.fdopen(fd, "wb") as out:
+        f.save(out)
+    return path
+
+
+def _get_executor(workers: int) -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        return _executor
+
+
+def _run(app, job_id: int, fn: Callable, args: tuple, upload: str | None) -> None:
+    with app.app_context():
+        ctx = JobContext(job_id)
+        try:
+            _update(job_id, status="running", started_at=datetime.utcnow())
+            result = fn(ctx, *args) or {}
+            _update(job_id, status="done", processed=ctx.processed,
+                    result=json.dumps(result, ensure_ascii=False), finished_at=datetime.utcnow())
+        except Exception as e:
+            db.session.rollback()
+            if not isinstance(e, ImportFileError):
+                log.exception("job %s failed", job_id)
+            try:
+                _update(job_id, status="failed", error=str(e) or e.__class__.__name__,
+                        finished_at=datetime.utcnow())
+            except Exception:
+                # статус не записался — задачу подберёт fail_stale_jobs; исходную ошибку не теряем
+                log.exception("job %s: cannot record failure of %r", job_id, e)
+        finally:
+            db.session.remove()
+            if upload:
+                try:
+                    os.remove(upload)
+                except OSError:
+                    pass
+
+
+def submit(kind: str, fn: Callable, *args, club_id: int | None = None,
+           user_id: int | None = None, upload: str | None = None) -> int:
+    """Поставить задачу fn(job, *args) в пул. Возвращает id задачи."""
+    job = Job(kind=kind, club_id=club_id, user_id=user_id, status="queued")
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    workers = int(app.config.get("JOB_WORKERS", 2) or 0)
+    if workers <= 0:
+        _run(app, job.id, fn, args, upload)
+    else:
+        _get_executor(workers).submit(_run, app, job.id, fn, args, upload)
+    return job.id
+
+
+def fail_stale_jobs(app) -> int:
+    """
+    Пометить failed задачи queued/running, не обновлявшиеся JOB_STALE_MINUTES
+    (0 — не проверять): их поток умер вместе с прошлым процессом. Живая задача
+    соседнего процесса обновляет updated_at при каждом прогрессе. Возвращает число задач.
+    """
+    minutes = int(app.config.get("JOB_STALE_MINUTES", 0) or 0)
+    if minutes <= 0:
+        return 0
+    with app.app_context():
+        if not schema.has_table("job"):
+            return 0
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                n = conn.execute(text('''
+                    UPDATE "job" SET status='failed', error=:e, finished_at=:now, updated_at=:now
+                    WHERE status IN ('queued', 'running')
+                      AND COALESCE(updated_at, started_at, created_at) < :cutoff
+                '''), {"e": "Задача прервана перезапуском сервера", "now": now,
+                       "cutoff": now - timedelta(minutes=minutes)}).rowcount
+        except Exception:
+            log.exception("cannot fail stale jobs")
+            return 0
+    if n:
+        log.warning("marked %s stale job(s) as failed", n)
+    return n
+
+
+def get_job(job_id, user=None) -> Job | None:
+    """Задача по id; None, если её нет или она чужая (суперадмин видит все)."""
+    try:
+        job = db.session.get(Job, int(job_id))
+    except (TypeError, ValueError):
+        return None
+    if job is None:
+        return None
+    if user is not None and getattr(user, "role", "") != "superadmin" and job.user_id != user.id:
+        return None
+    db.session.refresh(job)  # статус меняет поток пула
+    return job
+
+
+@bp.get("/<int:job_id>")
+@login_required
+def status(job_id: int):
+    job = get_job(job_id, current_user)
+    if not job:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(job.to_dict())
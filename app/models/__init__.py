@@ -1,9 +1,10 @@
 
 from .user import User  # noqa
 from .club import Club  # noqa
-from .report import CashierReport  # noqa
+from .report import CashierReport, CashierMonthSummary  # noqa
 from .schedule import Shift  # noqa
 from .payroll import PayrollEntry  # noqa
 from .debt import AdminDebt, DebtTransaction  # noqa
-from .inventory import Product, ProductBarcode, ClubProductBarcode, Stock, StockMove, InventorySession, InventoryCount  # noqa
+from .inventory import Product, ProductBarcode, ClubProductBarcode, Stock, StockMove, StockCheckpoint, StockReceipt, InventorySession, InventoryCount, InventorySnapshotItem, InventorySnapshotAdmin  # noqa
+from .job import Job  # noqa
 
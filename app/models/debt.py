@@ -1,5 +1,5 @@
 
-from datetime import date
+from datetime import date, datetime
 from ..extensions import db
 
 class AdminDebt(db.Model):
@@ -10,6 +10,10 @@ class AdminDebt(db.Model):
     reason = db.Column(db.String(255), default="")
     created_on = db.Column(db.Date, default=date.today)
     status = db.Column(db.String(16), default="open")  # open|settled|written_off
+    __table_args__ = (
+        db.Index("ix_admin_debt_club_user", "club_id", "user_id"),
+        db.Index("ix_admin_debt_club_status", "club_id", "status"),
+    )
 
 
 class DebtTransaction(db.Model):
@@ -22,4 +26,9 @@ class DebtTransaction(db.Model):
     price = db.Column(db.Numeric(12, 2), nullable=False, default=0)
     kind = db.Column(db.String(16), default="normal")  # normal|defect (reserved)
     reason = db.Column(db.String(255), default="")
-    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    # время ставит приложение (UTC, как inventory_session.closed_at): окно сверки сравнивает их напрямую
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.now())
+    __table_args__ = (
+        # долги за окно инвентаризации (от закрытия прошлой сессии)
+        db.Index("ix_debt_transaction_club_created_product", "club_id", "created_at", "product_id"),
+    )
@@ -29,6 +29,9 @@ class Stock(db.Model):
     club_id = db.Column(db.Integer, db.ForeignKey("club.id"), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey("product.id"), nullable=False, index=True)
     qty = db.Column(db.Integer, default=0)
+    __table_args__ = (
+        db.Index('uq_stock_club_product', 'club_id', 'product_id', unique=True),
+    )
 
 class StockMove(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -37,12 +40,46 @@ class StockMove(db.Model):
     qty_delta = db.Column(db.Integer, nullable=False)
     reason = db.Column(db.String(64), default="adjust")  # sale|purchase|adjust|transfer
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_stock_move_club_product_created', 'club_id', 'product_id', 'created_at'),
+        db.Index('ix_stock_move_club_created', 'club_id', 'created_at'),
+    )
+
+class StockCheckpoint(db.Model):
+    """Остатки клуба на момент as_of (сумма движений журнала); остаток на дату = снимок + движения после него."""
+    __tablename__ = "stock_checkpoint"
+    id = db.Column(db.Integer, primary_key=True)
+    club_id = db.Column(db.Integer, db.ForeignKey("club.id"), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("product.id"), nullable=False)
+    as_of = db.Column(db.DateTime, nullable=False)
+    qty = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.Index('uq_stock_checkpoint_club_asof_product', 'club_id', 'as_of', 'product_id', unique=True),
+    )
+
+class StockReceipt(db.Model):
+    """Проведённый приход из файла импорта: один файл (по содержимому) оприходуется один раз."""
+    __tablename__ = "stock_receipt"
+    id = db.Column(db.Integer, primary_key=True)
+    club_id = db.Column(db.Integer, db.ForeignKey("club.id"), nullable=False)
+    digest = db.Column(db.String(64), nullable=False)  # sha256 содержимого файла
+    filename = db.Column(db.String(255), default="")
+    job_id = db.Column(db.Integer)
+    qty = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('uq_stock_receipt_club_digest', 'club_id', 'digest', unique=True),
+    )
 
 class InventorySession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     club_id = db.Column(db.Integer, db.ForeignKey("club.id"), nullable=False)
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
     closed_at = db.Column(db.DateTime, nullable=True)
+    snapshot_at = db.Column(db.DateTime, nullable=True)  # снимок сверки сохранён (inventory._store_snapshot)
+    __table_args__ = (
+        db.Index("ix_inventory_session_club_closed", "club_id", "closed_at"),
+    )
 
 class InventoryCount(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -50,19 +87,88 @@ class InventoryCount(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey("product.id"), nullable=False)
     expected_qty = db.Column(db.Integer, default=0)
     counted_qty = db.Column(db.Integer, default=0)
+    __table_args__ = (
+        db.Index('uq_inventory_count_session_product', 'session_id', 'product_id', unique=True),
+    )
+
+class InventorySnapshotItem(db.Model):
+    """Сверка закрытой сессии по товару, зафиксированная при закрытии (не пересчитывается)."""
+    __tablename__ = "inventory_snapshot_item"
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey("inventory_session.id"), nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(180), nullable=False)
+    expected_qty = db.Column(db.Integer, default=0)
+    counted_qty = db.Column(db.Integer, default=0)
+    debt_qty = db.Column(db.Integer, default=0)  # долги за окно сессии
+    price = db.Column(db.Numeric(12,2), default=0)
+    shortage_qty = db.Column(db.Integer, default=0)
+    shortage = db.Column(db.Numeric(14,2), default=0)
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'product_id', name='uq_inventory_snapshot_item_session_product'),
+    )
+
+class InventorySnapshotAdmin(db.Model):
+    """Распределение недостачи закрытой сессии по администраторам (по сменам за месяц)."""
+    __tablename__ = "inventory_snapshot_admin"
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey("inventory_session.id"), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(128), nullable=False, default="")
+    shifts = db.Column(db.Integer, default=0)
+    share = db.Column(db.Float, default=0)
+    allocated = db.Column(db.Numeric(14,2), default=0)
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'user_id', name='uq_inventory_snapshot_admin_session_user'),
+    )
 
 # Небольшая «самолечащаяся» миграция: добавляет колонку purchase_price
-# в таблицу club_product_barcode, если её ещё нет (SQLite).
+# в таблицу club_product_barcode, если её ещё нет.
 
 def ensure_club_barcode_price_column():
+    from .. import schema
+    if schema.has_column('club_product_barcode', 'purchase_price'):
+        return
+    from ..sqlcompat import table_columns
     try:
-        rows = db.session.execute(db.text('PRAGMA table_info("club_product_barcode")')).mappings().all()
-        cols = {r['name'] for r in rows}
+        cols = table_columns('club_product_barcode')
+        if not cols:
+            return
         if 'purchase_price' not in cols:
             db.session.execute(db.text('ALTER TABLE "club_product_barcode" ADD COLUMN purchase_price NUMERIC(12,2) DEFAULT 0'))
             db.session.commit()
+        schema.mark('club_product_barcode', cols | {'purchase_price'})
+    except Exception:
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+
+
+# Уникальный (club_id, product_id) на stock: складской журнал (app/stock_ledger.py)
+# меняет остаток через ON CONFLICT. Дубли сливаются в последнюю строку с суммой qty.
+
+STOCK_DEDUPE_SQL = (
+    'UPDATE "stock" SET qty = (SELECT SUM(COALESCE(s2.qty,0)) FROM "stock" s2 '
+    'WHERE s2.club_id = "stock".club_id AND s2.product_id = "stock".product_id) '
+    'WHERE id IN (SELECT MAX(id) FROM "stock" GROUP BY club_id, product_id HAVING COUNT(*) > 1)',
+    'DELETE FROM "stock" WHERE id NOT IN (SELECT MAX(id) FROM "stock" GROUP BY club_id, product_id)',
+)
+
+def ensure_stock_unique_index():
+    from sqlalchemy import inspect
+    try:
+        insp = inspect(db.engine)
+        if not insp.has_table('stock'):
+            return
+        if any(ix['name'] == 'uq_stock_club_product' for ix in insp.get_indexes('stock')):
+            return
+        for sql in STOCK_DEDUPE_SQL:
+            db.session.execute(db.text(sql))
+        db.session.execute(db.text('CREATE UNIQUE INDEX uq_stock_club_product ON "stock"(club_id, product_id)'))
+        db.session.commit()
     except Exception:
         try:
             db.session.rollback()
         except Exception:
-            pass
+            pass
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import json
+from datetime import datetime
+
+from ..extensions import db
+
+
+class Job(db.Model):
+    """
+    Фоновая задача (импорт файла и т.п.): статус, прогресс и итог.
+    Выполняется пулом потоков процесса (app/jobs.py).
+    """
+    __tablename__ = "job"
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    club_id = db.Column(db.Integer)
+    user_id = db.Column(db.Integer)
+
+    status = db.Column(db.String(16), nullable=False, default="queued")  # queued|running|done|failed
+    processed = db.Column(db.Integer, nullable=False, default=0)  # обработано строк
+    result = db.Column(db.Text)  # JSON: счётчики и сообщения
+    error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)  # последняя запись статуса/прогресса
+
+    __table_args__ = (
+        db.Index("ix_job_user_created", "user_id", "created_at"),
+    )
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    @property
+    def result_data(self) -> dict:
+        try:
+            return json.loads(self.result) if self.result else {}
+        except ValueError:
+            return {}
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "processed": self.processed,
+            "result": self.result_data,
+            "error": self.error,
+        }
@@ -50,6 +50,11 @@ class CashierReport(db.Model):
     status = db.Column(db.String(24), default="draft")
     created_at = db.Column(db.DateTime, server_default=func.now())
 
+    __table_args__ = (
+        # календарь кассира и проверка дубля: клуб + дата (+ смена)
+        db.Index("ix_cashier_report_club_date_type", "club_id", "shift_date", "shift_type"),
+    )
+
     # связи (если в проекте есть модель user)
     user = db.relationship("User", backref="cashier_reports", lazy="joined", foreign_keys=[user_id])
 
@@ -73,6 +78,15 @@ class CashierReport(db.Model):
     def game_ps(cls):
         return (func.coalesce(cls.cash, 0) + func.coalesce(cls.extended, 0) - func.coalesce(cls.bar, 0))
 
+    @hybrid_property
+    def cash_left(self) -> Decimal:
+        """Остаток нал = Наличные − Возврат нал − Расходы"""
+        return D(self.cash) - D(self.refund_cash) - D(self.acquiring_fee)
+
+    @cash_left.expression
+    def cash_left(cls):
+        return (func.coalesce(cls.cash, 0) - func.coalesce(cls.refund_cash, 0) - func.coalesce(cls.acquiring_fee, 0))
+
     @property
     def expenses_total(self) -> Decimal:
         """Сумма расходов (хранится в acquiring_fee)."""
@@ -84,3 +98,42 @@ class CashierReport(db.Model):
         diff = D(self.extended) - (D(self.sbp_acq) + D(self.sbp_cls) + D(self.acquiring))
         return abs(diff) < Decimal("0.01")
 
+
+
+class CashierMonthSummary(db.Model):
+    """
+    Свёртка отчётов кассира по клубу и месяцу: суммы колонок оплаты и полные сутки.
+    Пересчитывается при сохранении/удалении отчёта (app/cashier_summary.py).
+    """
+    __tablename__ = "cashier_month_summary"
+
+    id = db.Column(db.Integer, primary_key=True)
+    club_id = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Date, nullable=False)  # первое число месяца
+
+    reports = db.Column(db.Integer, nullable=False, default=0)
+    full_days = db.Column(db.Integer, nullable=False, default=0)  # сутки с дневной и ночной сменой
+    full_days_z = db.Column(db.Numeric(14, 2), default=0)  # Z-отчёт за полные сутки (для среднесуточной)
+
+    bar = db.Column(db.Numeric(14, 2), default=0)
+    cash = db.Column(db.Numeric(14, 2), default=0)
+    extended = db.Column(db.Numeric(14, 2), default=0)
+    sbp_acq = db.Column(db.Numeric(14, 2), default=0)
+    sbp_cls = db.Column(db.Numeric(14, 2), default=0)
+    acquiring = db.Column(db.Numeric(14, 2), default=0)
+    acquiring_fee = db.Column(db.Numeric(14, 2), default=0)
+    refund_cash = db.Column(db.Numeric(14, 2), default=0)
+    refund_noncash = db.Column(db.Numeric(14, 2), default=0)
+    encashment = db.Column(db.Numeric(14, 2), default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint("club_id", "month", name="uq_cashier_month_summary_club_month"),
+    )
+
+    @property
+    def z_report(self) -> Decimal:
+        return D(self.cash) + D(self.extended)
+
+    @property
+    def avg_full_day(self) -> Decimal | None:
+        return D(self.full_days_z) / self.full_days if self.full_days else None
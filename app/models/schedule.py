@@ -8,3 +8,7 @@ class Shift(db.Model):
     start_ts = db.Column(db.DateTime, nullable=False)
     end_ts = db.Column(db.DateTime, nullable=False)
     role_at_shift = db.Column(db.String(32), default="cashier")
+    __table_args__ = (
+        db.Index("ix_shift_club_user_start", "club_id", "user_id", "start_ts"),
+        db.Index("ix_shift_club_start", "club_id", "start_ts"),
+    )
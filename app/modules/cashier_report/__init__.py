@@ -3,16 +3,22 @@ from __future__ import annotations
 
 from datetime import date, datetime, timedelta
 from calendar import monthrange
+from decimal import Decimal
 from typing import Any
 
 from flask import Blueprint, render_template, request, redirect, url_for, abort, flash
 from flask_login import login_required, current_user
-from sqlalchemy import text
+from sqlalchemy import func, text
 from sqlalchemy.orm import joinedload
 
 from ...extensions import db
 from ...acl import get_active_club_id, allowed_club_ids, can_edit_report
-from ...models.report import CashierReport
+from ...cashier_summary import refresh_month
+from ...exports import cashier_export_response
+from ...query_advisor import hot_query
+from ...security import roles_required
+from ...models import User
+from ...models.report import CashierReport, D
 
 bp = Blueprint("cashier", __name__, url_prefix="/cashier", template_folder="templates")
 
@@ -57,6 +63,55 @@ def _delta(values: dict[str, Any]) -> float:
         return 0.0
 
 
+# суммы месяца: ключ шаблона -> колонка отчёта
+_TOTAL_COLS = {
+    "bar": "bar", "cash": "cash", "ext": "extended", "sbp": "sbp_acq", "cls": "sbp_cls",
+    "acq": "acquiring", "fee": "acquiring_fee", "rc": "refund_cash", "rn": "refund_noncash",
+    "inc": "encashment",
+}
+
+
+def _month_query(cid: int, start: date, end: date):
+    return (
+        db.session.query(
+            CashierReport.id,
+            CashierReport.shift_date,
+            CashierReport.shift_type,
+            *(getattr(CashierReport, c) for c in _TOTAL_COLS.values()),
+            CashierReport.acquiring_fee.label("expense_total"),
+            CashierReport.game_ps.label("game_ps"),
+            func.coalesce(func.nullif(User.full_name, ""), User.username).label("fio"),
+        )
+        .outerjoin(User, User.id == CashierReport.user_id)
+        .filter(
+            CashierReport.club_id == cid,
+            CashierReport.shift_date >= start,
+            CashierReport.shift_date < end,
+        )
+        .order_by(CashierReport.shift_date.asc(), CashierReport.shift_type.asc())
+    )
+
+
+hot_query("cashier.month", lambda: _month_query(1, date(2025, 1, 1), date(2025, 2, 1)))
+
+
+def _month_rows(cid: int, start: date, end: date):
+    """
+    Отчёты клуба за месяц одним запросом — лёгкими строками (Row), а не ORM-объектами
+    с подгруженным User, — и итоги месяца, посчитанные за тот же проход.
+    """
+    rows = _month_query(cid, start, end).all()
+
+    totals = dict.fromkeys((*_TOTAL_COLS, "z", "game", "cl"), Decimal("0"))
+    for r in rows:
+        for key, col in _TOTAL_COLS.items():
+            totals[key] += D(getattr(r, col))
+        totals["z"] += D(r.cash) + D(r.extended)
+        totals["game"] += D(r.game_ps)
+        totals["cl"] += D(r.cash) - D(r.refund_cash) - D(r.acquiring_fee)
+    return rows, totals
+
+
 def _load_expenses_list(report_id: int) -> list[dict]:
     row = db.session.execute(text('SELECT expenses_json FROM "cashier_report" WHERE id=:id'), {"id": report_id}).first()
     if not row or not row[0]:
@@ -81,54 +136,25 @@ def index():
         flash("Нет доступных клубов.", "warning")
         return redirect(url_for("home"))
 
-    # ORM-выборка: отчёты клуба + пользователь (для ФИО в шаблоне)
-    reports = (
-        CashierReport.query.options(joinedload(CashierReport.user))
-        .filter(
-            CashierReport.shift_date >= start,
-            CashierReport.shift_date < end,
-            CashierReport.club_id == cid,
-        )
-        .order_by(CashierReport.shift_date.asc(), CashierReport.shift_type.asc())
-        .all()
-    )
+    rows, totals = _month_rows(cid, start, end)
 
-    # индекс (date, 'day'|'night') -> ORM-объект отчёта
-    bykey: dict[tuple[date, str], CashierReport] = {}
-    for r in reports:
-        bykey[(_to_date(r.shift_date), r.shift_type)] = r
+    # индекс (date, 'day'|'night') -> строка отчёта
+    bykey = {(_to_date(r.shift_date), r.shift_type): r for r in rows}
 
     # календарь
     days = [start + timedelta(days=i) for i in range(days_in_month)]
-    full_days_count = sum(1 for d in days if ((d, "day") in bykey and (d, "night") in bykey))
-
-    # агрегаты по месяцу
-    totals = db.session.execute(
-        text(
-            """
-        SELECT
-          COALESCE(SUM(bar),0)            AS bar,
-          COALESCE(SUM(cash),0)           AS cash,
-          COALESCE(SUM(extended),0)       AS extended,
-          COALESCE(SUM(sbp_acq),0)        AS sbp_acq,
-          COALESCE(SUM(sbp_cls),0)        AS sbp_cls,
-          COALESCE(SUM(acquiring),0)      AS acquiring,
-          COALESCE(SUM(acquiring_fee),0)  AS acquiring_fee,
-          COALESCE(SUM(refund_cash),0)    AS refund_cash,
-          COALESCE(SUM(refund_noncash),0) AS refund_noncash,
-          COALESCE(SUM(encashment),0)     AS encashment
-        FROM "cashier_report"
-        WHERE shift_date >= :start AND shift_date < :end AND club_id = :cid
-        """
-        ),
-        {"start": start.isoformat(), "end": end.isoformat(), "cid": cid},
-    ).mappings().first()
+    full_days = [d for d in days if (d, "day") in bykey and (d, "night") in bykey]
+    full_days_z = sum(
+        (D(bykey[(d, t)].cash) + D(bykey[(d, t)].extended) for d in full_days for t in ("day", "night")),
+        Decimal("0"),
+    )
 
     return render_template(
         "cashier_report/index.html",
         bykey=bykey,
         days=days,
-        full_days_count=full_days_count,
+        full_days_count=len(full_days),
+        full_days_z=full_days_z,
         month_str=start.strftime("%Y-%m"),
         month_date=start.strftime("%Y-%m-%d"),
         month_label=f"{MONTHS_RU[start.month-1]} {start.year}",
@@ -138,7 +164,28 @@ def index():
     )
 
 
+# ------------ export ----------------------------------------------------------
+@bp.route("/export", methods=["GET"])
+@login_required
+@roles_required("superadmin", "owner")
+def export():
+    """Календарь активного клуба за месяц в XLSX (?format=csv — в CSV)."""
+    cid = get_active_club_id(current_user)
+    if not cid:
+        abort(403)
+    start, end, _ = _month_bounds(request.args.get("m"))
+    fmt = "csv" if request.args.get("format") == "csv" else "xlsx"
+    return cashier_export_response(fmt, start, end, [cid], f"cashier_club{cid}_{start:%Y-%m}")
+
+
 # ------------ create ----------------------------------------------------------
+_DUPLICATE_SQL = hot_query(
+    "cashier.duplicate_check",
+    'SELECT id FROM "cashier_report" WHERE club_id=:c AND shift_date=:d AND shift_type=:t',
+    c=1, d="2025-01-01", t="day",
+)
+
+
 @bp.route("/new", methods=["GET", "POST"])
 @login_required
 def new():
@@ -162,10 +209,7 @@ def new():
     shift_type = f.get("shift_type")
 
     # защита от дубля в пределах клуба
-    exists = db.session.execute(
-        text('SELECT id FROM "cashier_report" WHERE club_id=:c AND shift_date=:d AND shift_type=:t'),
-        {"c": cid, "d": shift_date, "t": shift_type},
-    ).first()
+    exists = db.session.execute(text(_DUPLICATE_SQL), {"c": cid, "d": shift_date, "t": shift_type}).first()
     if exists:
         flash("Отчёт уже существует. Открываю для редактирования.", "info")
         return redirect(url_for("cashier.edit", report_id=int(exists[0])))
@@ -204,6 +248,7 @@ def new():
     cols = ", ".join(fields.keys())
     params = ", ".join([f":{k}" for k in fields.keys()])
     new_id = db.session.execute(text(f'INSERT INTO "cashier_report" ({cols}) VALUES ({params}) RETURNING id'), fields).first()[0]
+    refresh_month(cid, shift_date)
     db.session.commit()
     return redirect(url_for("cashier.view", report_id=int(new_id)))
 
@@ -272,5 +317,6 @@ def edit(report_id: int):
     sets = ", ".join([f'{k}=:{k}' for k in upd.keys()])
     upd["id"] = report_id
     db.session.execute(text(f'UPDATE "cashier_report" SET {sets} WHERE id=:id'), upd)
+    refresh_month(r.club_id, r.shift_date)
     db.session.commit()
     return redirect(url_for("cashier.view", report_id=report_id))
@@ -6,7 +6,10 @@ from flask_login import login_required, current_user
 from sqlalchemy import text
 
 from ...extensions import db
-from ...acl import get_active_club_id, allowed_club_ids, _ensure_user_club_table
+from ...sqlcompat import ilike, string_agg
+from ...stock_ledger import apply_moves
+from ...query_advisor import hot_query
+from ...acl import get_active_club_id, allowed_club_ids, membership_role, _ensure_user_club_table
 from ...models.debt import DebtTransaction
 from ...models.user import User
 from ...models.inventory import (
@@ -28,11 +31,9 @@ bp = Blueprint(
 
 
 def _is_owner_of_club(user: User, club_id: int) -> bool:
-    row = db.session.execute(
-        text('SELECT 1 FROM "user_club" WHERE user_id=:u AND club_id=:c AND role="owner"'),
-        {"u": getattr(user, "id", 0), "c": club_id},
-    ).first()
-    return bool(row)
+    if getattr(user, "role", "") == "superadmin":
+        return True
+    return membership_role(user, club_id) == "owner"
 
 
 def _can_delete_ops(user: User, club_id: int) -> bool:
@@ -46,7 +47,7 @@ def _users_for_club(cid: int):
     sql = (
         'SELECT u.id, COALESCE(u.full_name,u.username) AS name '
         'FROM "user_club" m JOIN "user" u ON u.id=m.user_id '
-        'WHERE m.club_id=:c AND m.role IN ("owner","club_admin","staff") '
+        'WHERE m.club_id=:c AND m.role IN (\'owner\',\'club_admin\',\'staff\') '
         'ORDER BY COALESCE(u.full_name,u.username)'
     )
     return db.session.execute(text(sql), {"c": cid}).mappings().all()
@@ -57,6 +58,27 @@ def _member_ids(cid: int) -> set[int]:
     return {r[0] for r in rows}
 
 
+def _ops_query(cid: int, kind: str, user_id: int | None = None):
+    """Последние 200 операций клуба вида kind (normal|defect); user_id — только свои."""
+    q = (
+        db.session.query(DebtTransaction, User, Product)
+        .join(User, User.id == DebtTransaction.user_id)
+        .join(Product, Product.id == DebtTransaction.product_id)
+        .filter(DebtTransaction.club_id == cid, DebtTransaction.kind == kind)
+    )
+    if user_id is not None:
+        q = q.filter(DebtTransaction.user_id == user_id)
+    return q.order_by(DebtTransaction.created_at.desc(), DebtTransaction.id.desc()).limit(200)
+
+
+def _club_barcode(cid: int, barcode: str):
+    return ClubProductBarcode.query.filter_by(club_id=cid, barcode=barcode)
+
+
+hot_query("debt_ops.list", lambda: _ops_query(1, "normal"))
+hot_query("debt_ops.barcode_lookup", lambda: _club_barcode(1, "4600000000000"))
+
+
 @bp.get("/")
 @login_required
 def index():
@@ -64,31 +86,12 @@ def index():
     if not cid or cid not in allowed_club_ids(current_user):
         abort(403)
 
-    base_q = (
-        db.session.query(DebtTransaction, User, Product)
-        .join(User, User.id == DebtTransaction.user_id)
-        .join(Product, Product.id == DebtTransaction.product_id)
-        .filter(DebtTransaction.club_id == cid)
-    )
-
     role = getattr(current_user, "role", "")
-    if role not in ("superadmin", "owner"):
-        base_q = base_q.filter(DebtTransaction.user_id == getattr(current_user, "id", 0))
+    own = None if role in ("superadmin", "owner") else getattr(current_user, "id", 0)
 
     # Разделяем обычные операции и акты списания (дефект)
-    rows = (
-        base_q.filter(DebtTransaction.kind == "normal")
-        .order_by(DebtTransaction.created_at.desc(), DebtTransaction.id.desc())
-        .limit(200)
-        .all()
-    )
-
-    defects = (
-        base_q.filter(DebtTransaction.kind == "defect")
-        .order_by(DebtTransaction.created_at.desc(), DebtTransaction.id.desc())
-        .limit(200)
-        .all()
-    )
+    rows = _ops_query(cid, "normal", own).all()
+    defects = _ops_query(cid, "defect", own).all()
 
     can_choose_user = getattr(current_user, "role", "") in ("superadmin", "owner")
     sums_sql = (
@@ -154,7 +157,7 @@ def ops_lookup():
     if not barcode:
         return jsonify({"ok": False, "error": "barcode required"}), 400
     ensure_club_barcode_price_column()
-    mp = ClubProductBarcode.query.filter_by(club_id=cid, barcode=barcode).first()
+    mp = _club_barcode(cid, barcode).first()
     if not mp:
         return jsonify({"ok": True, "found": False})
     p = Product.query.get(mp.product_id)
@@ -190,11 +193,12 @@ def ops_search():
             limit = int(request.args.get("limit") or 200)
         except Exception:
             limit = 200
+        barcodes_sql = string_agg("CASE WHEN cb.barcode LIKE :placeholder THEN NULL ELSE cb.barcode END")
         base_sql = (
             "SELECT p.id, p.name, COALESCE(MAX(cb.purchase_price), COALESCE(p.purchase_price,0)) AS purchase_price, "
-            "GROUP_CONCAT(CASE WHEN cb.barcode LIKE :placeholder THEN NULL ELSE cb.barcode END, ', ') AS barcodes "
+            f"{barcodes_sql} AS barcodes "
             "FROM club_product_barcode cb JOIN product p ON p.id = cb.product_id "
-            "WHERE cb.club_id = :c AND (p.name LIKE :like OR cb.barcode LIKE :like) "
+            f"WHERE cb.club_id = :c AND (p.name {ilike()} :like OR cb.barcode LIKE :like) "
             "GROUP BY p.id, p.name ORDER BY p.name "
         )
         if limit and limit > 0:
@@ -226,7 +230,7 @@ def ops_assign():
     barcode = (request.form.get("barcode") or "").strip()
     product_id = None
     if barcode:
-        mp = ClubProductBarcode.query.filter_by(club_id=cid, barcode=barcode).first()
+        mp = _club_barcode(cid, barcode).first()
         if mp:
             product_id = mp.product_id
     if not product_id:
@@ -258,6 +262,7 @@ def ops_assign():
         kind="normal",
     )
     db.session.add(rec)
+    apply_moves(cid, [(p.id, -qty)], "debt")
     db.session.commit()
     return redirect(url_for("debtops.index", ok=1))
 
@@ -270,6 +275,8 @@ def ops_delete(op_id: int):
         return redirect(url_for("debtops.index"))
     if not _can_delete_ops(current_user, int(rec.club_id)):
         abort(403)
+    # ошибочная операция: товар возвращается на остаток
+    apply_moves(int(rec.club_id), [(int(rec.product_id), int(rec.qty or 0))], "debt_delete")
     db.session.delete(rec)
     db.session.commit()
     return redirect(url_for("debtops.index", **{"del": 1}))
@@ -314,7 +321,7 @@ def ops_defect():
     product_id = None
     mp = None
     if barcode:
-        mp = ClubProductBarcode.query.filter_by(club_id=cid, barcode=barcode).first()
+        mp = _club_barcode(cid, barcode).first()
         if mp:
             product_id = mp.product_id
     if not product_id:
@@ -343,5 +350,6 @@ def ops_defect():
         kind="defect",
     )
     db.session.add(rec)
+    apply_moves(cid, [(p.id, -qty)], "defect")
     db.session.commit()
     return redirect(url_for("debtops.index", ok=1))
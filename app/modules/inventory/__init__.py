@@ -1,24 +1,38 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
+import click
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from flask_login import login_required, current_user
-from sqlalchemy import text
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, text
 
 from ...extensions import db
+from ... import schema
+from ...sqlcompat import ts_bound
+from ...import_reader import parse_barcodes, read_batches
+from ...stock_ledger import checkpoint, ledger_opened, levels_at, set_levels
+from ...jobs import get_job, save_upload, submit
+from ...query_advisor import hot_query
 from ...acl import get_active_club_id, allowed_club_ids
 from ...security import roles_required
-from ...models.inventory import Product, InventorySession, InventoryCount
+from ...models.inventory import InventorySession
+
+# колонки файла остатков (синонимы заголовков — import_reader.FIELD_ALIASES)
+IMPORT_FIELDS = ("name", "expected_qty", "barcode")
 
 bp = Blueprint("inventory", __name__, url_prefix="/inventory", template_folder="../../templates/inventory")
 
 
 def _ensure_tables():
+    if schema.has_table("inventory_session"):
+        return
     try:
         db.session.execute(text('SELECT 1 FROM "inventory_session" LIMIT 1'))
     except Exception:
         db.create_all()
+    schema.mark("inventory_session")
 
 
 def _active_session(cid: int) -> InventorySession | None:
@@ -48,135 +62,242 @@ def index():
             flash('Сначала выберите клуб.', 'warning')
         return render_template('inventory/index.html', clubs=_list_clubs(), club_id=0, items=[], debts={}, has_session=False)
 
-    # POST: импорт файла
+    # POST: импорт файла — в фоне, страница опрашивает задачу (?job=<id>)
     if request.method == 'POST':
         f = request.files.get('file')
         if not f:
             flash('Выберите файл .xlsx/.csv', 'warning')
             return redirect(url_for('inventory.index', club_id=cid))
-        filename = (getattr(f, 'filename', '') or '').lower()
-        content = f.read()
-        rows = []
-        import io, csv
-        errors: list[str] = []
-
-        def parse_expected(x):
-            try:
-                return int(float(str(x).replace(',', '.')))
-            except Exception:
-                return 0
-
-        if filename.endswith('.xlsx'):
-            try:
-                import openpyxl
-                wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
-                ws = wb.active
-                it = ws.iter_rows(values_only=True)
-                try: next(it)
-                except Exception: pass
-                headers = list(next(it, []) or [])
-                idx = {str(headers[i]).strip(): i for i in range(len(headers))}
-                name_i = idx.get('Название')
-                qty_i = idx.get('Ост. на складе') or idx.get('Остаток на складе') or idx.get('Остаток')
-                for r in it:
-                    if not r: continue
-                    name = (str(r[name_i]).strip() if name_i is not None and name_i < len(r) and r[name_i] is not None else '')
-                    expected = parse_expected(r[qty_i]) if (qty_i is not None and qty_i < len(r)) else 0
-                    rows.append({'name': name, 'expected_qty': expected})
-            except Exception as e:
-                flash(f'Не удалось прочитать XLSX: {e}', 'danger')
-                return redirect(url_for('inventory.index', club_id=cid))
-        else:
-            try:
-                text_data = content.decode('utf-8-sig')
-            except Exception:
-                text_data = content.decode(errors='ignore')
-            reader = csv.DictReader(io.StringIO(text_data), delimiter=';')
-            if not reader.fieldnames:
-                reader = csv.DictReader(io.StringIO(text_data))
-            for row in reader:
-                name = (row.get('name') or row.get('Название') or '').strip()
-                expected = parse_expected(row.get('expected_qty') or row.get('Ост. на складе') or row.get('Остаток') or 0)
-                rows.append({'name': name, 'expected_qty': expected})
-
-        if not rows:
+        path = save_upload(f)
+        job_id = submit('inventory_import', _run_import, cid, path, f.filename,
+                        club_id=cid, user_id=current_user.id, upload=path)
+        return redirect(url_for('inventory.index', club_id=cid, job=job_id))
+
+    job = get_job(request.args.get('job'), current_user) if request.args.get('job') else None
+    if job and job.club_id != cid:
+        job = None
+    import_errors: list[str] = []
+    if job and job.status == 'failed':
+        flash(job.error or 'Импорт не выполнен.', 'danger')
+    elif job and job.status == 'done':
+        res = job.result_data
+        if res.get('empty'):
             flash('Пустой файл импорта.', 'warning')
-            return redirect(url_for('inventory.index', club_id=cid))
+        else:
+            import_errors = res.get('errors') or []
+            if import_errors:
+                flash('Импорт завершён с ошибками (часть строк пропущена).', 'warning')
+            flash(f'Импортировано позиций: {res.get("imported", 0)}.', 'primary')
 
-        sess = _active_session(cid)
-        if not sess:
-            sess = InventorySession(club_id=cid)
-            db.session.add(sess); db.session.flush()
-
-        existing = {ic.product_id: ic for ic in db.session.query(InventoryCount).filter_by(session_id=sess.id).all()}
-
-        imported = 0
-        for row in rows:
-            name = row['name']
-            if not name:
-                errors.append('Пропущена строка: отсутствует название'); continue
-            raw_expected = row.get('expected_qty') if isinstance(row, dict) else None
-            try:
-                expected = int(raw_expected or 0)
-            except Exception:
-                expected = 0
-            p = Product.query.filter_by(name=name).first()
-            if not p:
-                if expected <= 0:
-                    continue
-                errors.append(f'Не найден товар: "{name}"'); continue
-            ic = existing.get(p.id)
-            if not ic:
-                ic = InventoryCount(session_id=sess.id, product_id=p.id, expected_qty=expected, counted_qty=0)
-                db.session.add(ic); existing[p.id] = ic
-            else:
-                ic.expected_qty = expected
-            imported += 1
+    sess = _active_session(cid)
+    items, shortage_value = _reconcile(cid, sess) if sess else ([], 0.0)
+    admin_stats = _admin_stats(cid, sess, shortage_value)
+    return render_template('inventory/index.html', clubs=_list_clubs(), club_id=cid, items=items,
+                           admin_stats=admin_stats, shortage_value=shortage_value, import_errors=import_errors,
+                           job=job, has_session=bool(sess))
 
-        db.session.commit()
-        if errors:
-            flash('Импорт завершён с ошибками (часть строк пропущена).', 'warning')
-        flash(f'Импортировано позиций: {imported}.', 'primary')
-        items = _items_for_session(cid, sess.id)
-        debts_map = _debts_qty(cid)
-        admin_stats, shortage_value = _admin_stats(cid, sess, items, debts_map)
-        return render_template('inventory/index.html', clubs=_list_clubs(), club_id=cid,
-                               items=items, debts=debts_map, import_errors=errors,
-                               admin_stats=admin_stats, shortage_value=shortage_value,
-                               price_map=_purchase_prices_map(cid), has_session=True)
 
-    sess = _active_session(cid)
-    items = _items_for_session(cid, sess.id) if sess else []
-    debts_map = _debts_qty(cid)
-    admin_stats, shortage_value = _admin_stats(cid, sess, items, debts_map)
-    return render_template('inventory/index.html', clubs=_list_clubs(), club_id=cid, items=items, debts=debts_map,
-                           admin_stats=admin_stats, shortage_value=shortage_value,
-                           price_map=_purchase_prices_map(cid), has_session=bool(sess))
+def _parse_expected(x) -> int:
+    try:
+        return int(float(str(x).replace(',', '.')))
+    except Exception:
+        return 0
+
+
+def _norm_name(name) -> str:
+    """Название для сопоставления: без учёта регистра и лишних пробелов."""
+    return " ".join(str(name or "").split()).casefold()
+
+
+def _product_index() -> dict[str, int]:
+    # при дублях названия — самый ранний товар (как .filter_by(name=...).first())
+    index: dict[str, int] = {}
+    for pid, name in db.session.execute(text('SELECT id, name FROM "product" ORDER BY id')).all():
+        index.setdefault(_norm_name(name), int(pid))
+    return index
+
+
+def _club_barcodes(cid: int) -> dict[str, int]:
+    rows = db.session.execute(
+        text('SELECT barcode, product_id FROM "club_product_barcode" WHERE club_id=:c'), {"c": cid}
+    ).all()
+    return {str(bc): int(pid) for bc, pid in rows}
+
+
+def _run_import(job, cid: int, path: str, filename: str) -> dict:
+    """
+    Фоновая задача: остатки из файла в текущую сессию клуба (создаёт её при необходимости).
+    Товар ищется по названию в индексе, собранном одним запросом; не нашёлся —
+    по штрих-кодам клуба (если в файле есть колонка «Артикулы»/barcode).
+    Файл читается пачками (read_batches), строки сессии пишутся executemany на каждую
+    пачку — в памяти не больше одной пачки строк файла; коммит один, в конце.
+    """
+    by_name: dict[str, int] | None = None
+    by_barcode: dict[str, int] | None = None  # грузится при первой строке, не найденной по названию
+    sess = None
+    existing: set[int] = set()  # товары, уже записанные в сессию
+
+    errors: list[str] = []
+    imported = 0
+    with open(path, 'rb') as fh:
+        for batch in job.track(read_batches(fh, filename, IMPORT_FIELDS)):
+            if not batch:
+                continue
+            if sess is None:
+                by_name = _product_index()
+                sess = _active_session(cid)
+                if not sess:
+                    sess = InventorySession(club_id=cid)
+                    db.session.add(sess); db.session.flush()
+                existing = {
+                    int(pid) for (pid,) in db.session.execute(
+                        text('SELECT product_id FROM "inventory_count" WHERE session_id=:s'), {"s": sess.id}
+                    ).all()
+                }
+
+            expected_by_pid: dict[int, int] = {}
+            for row in batch:
+                name = str(row.get('name') or '').strip()
+                if not name:
+                    errors.append('Пропущена строка: отсутствует название'); continue
+                expected = _parse_expected(row.get('expected_qty') or 0)
+                pid = by_name.get(_norm_name(name))
+                codes = parse_barcodes(row.get('barcode')) if pid is None else ()
+                if codes:
+                    if by_barcode is None:
+                        by_barcode = _club_barcodes(cid)
+                    pid = next((by_barcode[b] for b in codes if b in by_barcode), None)
+                if pid is None:
+                    if expected <= 0:
+                        continue
+                    errors.append(f'Не найден товар: "{name}"'); continue
+                expected_by_pid[pid] = expected  # повтор товара в файле — действует последняя строка
+                imported += 1
+
+            updates = [{"s": sess.id, "p": pid, "e": e} for pid, e in expected_by_pid.items() if pid in existing]
+            inserts = [{"s": sess.id, "p": pid, "e": e} for pid, e in expected_by_pid.items() if pid not in existing]
+            if updates:
+                db.session.execute(
+                    text('UPDATE "inventory_count" SET expected_qty=:e WHERE session_id=:s AND product_id=:p'), updates
+                )
+            if inserts:
+                db.session.execute(
+                    text('INSERT INTO "inventory_count"(session_id, product_id, expected_qty, counted_qty) VALUES (:s, :p, :e, 0)'),
+                    inserts,
+                )
+                existing.update(r["p"] for r in inserts)
+    if sess is None:
+        return {'empty': True}
+    db.session.commit()
+    return {'imported': imported, 'errors': errors}
 
 
 def _list_clubs():
-    rows = db.session.execute(text('SELECT id,name FROM "club" WHERE COALESCE(is_active,1)=1 ORDER BY name')).mappings().all()
+    rows = db.session.execute(text('SELECT id,name FROM "club" WHERE COALESCE(is_active,TRUE) ORDER BY name')).mappings().all()
     return rows
 
 
-def _items_for_session(cid: int, sess_id: int):
-    q = db.session.execute(text('''
-        SELECT ic.product_id AS id, p.name AS name, ic.expected_qty, COALESCE(ic.counted_qty,0) AS counted
-        FROM inventory_count ic JOIN product p ON p.id = ic.product_id
-        WHERE ic.session_id = :s
-        ORDER BY p.name
-    '''), {'s': sess_id}).mappings().all()
-    return list(q)
+# Сверка сессии одним запросом: долги и закупочные цены клуба — только по товарам сессии.
+# Недостача = (учёт − посчитано − в долгах) × закупочная цена; излишки дают минус.
+# Долги берутся только за окно сессии ({window}: от закрытия предыдущей сессии клуба
+# до закрытия этой) — по индексу ix_debt_transaction_club_created_product.
+_RECONCILE_SQL = '''
+    SELECT ic.product_id AS id, p.name AS name, ic.expected_qty, COALESCE(ic.counted_qty,0) AS counted,
+           COALESCE(d.q,0) AS debt_qty,
+           COALESCE(cb.pp, p.purchase_price, 0) AS price,
+           COALESCE(ic.expected_qty,0) - COALESCE(ic.counted_qty,0) - COALESCE(d.q,0) AS shortage_qty
+    FROM inventory_count ic
+    JOIN product p ON p.id = ic.product_id
+    LEFT JOIN (
+        SELECT product_id, SUM(qty) AS q
+        FROM debt_transaction
+        WHERE club_id = :c{window} AND product_id IN (SELECT product_id FROM inventory_count WHERE session_id = :s)
+        GROUP BY product_id
+    ) d ON d.product_id = ic.product_id
+    LEFT JOIN (
+        SELECT product_id, MAX(purchase_price) AS pp
+        FROM club_product_barcode
+        WHERE club_id = :c AND product_id IN (SELECT product_id FROM inventory_count WHERE session_id = :s)
+        GROUP BY product_id
+    ) cb ON cb.product_id = ic.product_id
+    WHERE ic.session_id = :s
+    ORDER BY p.name
+'''
+
+
+def _window_sql(since, until) -> str:
+    return (' AND created_at >= :d1' if since else '') + (' AND created_at < :d2' if until else '')
+
+
+hot_query('inventory.reconcile', _RECONCILE_SQL.format(window=_window_sql(True, True)),
+          c=1, s=1, d1='2025-01-01 00:00:00', d2='2025-02-01 00:00:00')
+hot_query('inventory.reconcile_first', _RECONCILE_SQL.format(window=_window_sql(None, True)),
+          c=1, s=1, d2='2025-02-01 00:00:00')
+
+_PREV_CLOSE_SQL = hot_query('inventory.prev_close', '''
+    SELECT MAX(closed_at) FROM "inventory_session"
+    WHERE club_id = :c AND id < :s AND closed_at IS NOT NULL
+''', c=1, s=1)
+
+
+def _ts(v) -> str | None:
+    if v is None:
+        return None
+    return v.isoformat(sep=' ') if isinstance(v, datetime) else str(v)
+
+
+def _debt_window(sess: InventorySession) -> tuple[str | None, str | None]:
+    """[закрытие предыдущей сессии клуба, закрытие этой); None — без границы."""
+    since = db.session.execute(text(_PREV_CLOSE_SQL), {'c': sess.club_id, 's': sess.id}).scalar()
+    return _ts(since), _ts(sess.closed_at)
+
+
+_SNAPSHOT_COLS = ('product_id', 'name', 'expected_qty', 'counted_qty', 'debt_qty', 'price', 'shortage_qty', 'shortage')
 
 
-def _debts_qty(cid: int) -> dict[int, int]:
+def _snapshot_items(sess_id: int) -> list[dict]:
     rows = db.session.execute(text('''
-        SELECT product_id, COALESCE(SUM(qty),0) AS q
-        FROM debt_transaction
-        WHERE club_id = :c
-        GROUP BY product_id
-    '''), {'c': cid}).all()
-    return {int(r[0]): int(r[1]) for r in rows}
+        SELECT product_id AS id, name, expected_qty, counted_qty AS counted, debt_qty, price, shortage_qty, shortage
+        FROM "inventory_snapshot_item" WHERE session_id = :s
+        ORDER BY name
+    '''), {'s': sess_id}).mappings().all()
+    return [dict(r, price=float(r['price'] or 0), shortage=float(r['shortage'] or 0)) for r in rows]
+
+
+def _write_snapshot(sess_id: int, items: list[dict]) -> None:
+    db.session.execute(text('DELETE FROM "inventory_snapshot_item" WHERE session_id=:s'), {'s': sess_id})
+    if items:
+        db.session.execute(
+            text(f'''INSERT INTO "inventory_snapshot_item"(session_id, {", ".join(_SNAPSHOT_COLS)})
+                    VALUES (:session_id, {", ".join(":" + c for c in _SNAPSHOT_COLS)})'''),
+            [{'session_id': sess_id, 'product_id': it['id'], 'name': it['name'],
+              'expected_qty': it['expected_qty'], 'counted_qty': it['counted'], 'debt_qty': it['debt_qty'],
+              'price': it['price'], 'shortage_qty': it['shortage_qty'], 'shortage': round(it['shortage'], 2)}
+             for it in items],
+        )
+
+
+def _reconcile(cid: int, sess: InventorySession) -> tuple[list[dict], float]:
+    """
+    Строки сессии (id, name, expected_qty, counted, debt_qty, price, shortage_qty, shortage)
+    и сумма недостачи. Только чтение: закрытая сессия читается из снимка; если снимка
+    нет (закрыта до появления снимков, см. flask inventory-snapshots) — считается на лету.
+    """
+    if sess.closed_at is not None:
+        items = _snapshot_items(sess.id)
+        if items or sess.snapshot_at is not None:
+            return items, round(sum(it['shortage'] for it in items), 2)
+
+    since, until = _debt_window(sess)
+    items = []
+    for r in db.session.execute(text(_RECONCILE_SQL.format(window=_window_sql(since, until))),
+                                {'c': cid, 's': sess.id, 'd1': since, 'd2': until}).mappings():
+        it = dict(r)
+        it['debt_qty'] = int(it['debt_qty'] or 0)
+        it['price'] = float(it['price'] or 0)
+        it['shortage'] = int(it['shortage_qty'] or 0) * it['price']
+        items.append(it)
+    return items, round(sum(it['shortage'] for it in items), 2)
 
 
 def _month_bounds_from_session(sess: InventorySession | None):
@@ -193,44 +314,31 @@ def _month_bounds_from_session(sess: InventorySession | None):
     return d1, d2, total_shifts_in_month
 
 
-def _purchase_prices_map(cid: int) -> dict[int, float]:
-    rows = db.session.execute(text('''
-        SELECT p.id, COALESCE(MAX(cb.purchase_price), COALESCE(p.purchase_price,0)) AS pp
-        FROM product p
-        LEFT JOIN club_product_barcode cb ON cb.product_id = p.id AND cb.club_id = :c
-        GROUP BY p.id
-    '''), {'c': cid}).all()
-    return {int(r[0]): float(r[1] or 0) for r in rows}
-
-
-def _admin_stats(cid: int, sess: InventorySession | None, items: list[dict], debts_map: dict[int, int]) -> tuple[list[dict], float]:
-    d1, d2, total_shifts = _month_bounds_from_session(sess)
-    price_map = _purchase_prices_map(cid)
-    shortage_value = 0.0
-    for it in items:
-        pid = int(it['id'])
-        expected = int(it.get('expected_qty') or 0)
-        counted = int(it.get('counted') or 0)
-        debt_q = int(debts_map.get(pid, 0) or 0)
-        # Суммируем с учетом знака: излишки (отрицательная недосдача) уменьшают общую сумму
-        shortage_units = (expected - counted - debt_q)
-        shortage_value += shortage_units * float(price_map.get(pid, 0.0))
-
-    # Учитываем владельцев и администраторов клуба, а также superadmin,
-    # если он выходил на смены в этом клубе в выбранном месяце.
-    rows = db.session.execute(text('''
+# Учитываем владельцев и администраторов клуба, а также superadmin,
+# если он выходил на смены в этом клубе в выбранном месяце. Кандидаты берутся из
+# членств и смен клуба (по индексам), а не перебором всех пользователей.
+_ADMIN_SHIFTS_SQL = hot_query('inventory.admin_shifts', '''
         SELECT u.id, COALESCE(u.full_name,u.username) AS name, COUNT(s.id) AS shifts
         FROM "user" u
-        LEFT JOIN "user_club" m ON m.user_id = u.id AND m.club_id = :c
-        LEFT JOIN shift s ON s.user_id = u.id AND s.club_id = :c AND date(s.start_ts) >= :d1 AND date(s.start_ts) < :d2
-        WHERE (m.role IN ('owner','club_admin'))
-           OR (u.role = 'superadmin' AND EXISTS (
-                SELECT 1 FROM shift sx
-                WHERE sx.user_id = u.id AND sx.club_id = :c AND date(sx.start_ts) >= :d1 AND date(sx.start_ts) < :d2
-           ))
+        LEFT JOIN shift s ON s.user_id = u.id AND s.club_id = :c AND s.start_ts >= :t1 AND s.start_ts < :t2
+        WHERE u.id IN (
+            SELECT m.user_id FROM "user_club" m
+            WHERE m.club_id = :c AND m.role IN ('owner','club_admin')
+            UNION
+            SELECT sx.user_id FROM shift sx
+            JOIN "user" su ON su.id = sx.user_id AND su.role = 'superadmin'
+            WHERE sx.club_id = :c AND sx.start_ts >= :t1 AND sx.start_ts < :t2
+        )
         GROUP BY u.id, name
         ORDER BY name
-    '''), {'c': cid, 'd1': d1.isoformat(), 'd2': d2.isoformat()}).mappings().all()
+''', c=1, t1='2025-01-01 00:00:00', t2='2025-02-01 00:00:00')
+
+
+def _admin_stats(cid: int, sess: InventorySession | None, shortage_value: float) -> list[dict]:
+    """Доли администраторов в недостаче пропорционально сменам за месяц сессии."""
+    d1, d2, total_shifts = _month_bounds_from_session(sess)
+    rows = db.session.execute(text(_ADMIN_SHIFTS_SQL),
+                              {'c': cid, 't1': ts_bound(d1), 't2': ts_bound(d2)}).mappings().all()
 
     stats: list[dict] = []
     for r in rows:
@@ -238,39 +346,144 @@ def _admin_stats(cid: int, sess: InventorySession | None, items: list[dict], deb
         share = (cnt / float(total_shifts)) if total_shifts else 0.0
         allocated = round(shortage_value * share, 2)
         stats.append({'user_id': int(r['id']), 'name': r['name'], 'shifts': cnt, 'share': share, 'allocated': allocated})
-    return stats, round(shortage_value, 2)
+    return stats
+
+
+def _snapshot_admins(sess_id: int) -> list[dict]:
+    rows = db.session.execute(text('''
+        SELECT user_id, name, shifts, share, allocated
+        FROM "inventory_snapshot_admin" WHERE session_id = :s
+        ORDER BY name
+    '''), {'s': sess_id}).mappings().all()
+    return [dict(r, share=float(r['share'] or 0), allocated=float(r['allocated'] or 0)) for r in rows]
+
+
+def _session_snapshot(cid: int, sess: InventorySession) -> tuple[list[dict], float, list[dict]]:
+    """
+    Строки сверки, сумма недостачи и распределение по администраторам закрытой сессии —
+    из снимка (_store_snapshot); у сессии без снимка считаются на лету. Только чтение.
+    """
+    items, total = _reconcile(cid, sess)
+    admins = _snapshot_admins(sess.id)
+    if not admins and sess.snapshot_at is None:
+        admins = _admin_stats(cid, sess, total)
+    return items, total, admins
+
+
+def _store_snapshot(cid: int, sess: InventorySession) -> None:
+    """
+    Зафиксировать снимок закрытой сессии: строки сверки и распределение — в одной
+    транзакции вызывающего (без commit). Уже сохранённые части старых сессий не
+    пересчитываются; snapshot_at отмечает готовый снимок, в том числе пустой.
+    """
+    if sess.snapshot_at is not None:
+        return
+    items, total, admins = _session_snapshot(cid, sess)
+    _write_snapshot(sess.id, items)
+    db.session.execute(text('DELETE FROM "inventory_snapshot_admin" WHERE session_id=:s'), {'s': sess.id})
+    if admins:
+        db.session.execute(
+            text('''INSERT INTO "inventory_snapshot_admin"(session_id, user_id, name, shifts, share, allocated)
+                    VALUES (:s, :user_id, :name, :shifts, :share, :allocated)'''),
+            [{'s': sess.id, 'user_id': a['user_id'], 'name': a['name'] or '', 'shifts': a['shifts'],
+              'share': a['share'], 'allocated': a['allocated']} for a in admins],
+        )
+    sess.snapshot_at = datetime.utcnow()
+
+
+def _closed_sessions(cid: int) -> list[dict]:
+    rows = db.session.execute(text('''
+        SELECT s.id, s.started_at, s.closed_at, s.snapshot_at,
+               COUNT(si.id) AS items, COALESCE(SUM(si.shortage),0) AS shortage
+        FROM "inventory_session" s
+        LEFT JOIN "inventory_snapshot_item" si ON si.session_id = s.id
+        WHERE s.club_id = :c AND s.closed_at IS NOT NULL
+        GROUP BY s.id, s.started_at, s.closed_at, s.snapshot_at
+        ORDER BY s.closed_at DESC, s.id DESC
+    '''), {'c': cid}).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def _diff_rows(a_items: list[dict], b_items: list[dict]) -> list[dict]:
+    """Построчное сравнение двух снимков по товару: a — раньше, b — позже."""
+    a_map = {int(it['id']): it for it in a_items}
+    b_map = {int(it['id']): it for it in b_items}
+    out = []
+    for pid in a_map.keys() | b_map.keys():
+        a, b = a_map.get(pid), b_map.get(pid)
+        out.append({
+            'id': pid,
+            'name': (b or a)['name'],
+            'a': a,
+            'b': b,
+            'd_qty': int((b or {}).get('shortage_qty') or 0) - int((a or {}).get('shortage_qty') or 0),
+            'd_sum': round(float((b or {}).get('shortage') or 0) - float((a or {}).get('shortage') or 0), 2),
+        })
+    out.sort(key=lambda r: str(r['name']).casefold())
+    return out
+
+
+_SAVE_COUNT_SQL = hot_query(
+    'inventory.count_update',
+    'UPDATE "inventory_count" SET counted_qty=:q WHERE session_id=:s AND product_id=:p',
+    q=1, s=1, p=1,
+)
+
+_SESSION_PRODUCTS_SQL = hot_query(
+    'inventory.count_products',
+    text('SELECT product_id FROM "inventory_count" WHERE session_id=:s AND product_id IN :ids')
+    .bindparams(bindparam('ids', expanding=True)),
+    s=1, ids=[1, 2],
+)
 
 
 @bp.post('/save')
 @login_required
 @roles_required("superadmin", "owner")
 def save():
-    cid = get_active_club_id(current_user)
+    """
+    Подсчёт по сессии: rows = [{product_id, fridge, store}] — только изменённые
+    строки (клиент шлёт разницу с последним сохранением). Все строки — одним executemany;
+    saved — число записанных строк (товары не из сессии пропускаются).
+    """
+    try:
+        payload = request.get_json(force=True) or {}
+    except Exception:
+        payload = {}
+    try:
+        cid = int(payload.get('club_id') or 0) or get_active_club_id(current_user)
+    except (TypeError, ValueError):
+        cid = 0
     if not cid or cid not in allowed_club_ids(current_user):
         return jsonify({'ok': False, 'error': 'forbidden'}), 403
     sess = _active_session(cid)
     if not sess:
         return jsonify({'ok': False, 'error': 'no_session'}), 400
 
-    try:
-        payload = request.get_json(force=True) or {}
-    except Exception:
-        payload = {}
-    rows = payload.get('rows') or []
-    saved = 0
-    for r in rows:
+    counts: dict[int, int] = {}
+    for r in payload.get('rows') or []:
         try:
             pid = int(r.get('product_id') or 0)
             fridge = int(r.get('fridge') or 0)
             store = int(r.get('store') or 0)
         except Exception:
             continue
-        total = max(fridge, 0) + max(store, 0)
-        db.session.execute(text('UPDATE "inventory_count" SET counted_qty=:q WHERE session_id=:s AND product_id=:p'),
-                           {'q': total, 's': sess.id, 'p': pid})
-        saved += 1
-    db.session.commit()
-    return jsonify({'ok': True, 'saved': saved})
+        if pid:
+            counts[pid] = max(fridge, 0) + max(store, 0)
+    if counts:
+        in_session = {
+            int(pid) for (pid,) in db.session.execute(
+                _SESSION_PRODUCTS_SQL, {'s': sess.id, 'ids': list(counts)}
+            ).all()
+        }
+        counts = {pid: q for pid, q in counts.items() if pid in in_session}
+    if counts:
+        db.session.execute(
+            text(_SAVE_COUNT_SQL),
+            [{'q': q, 's': sess.id, 'p': pid} for pid, q in counts.items()],
+        )
+        db.session.commit()
+    return jsonify({'ok': True, 'saved': len(counts)})
 
 
 @bp.post('/reset-session')
@@ -309,8 +522,176 @@ def close_session():
     if not sess:
         flash('Нет активной сессии.', 'warning')
         return redirect(url_for('inventory.index', club_id=cid))
-    sess.closed_at = datetime.utcnow()
-    db.session.add(sess)
+    # Всё закрытие — одна транзакция с единственным commit в конце. Первым шагом сессия
+    # захватывается условным UPDATE: повторное или параллельное закрытие её не найдёт
+    # и не проведёт корректировки остатков второй раз.
+    claimed = db.session.execute(
+        text('UPDATE "inventory_session" SET closed_at=:t WHERE id=:s AND closed_at IS NULL'),
+        {'t': datetime.utcnow(), 's': sess.id},
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        flash('Сессия уже закрыта.', 'warning')
+        return redirect(url_for('inventory.index', club_id=cid))
+    db.session.refresh(sess)
+    # остатки склада = посчитанное на инвентаризации (корректирующие движения журнала)
+    counted = db.session.execute(
+        text('SELECT product_id, COALESCE(counted_qty,0) FROM "inventory_count" WHERE session_id=:s'), {'s': sess.id}
+    ).all()
+    set_levels(cid, {int(pid): int(q) for pid, q in counted}, 'inventory')
+    checkpoint(cid)  # снимок журнала (с отставанием STOCK_CHECKPOINT_LAG)
+    _store_snapshot(cid, sess)  # снимок сверки и распределения
+    db.session.commit()
+    flash('Сессия закрыта, остатки склада приведены к посчитанным. Создайте новую импортом файла или по складскому журналу.', 'primary')
+    return redirect(url_for('inventory.index', club_id=cid))
+
+
+@bp.post('/start-from-ledger')
+@login_required
+@roles_required("superadmin", "owner")
+def start_from_ledger():
+    """Новая сессия с учётными остатками из складского журнала (без загрузки файла)."""
+    try:
+        cid = int(request.form.get('club_id') or request.args.get('club_id') or 0)
+    except Exception:
+        cid = 0
+    if not cid or cid not in allowed_club_ids(current_user):
+        flash('Недостаточно прав для действия.', 'warning')
+        return redirect(url_for('inventory.index', club_id=cid or None))
+    if _active_session(cid):
+        flash('Сначала закройте текущую сессию.', 'warning')
+        return redirect(url_for('inventory.index', club_id=cid))
+    # журнал знает остатки только после первой инвентаризации (закрытие приводит склад к посчитанному);
+    # до неё в нём лишь приходы и долги без начальных остатков
+    if not ledger_opened(cid):
+        flash('Складской журнал клуба ещё не открыт: проведите первую инвентаризацию по файлу остатков.', 'warning')
+        return redirect(url_for('inventory.index', club_id=cid))
+
+    sess = InventorySession(club_id=cid)
+    db.session.add(sess); db.session.flush()
+    # журнал уже уменьшен на долги окна сессии, а сверка вычитает их ещё раз — добавляем их к учёту
+    since, _until = _debt_window(sess)
+    rows = db.session.execute(text(f'''
+        SELECT st.product_id, COALESCE(st.qty,0) + COALESCE(d.q,0)
+        FROM "stock" st
+        LEFT JOIN (
+            SELECT product_id, SUM(qty) AS q FROM "debt_transaction"
+            WHERE club_id = :c{' AND created_at >= :d1' if since else ''}
+            GROUP BY product_id
+        ) d ON d.product_id = st.product_id
+        WHERE st.club_id = :c
+    '''), {'c': cid, 'd1': since}).all()
+    if not rows:
+        db.session.rollback()
+        flash('В складском журнале клуба нет остатков.', 'warning')
+        return redirect(url_for('inventory.index', club_id=cid))
+    db.session.execute(
+        text('INSERT INTO "inventory_count"(session_id, product_id, expected_qty, counted_qty) VALUES (:s, :p, :e, 0)'),
+        [{'s': sess.id, 'p': int(pid), 'e': int(q)} for pid, q in rows],
+    )
     db.session.commit()
-    flash('Сессия закрыта. Создайте новую импортом файла.', 'primary')
+    flash(f'Сессия создана по складскому журналу: позиций {len(rows)}.', 'primary')
     return redirect(url_for('inventory.index', club_id=cid))
+
+
+@bp.get('/history')
+@login_required
+@roles_required("superadmin", "owner")
+def history():
+    """История закрытых сессий клуба и сравнение двух сессий по товарам (из снимков)."""
+    try:
+        cid = int(request.args.get('club_id') or 0)
+    except Exception:
+        cid = 0
+    if not cid or cid not in allowed_club_ids(current_user):
+        return render_template('inventory/history.html', clubs=_list_clubs(), club_id=0, sessions=[])
+
+    # только чтение: сессии без снимка (закрыты до снимков) считаются на лету при сравнении
+    sessions = _closed_sessions(cid)
+    ids = [s['id'] for s in sessions]
+    try:
+        b_id = int(request.args.get('b') or 0) or (ids[0] if ids else 0)
+        a_id = int(request.args.get('a') or 0) or next((i for i in ids if i != b_id), 0)
+    except ValueError:
+        a_id = b_id = 0
+    if a_id not in ids or b_id not in ids:
+        a_id = b_id = 0
+
+    compare = None
+    if a_id and b_id:
+        a_items, a_total, a_admins = _session_snapshot(cid, db.session.get(InventorySession, a_id))
+        b_items, b_total, b_admins = _session_snapshot(cid, db.session.get(InventorySession, b_id))
+        admins: dict[int, dict] = {}
+        for side, rows in (('a', a_admins), ('b', b_admins)):
+            for r in rows:
+                admins.setdefault(int(r['user_id']), {'name': r['name']})[side] = r
+        compare = {
+            'a_total': a_total,
+            'b_total': b_total,
+            'rows': _diff_rows(a_items, b_items),
+            'admins': sorted(admins.values(), key=lambda r: str(r['name']).casefold()),
+        }
+    return render_template('inventory/history.html', clubs=_list_clubs(), club_id=cid, sessions=sessions,
+                           sessions_by_id={s['id']: s for s in sessions}, a_id=a_id, b_id=b_id, compare=compare)
+
+
+@click.command('inventory-snapshots')
+@with_appcontext
+def inventory_snapshots_command() -> None:
+    """Снять снимки закрытых сессий, закрытых до появления снимков (по транзакции на сессию)."""
+    ids = db.session.execute(text(
+        'SELECT id FROM "inventory_session" WHERE closed_at IS NOT NULL AND snapshot_at IS NULL ORDER BY id'
+    )).scalars().all()
+    for sid in ids:
+        sess = db.session.get(InventorySession, sid)
+        _store_snapshot(sess.club_id, sess)
+        db.session.commit()
+    click.echo(f'Снимков создано: {len(ids)}')
+
+
+def _parse_at(raw: str | None) -> datetime | None:
+    """'YYYY-MM-DD' — конец дня (движения этого дня включены), 'YYYY-MM-DDTHH:MM[:SS]' — момент; UTC."""
+    raw = (raw or '').strip()
+    if not raw:
+        return datetime.utcnow()
+    try:
+        if len(raw) == 10:
+            return datetime.fromisoformat(ts_bound(date.fromisoformat(raw) + timedelta(days=1)))
+        return datetime.fromisoformat(raw)
+    except ValueError:
+        return None
+
+
+@bp.get('/api/stock')
+@login_required
+@roles_required("superadmin", "owner")
+def api_stock():
+    """Остатки клуба на дату по складскому журналу: ?club_id=&at=YYYY-MM-DD[THH:MM]&product_id=."""
+    try:
+        cid = int(request.args.get('club_id') or 0) or get_active_club_id(current_user)
+        product_id = int(request.args.get('product_id') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'ok': False, 'error': 'bad_request'}), 400
+    if not cid or cid not in allowed_club_ids(current_user):
+        return jsonify({'ok': False, 'error': 'forbidden'}), 403
+    at = _parse_at(request.args.get('at'))
+    if at is None:
+        return jsonify({'ok': False, 'error': 'bad_date'}), 400
+
+    levels, cp = levels_at(cid, at, [product_id] if product_id else None)
+    if product_id:
+        levels.setdefault(product_id, 0)
+    else:
+        levels = {pid: q for pid, q in levels.items() if q}
+    names = {}
+    if levels:
+        names = {int(pid): name for pid, name in db.session.execute(
+            text('SELECT id, name FROM "product" WHERE id IN :ids').bindparams(bindparam('ids', expanding=True)),
+            {'ids': list(levels)},
+        ).all()}
+    items = sorted(
+        ({'product_id': pid, 'name': names.get(pid, ''), 'qty': q} for pid, q in levels.items()),
+        key=lambda r: str(r['name']).casefold(),
+    )
+    return jsonify({'ok': True, 'club_id': cid, 'at': _ts(at), 'checkpoint': _ts(cp), 'items': items})
+
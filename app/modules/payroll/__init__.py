@@ -2,7 +2,7 @@
 
 from flask import Blueprint, render_template
 from flask_login import login_required
-bp = Blueprint("payroll", __name__, template_folder="../../templates/payroll")
+bp = Blueprint("payroll", __name__, url_prefix="/payroll", template_folder="../../templates/payroll")
 
 @bp.route("/")
 @login_required
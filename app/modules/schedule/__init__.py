@@ -6,13 +6,16 @@ from collections import defaultdict
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
-from sqlalchemy import text
+from sqlalchemy import literal, text
 
 from ...extensions import db
+from ... import schema
+from ...sqlcompat import ts_bound
+from ...query_advisor import hot_query
 from ...models import User
 from ...models.schedule import Shift
 from ...models.report import CashierReport
-from ...acl import get_active_club_id, allowed_club_ids
+from ...acl import get_active_club_id, allowed_club_ids, membership_role
 
 bp = Blueprint(
     "schedule",
@@ -51,6 +54,15 @@ def _display_name(u: User) -> str:
 def _sorted(users):
     return sorted(users, key=lambda x: _display_name(x).lower())
 
+def _ensure_shift_table() -> None:
+    if schema.has_table("shift"):
+        return
+    try:
+        db.session.execute(text('SELECT 1 FROM "shift" LIMIT 1'))
+    except Exception:
+        db.create_all()
+    schema.mark("shift")
+
 @bp.route("/")
 @login_required
 def index():
@@ -79,7 +91,7 @@ def index():
     member_ids = {
         r[0]
         for r in db.session.execute(
-            text('SELECT user_id FROM "user_club" WHERE club_id=:c AND role IN ("owner","club_admin","staff")'),
+            text('SELECT user_id FROM "user_club" WHERE club_id=:c AND role IN (\'owner\',\'club_admin\',\'staff\')'),
             {"c": cid},
         ).all()
     }
@@ -109,15 +121,9 @@ def index():
         prefill[f"{uid}:{dt.isoformat()}"] = {"start": start_t, "end": end_t, "both": both}
 
     # Override with saved shifts if present for this month/club
-    saved = (
-        db.session.query(Shift)
-        .filter(
-            Shift.club_id == cid,
-            Shift.start_ts >= datetime(d1.year, d1.month, 1),
-            Shift.start_ts < datetime(d2.year, d2.month, 1),
-        )
-        .all()
-    )
+    # (границы — строкой в формате записи, иначе в SQLite смена ровно в 00:00
+    #  первого числа не попадает в ">= '... 00:00:00.000000'")
+    saved = _month_shifts(cid, d1, d2).all()
     for s in saved:
         day = s.start_ts.date()
         key = f"{s.user_id}:{day.isoformat()}"
@@ -130,10 +136,7 @@ def index():
 
     # editor capabilities for current user
     my_uid = getattr(current_user, "id", 0)
-    my_mrole = db.session.execute(
-        text('SELECT role FROM "user_club" WHERE user_id=:u AND club_id=:c'),
-        {"u": my_uid, "c": cid},
-    ).scalar() or ""
+    my_mrole = _membership_role(current_user, cid) or ""
     editable_all = (getattr(current_user, "role", "") == "superadmin") or (my_mrole == "owner")
     editable_self_only = (not editable_all) and (my_mrole == "club_admin")
 
@@ -150,12 +153,25 @@ def index():
     )
 
 
-def _membership_role(user_id: int, club_id: int) -> str | None:
-    row = db.session.execute(
-        text('SELECT role FROM "user_club" WHERE user_id=:u AND club_id=:c'),
-        {"u": int(user_id), "c": int(club_id)},
-    ).first()
-    return (row[0] if row else None) or None
+def _month_shifts(cid: int, d1: date, d2: date):
+    return db.session.query(Shift).filter(
+        Shift.club_id == cid,
+        Shift.start_ts >= literal(ts_bound(d1)),
+        Shift.start_ts < literal(ts_bound(d2)),
+    )
+
+
+hot_query("schedule.month_shifts", lambda: _month_shifts(1, date(2025, 1, 1), date(2025, 2, 1)))
+
+_DELETE_DAY_SQL = hot_query(
+    "schedule.delete_user_day",
+    'DELETE FROM "shift" WHERE club_id=:c AND user_id=:u AND start_ts>=:t1 AND start_ts<:t2',
+    c=1, u=1, t1="2025-01-01 00:00:00", t2="2025-01-02 00:00:00",
+)
+
+
+def _membership_role(user, club_id: int) -> str | None:
+    return membership_role(user, club_id) or None
 
 
 def _can_edit_row(target_user_id: int, club_id: int) -> bool:
@@ -166,7 +182,7 @@ def _can_edit_row(target_user_id: int, club_id: int) -> bool:
     if club_id not in allowed_club_ids(current_user):
         return False
     # owner of club may edit anyone in their club
-    mrole = _membership_role(getattr(current_user, "id", 0), club_id)
+    mrole = _membership_role(current_user, club_id)
     if mrole == "owner":
         return True
     # club_admin may edit only their own row
@@ -201,16 +217,17 @@ def save_one():
     if not _can_edit_row(uid, cid):
         return jsonify({"ok": False, "error": "forbidden"}), 403
 
-    # ensure table exists
+    _ensure_shift_table()
+
     try:
-        db.session.execute(text('SELECT 1 FROM "shift" LIMIT 1'))
-    except Exception:
-        db.create_all()
+        day = date.fromisoformat(date_str)
+    except ValueError:
+        return jsonify({"ok": False, "error": "bad_request"}), 400
 
     # delete any previous record for this day
     del_res = db.session.execute(
-        text('DELETE FROM "shift" WHERE club_id=:c AND user_id=:u AND date(start_ts)=:d'),
-        {"c": cid, "u": uid, "d": date_str},
+        text(_DELETE_DAY_SQL),
+        {"c": cid, "u": uid, "t1": ts_bound(day), "t2": ts_bound(day + timedelta(days=1))},
     )
 
     # insert if provided
@@ -257,16 +274,12 @@ def save():
     m = payload.get("month") or request.args.get("m")
     d1, d2, _ = _month_bounds(m)
 
-    # Ensure table exists (first run)
-    try:
-        db.session.execute(text('SELECT 1 FROM "shift" LIMIT 1'))
-    except Exception:
-        db.create_all()
+    _ensure_shift_table()
 
     # Delete existing for month+club (simple upsert strategy)
     db.session.execute(
-        text('DELETE FROM "shift" WHERE club_id=:c AND date(start_ts)>=:d1 AND date(start_ts)<:d2'),
-        {"c": cid, "d1": d1.isoformat(), "d2": d2.isoformat()},
+        text('DELETE FROM "shift" WHERE club_id=:c AND start_ts>=:t1 AND start_ts<:t2'),
+        {"c": cid, "t1": ts_bound(d1), "t2": ts_bound(d2)},
     )
 
     rows = payload.get("rows") or []
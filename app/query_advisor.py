@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Советник по индексам: прогоняет EXPLAIN по «горячим» запросам приложения
+и показывает полные сканы таблиц.
+
+Запуск:
+  flask explain-hot            # только проблемные запросы
+  flask explain-hot --verbose  # план каждого запроса
+
+Горячие запросы регистрируются через hot_query() там же, где объявлены: в
+реестр попадает тот самый оператор, который выполняет код (строка SQL, text(),
+select()/Query или функция, которая его строит), поэтому советник и код не
+расходятся. Параметры — любые правдоподобные значения, важен только план.
+Реестр заполняется при импорте модулей, т.е. после create_app().
+"""
+from __future__ import annotations
+
+import re
+from typing import Any
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, text
+from sqlalchemy.sql.elements import ClauseElement, TextClause
+
+from .extensions import db
+
+HOT_QUERIES: dict[str, tuple[Any, dict]] = {}
+
+
+def hot_query(name: str, stmt, **params):
+    """Зарегистрировать запрос для explain-hot; возвращает stmt как есть."""
+    HOT_QUERIES[name] = (stmt, params)
+    return stmt
+
+
+def render(stmt, params: dict) -> str:
+    """SQL зарегистрированного запроса под текущий диалект, с подставленными параметрами."""
+    if callable(stmt) and not isinstance(stmt, (str, ClauseElement)):
+        stmt = stmt()
+    if isinstance(stmt, str):
+        stmt = text(stmt)
+    stmt = getattr(stmt, "statement", stmt)  # ORM Query -> select()
+    if isinstance(stmt, TextClause) and params:
+        # тип параметра — по значению (списки — раскрывающиеся IN :ids), иначе literal_binds не отрисует
+        stmt = stmt.bindparams(*(bindparam(k, v, expanding=isinstance(v, (list, tuple))) for k, v in params.items()))
+    compiled = stmt.compile(
+        dialect=db.session.get_bind().dialect,
+        compile_kwargs={"literal_binds": True, "render_postcompile": True},
+    )
+    return str(compiled)
+
+
+
+# --- анализ планов ---
+# SQLite пишет в плане псевдоним, если он есть: "SCAN u", старые версии — "SCAN TABLE user AS u";
+# "SCAN x USING [COVERING] INDEX" — обход индекса, не полный скан
+_SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?\s*$")
+_SQLITE_DERIVED = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (?:SUBQUERY \d+ AS )?(\w+)")
+_PG_SCAN = re.compile(r"Seq Scan on (\w+)")
+# источники в SQL: FROM/JOIN "table" [AS] alias и подзапросы ") [AS] alias"
+_SQL_SOURCE = re.compile(r"\b(?:FROM|JOIN)\s+\"?(\w+)\"?(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_SQL_DERIVED = re.compile(r"\)\s*(?:AS\s+)?(\w+)", re.IGNORECASE)
+_SQL_WORDS = {"where", "on", "join", "left", "right", "inner", "outer", "cross", "group", "order",
+              "limit", "union", "using", "natural", "full", "having", "set", "values", "select"}
+
+
+def explain(sql: str) -> list[str]:
+    conn = db.session.connection()
+    if conn.dialect.name == "sqlite":
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql).all()
+        return [str(r[-1]) for r in rows]
+    rows = conn.exec_driver_sql("EXPLAIN " + sql).all()
+    return [str(r[0]) for r in rows]
+
+
+def _sources(sql: str) -> tuple[dict[str, str], set[str]]:
+    """Псевдонимы таблиц {alias: table} и имена подзапросов из текста запроса."""
+    aliases: dict[str, str] = {}
+    for table, alias in _SQL_SOURCE.findall(sql):
+        aliases.setdefault(table, table)
+        if alias and alias.lower() not in _SQL_WORDS:
+            aliases[alias] = table
+    derived = {d for d in _SQL_DERIVED.findall(sql) if d.lower() not in _SQL_WORDS}
+    return aliases, derived
+
+
+def full_scans(plan: list[str], sql: str = "") -> list[str]:
+    """
+    Таблицы, которые читаются целиком (без индекса); псевдонимы разворачиваются по
+    тексту запроса. Обход подзапроса/CTE — не скан таблицы; неизвестное имя не отбрасывается.
+    """
+    aliases, derived = _sources(sql)
+    derived |= {m.group(1) for m in map(_SQLITE_DERIVED.match, (l.strip() for l in plan)) if m}
+    out = []
+    for line in plan:
+        m = _SQLITE_SCAN.match(line.strip())
+        if m:
+            name = m.group(2) or m.group(1)
+            table = aliases.get(name, m.group(1) if m.group(2) else name)
+            if name in derived and table not in db.metadata.tables:
+                continue
+            out.append(table)
+            continue
+        m = _PG_SCAN.search(line)
+        if m:
+            out.append(m.group(1))
+    return out
+
+
+@click.command("explain-hot")
+@click.option("--verbose", "-v", is_flag=True, help="Печатать план каждого запроса.")
+@with_appcontext
+def explain_hot_command(verbose: bool) -> None:
+    """EXPLAIN по горячим запросам; код выхода 1, если есть полные сканы."""
+    flagged = 0
+    for name, (stmt, params) in HOT_QUERIES.items():
+        try:
+            sql = render(stmt, params)
+            plan = explain(sql)
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"[skip] {name}: {e.__class__.__name__}: {e}")
+            continue
+        scans = full_scans(plan, sql)
+        if scans:
+            flagged += 1
+            click.echo(f"[SCAN] {name}: полный скан {', '.join(sorted(set(scans)))}")
+        elif verbose:
+            click.echo(f"[ ok ] {name}")
+        if verbose or scans:
+            for line in plan:
+                click.echo(f"         {line}")
+    click.echo(f"Проверено запросов: {len(HOT_QUERIES)}, с полными сканами: {flagged}")
+    if flagged:
+        raise SystemExit(1)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Однократная проверка схемы БД при старте процесса.
+
+create_app() вызывает bootstrap(): найденные таблицы и колонки запоминаются
+в реестре, отсутствующие таблицы моделей попадают в лог. DDL при старте не
+выполняется — схему меняют миграции (flask db upgrade) или явный запуск
+scripts/ensure_schema.py (ensure_schema()). Хелперы вида _ensure_*() сверяются
+с реестром и на горячем пути в БД не ходят; если реестр пуст (bootstrap
+выключен или упал), они работают по-старому.
+
+После миграций flask db upgrade сдвигает общую версию схемы (mtime файла
+instance/schema.version, как instance/acl.version у кэша ACL); запущенные
+воркеры замечают это перед запросом (check_shared_version) и перечитывают реестр
+без перезапуска.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Iterable
+
+from flask import current_app
+from sqlalchemy import inspect
+
+from .extensions import db
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_columns: dict[str, set[str]] = {}
+_bound_url: str | None = None
+_listeners: list[Callable[[], None]] = []
+_seen_shared: int | None = None  # версия схемы, по которой собран реестр
+
+
+def is_ready() -> bool:
+    return _bound_url is not None
+
+
+def has_table(name: str) -> bool:
+    """True, только если таблица точно есть (по данным реестра)."""
+    return name in _columns
+
+
+def columns(name: str) -> set[str] | None:
+    """Колонки таблицы из реестра; None — реестр о таблице ничего не знает."""
+    cols = _columns.get(name)
+    return set(cols) if cols is not None else None
+
+
+def has_column(table: str, column: str) -> bool:
+    return column in _columns.get(table, ())
+
+
+def mark(table: str, cols: Iterable[str] = ()) -> None:
+    """Отметить таблицу (и колонки), созданные в обход bootstrap."""
+    with _lock:
+        _columns.setdefault(table, set()).update(cols)
+
+
+def on_refresh(fn: Callable[[], None]) -> Callable[[], None]:
+    """Зарегистрировать сброс производных кэшей при refresh() (декоратор)."""
+    _listeners.append(fn)
+    return fn
+
+
+def _version_file() -> str:
+    return os.path.join(current_app.instance_path, "schema.version")
+
+
+def _shared_version() -> int:
+    try:
+        return os.stat(_version_file()).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def bump_shared_version() -> None:
+    """Сообщить воркерам, что схема изменилась (после flask db upgrade)."""
+    path = _version_file()
+    try:
+        # mtime ставим явно и строго больше прежнего: грубое время ФС не склеит две записи подряд
+        t = max(time.time_ns(), _shared_version() + 1)
+        with open(path, "a"):
+            pass
+        os.utime(path, ns=(t, t))
+    except OSError:
+        pass
+
+
+def check_shared_version() -> None:
+    """Перед запросом: схему сменили миграции из другого процесса — перечитать реестр."""
+    global _seen_shared
+    if not is_ready():
+        return
+    shared = _shared_version()
+    with _lock:
+        if shared == _seen_shared:
+            return
+        _seen_shared = shared
+    try:
+        refresh()
+    except Exception:
+        log.exception("schema refresh after migration failed")
+        db.session.rollback()
+
+
+def refresh() -> dict[str, set[str]]:
+    """Перечитать таблицы и колонки из БД (например, после миграций)."""
+    global _bound_url, _seen_shared
+    shared = _shared_version()  # до чтения схемы: миграция во время refresh() не потеряется
+    insp = inspect(db.engine)
+    found = {t: {c["name"] for c in insp.get_columns(t)} for t in insp.get_table_names()}
+    with _lock:
+        _columns.clear()
+        _columns.update(found)
+        _bound_url = str(db.engine.url)
+        _seen_shared = shared
+    for fn in _listeners:
+        fn()
+    return found
+
+
+def ensure_schema() -> list[str]:
+    """
+    Создать недостающие таблицы/колонки и заполнить реестр (scripts/ensure_schema.py).
+    Возвращает созданные таблицы.
+    """
+    from . import models  # noqa: F401  — регистрируем модели в метаданных
+    from .acl import _ensure_user_club_table
+    from .models.inventory import ensure_club_barcode_price_column, ensure_stock_unique_index
+
+    before = set(inspect(db.engine).get_table_names())
+    db.create_all()
+    _ensure_user_club_table()
+    ensure_club_barcode_price_column()
+    ensure_stock_unique_index()
+    after = refresh()
+    created = sorted(set(after) - before)
+    if "cashier_month_summary" in created:
+        from .cashier_summary import rebuild
+        rebuild()  # свёртка по уже существующим отчётам
+    return created
+
+
+def verify_schema() -> list[str]:
+    """Заполнить реестр из БД, ничего не создавая. Возвращает таблицы моделей, которых в БД нет."""
+    from . import models  # noqa: F401  — регистрируем модели в метаданных
+
+    found = refresh()
+    return sorted(set(db.metadata.tables) - set(found))
+
+
+def bootstrap(app) -> None:
+    """Проверка схемы один раз на процесс (на каждый URI БД); только чтение."""
+    if not app.config.get("SCHEMA_BOOTSTRAP", True):
+        return
+    with app.app_context():
+        if _bound_url == str(db.engine.url):
+            return
+        try:
+            missing = verify_schema()
+        except Exception:
+            log.exception("schema bootstrap failed; falling back to per-call checks")
+            db.session.rollback()
+            with _lock:
+                _columns.clear()
+            return
+        finally:
+            db.session.remove()
+        if missing:
+            log.warning("schema bootstrap: missing tables %s (run flask db upgrade)", ", ".join(missing))
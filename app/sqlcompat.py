@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Мелкие различия SQL между SQLite и Postgres для «сырых» запросов.
+
+Запросы приложения пишутся на общем подмножестве SQL (строки — в одинарных
+кавычках, булевы — TRUE/FALSE, вставка с конфликтом — ON CONFLICT), а всё,
+что у бэкендов расходится, собирается функциями отсюда.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime
+from typing import Iterable
+
+from sqlalchemy import inspect, text
+
+from .extensions import db
+
+
+def _bind_dialect():
+    return db.session.get_bind().dialect
+
+
+def dialect() -> str:
+    """Имя диалекта текущего подключения: sqlite | postgresql | mysql ..."""
+    return _bind_dialect().name
+
+
+def is_postgres() -> bool:
+    return dialect() == "postgresql"
+
+
+def _cols(cols: Iterable[str]) -> list[str]:
+    return [str(c) for c in cols]
+
+
+def _table(table: str) -> str:
+    """Имя таблицы в кавычках диалекта: "t" — SQLite/Postgres, `t` — MySQL."""
+    return _bind_dialect().identifier_preparer.quote_identifier(table)
+
+
+def _insert_head(table: str, cols: list[str]) -> str:
+    return f'INSERT INTO {_table(table)}({",".join(cols)}) VALUES ({",".join(":" + c for c in cols)})'
+
+
+def insert_ignore(table: str, cols: Iterable[str], conflict: Iterable[str] = ()):
+    """INSERT, молча пропускающий дубликаты (аналог INSERT OR IGNORE)."""
+    cols = _cols(cols)
+    head = _insert_head(table, cols)
+    if dialect() == "mysql":
+        return text(head.replace("INSERT INTO", "INSERT IGNORE INTO", 1))
+    target = f"({','.join(conflict)}) " if conflict else ""
+    return text(f"{head} ON CONFLICT {target}DO NOTHING")
+
+
+def upsert(table: str, cols: Iterable[str], conflict: Iterable[str], update: Iterable[str]):
+    """INSERT ... ON CONFLICT(conflict) DO UPDATE SET update=новое значение."""
+    cols, conflict, update = _cols(cols), _cols(conflict), _cols(update)
+    head = _insert_head(table, cols)
+    if dialect() == "mysql":
+        sets = ", ".join(f"{c}=VALUES({c})" for c in update)
+        return text(f"{head} ON DUPLICATE KEY UPDATE {sets}")
+    sets = ", ".join(f"{c}=excluded.{c}" for c in update)
+    return text(f"{head} ON CONFLICT ({','.join(conflict)}) DO UPDATE SET {sets}")
+
+
+def upsert_add(table: str, cols: Iterable[str], conflict: Iterable[str], add: Iterable[str]):
+    """INSERT ... ON CONFLICT(conflict) DO UPDATE SET add=старое значение + новое (атомарный счётчик)."""
+    cols, conflict, add = _cols(cols), _cols(conflict), _cols(add)
+    head = _insert_head(table, cols)
+    if dialect() == "mysql":
+        sets = ", ".join(f"{c}={c}+VALUES({c})" for c in add)
+        return text(f"{head} ON DUPLICATE KEY UPDATE {sets}")
+    sets = ", ".join(f"{c}=COALESCE({_table(table)}.{c},0)+excluded.{c}" for c in add)
+    return text(f"{head} ON CONFLICT ({','.join(conflict)}) DO UPDATE SET {sets}")
+
+
+def string_agg(expr: str, sep: str = ", ") -> str:
+    """Склейка строк группы через разделитель (GROUP_CONCAT / STRING_AGG)."""
+    sep_sql = "'" + sep.replace("'", "''") + "'"
+    name = dialect()
+    if name == "postgresql":
+        return f"STRING_AGG(CAST({expr} AS TEXT), {sep_sql})"
+    if name == "mysql":
+        return f"GROUP_CONCAT({expr} SEPARATOR {sep_sql})"
+    return f"GROUP_CONCAT({expr}, {sep_sql})"
+
+
+def ts_bound(d: date) -> str:
+    """
+    Полночь дня d как параметр для сравнения с меткой времени.
+
+    Фильтры по дню пишутся диапазоном (ts >= :d1 AND ts < :d2), а не date(ts),
+    чтобы работал индекс. Формат совпадает с тем, в котором приложение пишет
+    метки ("YYYY-MM-DD HH:MM:SS"), поэтому в SQLite корректно и строковое сравнение.
+    """
+    return datetime(d.year, d.month, d.day).isoformat(sep=" ")
+
+
+def ilike() -> str:
+    """Оператор поиска без учёта регистра (LIKE в SQLite и так такой для ASCII)."""
+    return "ILIKE" if is_postgres() else "LIKE"
+
+
+def table_columns(table: str) -> set[str]:
+    """Колонки таблицы (пустое множество, если таблицы нет) — вместо PRAGMA table_info."""
+    insp = inspect(db.session.get_bind())
+    if not insp.has_table(table):
+        return set()
+    return {c["name"] for c in insp.get_columns(table)}
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Складской журнал клуба: каждое движение товара — строка stock_move, текущий
+остаток — stock.qty (одна строка на клуб+товар, уникальный индекс uq_stock_club_product).
+
+Движения пишутся в транзакции вызывающего кода (без commit), остаток меняется
+атомарным INSERT ... ON CONFLICT DO UPDATE SET qty = qty + Δ, поэтому
+параллельные операции не теряют друг друга.
+
+Источники движений (reason):
+  debt         — товар выдан в долг сотруднику (debt_ops.ops_assign), −qty
+  defect       — списание по браку (debt_ops.ops_defect), −qty
+  debt_delete  — удалена ошибочная операция долга, +qty
+  purchase     — приход из файла номенклатуры (колонка «Приход»), +qty; один раз
+                 на файл (stock_receipt)
+  inventory    — закрытие инвентаризации: остаток приводится к посчитанному; первая
+                 такая запись открывает журнал клуба (ledger_opened)
+
+Снимки остатков (stock_checkpoint): остаток на момент T = последний снимок не
+позже T + движения между снимком и T, а не сумма всей истории. Снимок пишется
+при закрытии инвентаризации и ежедневно из cron:
+  flask stock-checkpoint [--club-id N]
+Метка снимка — не позже «сейчас − STOCK_CHECKPOINT_LAG»: created_at движения
+ставится до commit, и незакоммиченная строка с меткой раньше снимка иначе не
+попала бы ни в снимок, ни в хвост движений после него. Фоновые задачи (импорт
+с приходом) держат транзакцию дольше лага, поэтому пока задача клуба в статусе
+running, снимок клуба ставится не позже её started_at.
+
+Сверка stock с журналом и пересборка (stock и снимки — из движений):
+  flask rebuild-stock-ledger [--club-id N] [--check]
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Iterable
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, text
+
+from .extensions import db
+from .query_advisor import hot_query
+from .sqlcompat import upsert_add
+
+
+def apply_moves(club_id: int, moves: Iterable[tuple[int, int]], reason: str) -> int:
+    """
+    Записать движения [(product_id, Δqty)] и изменить остатки (без commit).
+    Движения одного товара суммируются, нулевые пропускаются. Возвращает число товаров.
+    """
+    deltas: dict[int, int] = {}
+    for pid, delta in moves:
+        deltas[int(pid)] = deltas.get(int(pid), 0) + int(delta)
+    rows = [{"club_id": int(club_id), "product_id": pid, "qty": d} for pid, d in deltas.items() if d]
+    if not rows:
+        return 0
+    now = datetime.utcnow()
+    db.session.execute(
+        text('INSERT INTO "stock_move"(club_id, product_id, qty_delta, reason, created_at) '
+             'VALUES (:club_id, :product_id, :qty, :reason, :ts)'),
+        [dict(r, reason=reason, ts=now) for r in rows],
+    )
+    db.session.execute(upsert_add("stock", ("club_id", "product_id", "qty"), ("club_id", "product_id"), ("qty",)), rows)
+    return len(rows)
+
+
+def stock_levels(club_id: int, product_ids: Iterable[int] | None = None) -> dict[int, int]:
+    """Текущие остатки клуба {product_id: qty} (все или по списку товаров)."""
+    sql = 'SELECT product_id, qty FROM "stock" WHERE club_id = :c'
+    params: dict = {"c": int(club_id)}
+    stmt = text(sql)
+    if product_ids is not None:
+        ids = [int(p) for p in product_ids]
+        if not ids:
+            return {}
+        stmt = text(sql + " AND product_id IN :ids").bindparams(bindparam("ids", expanding=True))
+        params["ids"] = ids
+    return {int(pid): int(qty or 0) for pid, qty in db.session.execute(stmt, params).all()}
+
+
+def set_levels(club_id: int, levels: dict[int, int], reason: str = "inventory") -> int:
+    """Привести остатки к заданным (например, к посчитанным на инвентаризации) корректирующими движениями."""
+    current = stock_levels(club_id, levels.keys())
+    return apply_moves(club_id, ((pid, int(q) - current.get(int(pid), 0)) for pid, q in levels.items()), reason)
+
+
+def ledger_opened(club_id: int) -> bool:
+    """Есть ли в журнале клуба инвентаризация — точка, с которой остатки в stock достоверны."""
+    return db.session.execute(
+        text('SELECT 1 FROM "stock_move" WHERE club_id = :c AND reason = \'inventory\' LIMIT 1'), {"c": int(club_id)}
+    ).first() is not None
+
+
+def _ts(v) -> str | None:
+    if v is None:
+        return None
+    return v.isoformat(sep=" ") if isinstance(v, datetime) else str(v)
+
+
+_LAST_CHECKPOINT_SQL = 'SELECT MAX(as_of) FROM "stock_checkpoint" WHERE club_id = :c'
+hot_query("stock.last_checkpoint", _LAST_CHECKPOINT_SQL + " AND as_of <= :at", c=1, at="2025-01-01 00:00:00")
+
+
+def last_checkpoint(club_id: int, at: datetime | None = None) -> str | None:
+    """Метка последнего снимка клуба (не позже at)."""
+    sql = _LAST_CHECKPOINT_SQL
+    if at is not None:
+        sql += " AND as_of <= :at"
+    return db.session.execute(text(sql), {"c": int(club_id), "at": _ts(at)}).scalar()
+
+
+def _levels_at_stmt(since: bool, by_ids: bool):
+    """Снимок на :cp + движения [:cp, :at); since=False — снимка нет, движения с начала."""
+    stmt = text(f'''
+        SELECT product_id, SUM(q) FROM (
+            SELECT product_id, qty AS q FROM "stock_checkpoint" WHERE club_id = :c AND as_of = :cp
+            UNION ALL
+            SELECT product_id, qty_delta FROM "stock_move"
+            WHERE club_id = :c{" AND created_at >= :cp" if since else ""} AND created_at < :at
+        ) t {"WHERE product_id IN :ids" if by_ids else ""}
+        GROUP BY product_id
+    ''')
+    return stmt.bindparams(bindparam("ids", expanding=True)) if by_ids else stmt
+
+
+hot_query("stock.levels_at", _levels_at_stmt(True, True),
+          c=1, cp="2025-01-01 00:00:00", at="2025-02-01 00:00:00", ids=[1])
+
+
+def levels_at(club_id: int, at: datetime, product_ids: Iterable[int] | None = None) -> tuple[dict[int, int], str | None]:
+    """
+    Остатки клуба на момент at (движения строго раньше at): ближайший снимок
+    + движения [снимок, at). Возвращает ({product_id: qty}, метка снимка или None).
+    """
+    cp = last_checkpoint(club_id, at)
+    params: dict = {"c": int(club_id), "at": _ts(at), "cp": cp}
+    if product_ids is not None:
+        params["ids"] = [int(p) for p in product_ids]
+        if not params["ids"]:
+            return {}, cp
+    stmt = _levels_at_stmt(bool(cp), product_ids is not None)
+    return {int(pid): int(q or 0) for pid, q in db.session.execute(stmt, params).all()}, cp
+
+
+_RUNNING_JOBS_SQL = (
+    'SELECT MIN(COALESCE(started_at, created_at)) FROM "job" WHERE club_id = :c AND status = \'running\''
+)
+
+
+def _checkpoint_horizon(club_id: int | None = None) -> datetime:
+    """
+    Самая поздняя допустимая метка снимка: все движения раньше неё уже закоммичены.
+    Фоновая задача клуба (импорт) держит транзакцию дольше STOCK_CHECKPOINT_LAG —
+    пока она выполняется, снимок клуба ставится не позже её старта.
+    """
+    lag = int(current_app.config.get("STOCK_CHECKPOINT_LAG", 300) or 0)
+    horizon = datetime.utcnow() - timedelta(seconds=lag)
+    if club_id is not None:
+        started = db.session.execute(text(_RUNNING_JOBS_SQL), {"c": int(club_id)}).scalar()
+        if started is not None:
+            if not isinstance(started, datetime):
+                started = datetime.fromisoformat(str(started))
+            horizon = min(horizon, started)
+    return horizon
+
+
+def checkpoint(club_id: int, as_of: datetime | None = None) -> int:
+    """
+    Записать снимок остатков клуба на момент as_of (без commit); по умолчанию и
+    не позже — «сейчас − STOCK_CHECKPOINT_LAG», а при выполняющейся фоновой задаче
+    клуба — не позже её старта. Если с прошлого снимка движений
+    не было — не пишет. Возвращает число строк.
+    """
+    horizon = _checkpoint_horizon(club_id)
+    as_of = min(as_of, horizon) if as_of else horizon
+    last = last_checkpoint(club_id, as_of)
+    if last:
+        moved = db.session.execute(
+            text('SELECT 1 FROM "stock_move" WHERE club_id = :c AND created_at >= :cp AND created_at < :at LIMIT 1'),
+            {"c": int(club_id), "cp": last, "at": _ts(as_of)},
+        ).first()
+        if not moved:
+            return 0
+    levels, _cp = levels_at(club_id, as_of)
+    if not levels:
+        return 0
+    db.session.execute(
+        text('INSERT INTO "stock_checkpoint"(club_id, product_id, as_of, qty) VALUES (:c, :p, :t, :q)'),
+        [{"c": int(club_id), "p": pid, "t": _ts(as_of), "q": q} for pid, q in levels.items()],
+    )
+    return len(levels)
+
+
+def _club_ids(club_id: int | None) -> list[int]:
+    if club_id:
+        return [int(club_id)]
+    return [int(r[0]) for r in db.session.execute(text('SELECT id FROM "club" ORDER BY id')).all()]
+
+
+def _ledger_totals(club_id: int) -> dict[int, int]:
+    # полная сумма истории — только для сверки, не для запросов страниц
+    rows = db.session.execute(
+        text('SELECT product_id, SUM(qty_delta) FROM "stock_move" WHERE club_id = :c GROUP BY product_id'),
+        {"c": int(club_id)},
+    ).all()
+    return {int(pid): int(q or 0) for pid, q in rows}
+
+
+def verify(club_id: int | None = None) -> list[dict]:
+    """
+    Расхождения stock с журналом: для каждого товара остаток stock, полная сумма
+    движений и остаток по снимку + хвосту движений. Возвращает только строки с расхождением.
+    """
+    now = datetime.utcnow()
+    out: list[dict] = []
+    for cid in _club_ids(club_id):
+        ledger = _ledger_totals(cid)
+        stock = stock_levels(cid)
+        via_cp, _cp = levels_at(cid, now)
+        for pid in sorted(set(ledger) | set(stock) | set(via_cp)):
+            row = {"club_id": cid, "product_id": pid, "stock": stock.get(pid, 0),
+                   "ledger": ledger.get(pid, 0), "checkpoint": via_cp.get(pid, 0)}
+            if not (row["stock"] == row["ledger"] == row["checkpoint"]):
+                out.append(row)
+    return out
+
+
+def rebuild(club_id: int | None = None) -> tuple[int, int]:
+    """
+    Пересобрать по журналу: снимки пересчитываются на свои же метки, stock.qty
+    приводится к сумме движений (движения не пишутся). Коммитит.
+    Возвращает (исправлено остатков, пересчитано снимков).
+    """
+    fixed = snaps = 0
+    for cid in _club_ids(club_id):
+        stamps = [r[0] for r in db.session.execute(
+            text('SELECT DISTINCT as_of FROM "stock_checkpoint" WHERE club_id = :c'), {"c": cid}
+        ).all()]
+        for t in stamps:
+            db.session.execute(text('DELETE FROM "stock_checkpoint" WHERE club_id = :c AND as_of = :t'), {"c": cid, "t": t})
+            db.session.execute(text('''
+                INSERT INTO "stock_checkpoint"(club_id, product_id, as_of, qty)
+                SELECT club_id, product_id, :t, SUM(qty_delta) FROM "stock_move"
+                WHERE club_id = :c AND created_at < :t
+                GROUP BY club_id, product_id
+            '''), {"c": cid, "t": t})
+        snaps += len(stamps)
+
+        ledger = _ledger_totals(cid)
+        stock = stock_levels(cid)
+        deltas = [
+            {"club_id": cid, "product_id": pid, "qty": ledger.get(pid, 0) - stock.get(pid, 0)}
+            for pid in set(ledger) | set(stock)
+            if ledger.get(pid, 0) != stock.get(pid, 0)
+        ]
+        if deltas:
+            db.session.execute(upsert_add("stock", ("club_id", "product_id", "qty"), ("club_id", "product_id"), ("qty",)), deltas)
+            fixed += len(deltas)
+    db.session.commit()
+    return fixed, snaps
+
+
+@click.command("stock-checkpoint")
+@click.option("--club-id", type=int, default=None, help="Только этот клуб.")
+@with_appcontext
+def stock_checkpoint_command(club_id: int | None) -> None:
+    """Снимок остатков по журналу (ежедневно из cron)."""
+    as_of = _checkpoint_horizon()
+    n = sum(checkpoint(cid, as_of) for cid in _club_ids(club_id))
+    db.session.commit()
+    click.echo(f"Записано строк снимка: {n}")
+
+
+@click.command("rebuild-stock-ledger")
+@click.option("--club-id", type=int, default=None, help="Только этот клуб.")
+@click.option("--check", is_flag=True, help="Только показать расхождения; код выхода 1, если они есть.")
+@with_appcontext
+def rebuild_stock_ledger_command(club_id: int | None, check: bool) -> None:
+    """Сверить stock и снимки с журналом stock_move и пересобрать их из движений."""
+    drift = verify(club_id)
+    for r in drift:
+        click.echo(f"клуб {r['club_id']} товар {r['product_id']}: stock={r['stock']} "
+                   f"журнал={r['ledger']} снимок+движения={r['checkpoint']}")
+    click.echo(f"Расхождений: {len(drift)}")
+    if check:
+        if drift:
+            raise SystemExit(1)
+        return
+    fixed, snaps = rebuild(club_id)
+    click.echo(f"Исправлено остатков: {fixed}, пересчитано снимков: {snaps}")
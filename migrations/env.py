@@ -109,6 +109,14 @@ def run_migrations_online():
         with context.begin_transaction():
             context.run_migrations()
 
+    # схема могла измениться — обновляем реестр колонок приложения
+    try:
+        from app import schema
+        schema.refresh()
+        schema.bump_shared_version()  # запущенные воркеры перечитают реестр перед запросом
+    except Exception:
+        logger.warning('Не удалось обновить реестр схемы после миграций.')
+
 
 if context.is_offline_mode():
     run_migrations_offline()
@@ -0,0 +1,57 @@
+"""hot path indexes
+
+Revision ID: a3c9d41e7b20
+Revises: 2f0c03afc8d6
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c9d41e7b20'
+down_revision = '2f0c03afc8d6'
+branch_labels = None
+depends_on = None
+
+
+# (имя, таблица, колонки, unique)
+INDEXES = [
+    ('ix_cashier_report_club_date_type', 'cashier_report', ['club_id', 'shift_date', 'shift_type'], False),
+    ('ix_shift_club_user_start', 'shift', ['club_id', 'user_id', 'start_ts'], False),
+    ('ix_stock_move_club_product_created', 'stock_move', ['club_id', 'product_id', 'created_at'], False),
+    ('ix_stock_move_club_created', 'stock_move', ['club_id', 'created_at'], False),
+    ('ix_admin_debt_club_user', 'admin_debt', ['club_id', 'user_id'], False),
+    ('ix_admin_debt_club_status', 'admin_debt', ['club_id', 'status'], False),
+    ('uq_inventory_count_session_product', 'inventory_count', ['session_id', 'product_id'], True),
+]
+
+
+def _existing(table):
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table(table):
+        return None
+    return {ix['name'] for ix in insp.get_indexes(table)}
+
+
+def upgrade():
+    # Таблицы могли быть созданы create_all() уже с индексами — создаём только недостающие
+    for name, table, cols, unique in INDEXES:
+        have = _existing(table)
+        if have is None or name in have:
+            continue
+        if unique:
+            # дубли (session_id, product_id) оставляем последней записью
+            op.execute(sa.text(
+                f'DELETE FROM "{table}" WHERE id NOT IN ('
+                f'SELECT MAX(id) FROM "{table}" GROUP BY {", ".join(cols)})'
+            ))
+        op.create_index(name, table, cols, unique=unique)
+
+
+def downgrade():
+    for name, table, _cols, _unique in reversed(INDEXES):
+        have = _existing(table)
+        if have and name in have:
+            op.drop_index(name, table_name=table)
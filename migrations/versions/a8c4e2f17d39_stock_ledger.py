@@ -0,0 +1,45 @@
+"""stock (club_id, product_id) unique index for the stock ledger
+
+Revision ID: a8c4e2f17d39
+Revises: f3a1d6b8c205
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c4e2f17d39'
+down_revision = 'f3a1d6b8c205'
+branch_labels = None
+depends_on = None
+
+
+def _existing():
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table('stock'):
+        return None
+    return {ix['name'] for ix in insp.get_indexes('stock')}
+
+
+def upgrade():
+    have = _existing()
+    if have is None or 'uq_stock_club_product' in have:
+        return
+    # дубли (club_id, product_id) сливаем в последнюю строку с суммой qty
+    op.execute(sa.text(
+        'UPDATE "stock" SET qty = (SELECT SUM(COALESCE(s2.qty,0)) FROM "stock" s2 '
+        'WHERE s2.club_id = "stock".club_id AND s2.product_id = "stock".product_id) '
+        'WHERE id IN (SELECT MAX(id) FROM "stock" GROUP BY club_id, product_id HAVING COUNT(*) > 1)'
+    ))
+    op.execute(sa.text(
+        'DELETE FROM "stock" WHERE id NOT IN (SELECT MAX(id) FROM "stock" GROUP BY club_id, product_id)'
+    ))
+    op.create_index('uq_stock_club_product', 'stock', ['club_id', 'product_id'], unique=True)
+
+
+def downgrade():
+    have = _existing()
+    if have and 'uq_stock_club_product' in have:
+        op.drop_index('uq_stock_club_product', table_name='stock')
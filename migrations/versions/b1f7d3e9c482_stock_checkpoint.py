@@ -0,0 +1,38 @@
+"""stock_checkpoint
+
+Revision ID: b1f7d3e9c482
+Revises: a8c4e2f17d39
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1f7d3e9c482'
+down_revision = 'a8c4e2f17d39'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Таблица могла быть создана scripts/ensure_schema.py (create_all)
+    if sa.inspect(op.get_bind()).has_table('stock_checkpoint'):
+        return
+    op.create_table(
+        'stock_checkpoint',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('club_id', sa.Integer(), sa.ForeignKey('club.id'), nullable=False),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('product.id'), nullable=False),
+        sa.Column('as_of', sa.DateTime(), nullable=False),
+        sa.Column('qty', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_index('uq_stock_checkpoint_club_asof_product', 'stock_checkpoint',
+                    ['club_id', 'as_of', 'product_id'], unique=True)
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('stock_checkpoint'):
+        op.drop_index('uq_stock_checkpoint_club_asof_product', table_name='stock_checkpoint')
+        op.drop_table('stock_checkpoint')
@@ -0,0 +1,36 @@
+"""shift (club_id, start_ts) index
+
+Revision ID: b7e2f5a10c34
+Revises: a3c9d41e7b20
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2f5a10c34'
+down_revision = 'a3c9d41e7b20'
+branch_labels = None
+depends_on = None
+
+
+def _existing(table):
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table(table):
+        return None
+    return {ix['name'] for ix in insp.get_indexes(table)}
+
+
+def upgrade():
+    # Месячные выборки/удаления смен клуба идут диапазоном по start_ts без user_id
+    have = _existing('shift')
+    if have is not None and 'ix_shift_club_start' not in have:
+        op.create_index('ix_shift_club_start', 'shift', ['club_id', 'start_ts'])
+
+
+def downgrade():
+    have = _existing('shift')
+    if have and 'ix_shift_club_start' in have:
+        op.drop_index('ix_shift_club_start', table_name='shift')
@@ -0,0 +1,83 @@
+"""cashier_month_summary rollup
+
+Revision ID: c41d8e2f9a57
+Revises: b7e2f5a10c34
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d8e2f9a57'
+down_revision = 'b7e2f5a10c34'
+branch_labels = None
+depends_on = None
+
+
+SUM_COLS = (
+    'bar', 'cash', 'extended', 'sbp_acq', 'sbp_cls', 'acquiring',
+    'acquiring_fee', 'refund_cash', 'refund_noncash', 'encashment',
+)
+
+
+def upgrade():
+    # Таблица могла быть создана scripts/ensure_schema.py (create_all) — тогда и заполнена им
+    if sa.inspect(op.get_bind()).has_table('cashier_month_summary'):
+        return
+    op.create_table(
+        'cashier_month_summary',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('club_id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('reports', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('full_days', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('full_days_z', sa.Numeric(14, 2), server_default='0'),
+        *[sa.Column(c, sa.Numeric(14, 2), server_default='0') for c in SUM_COLS],
+        sa.UniqueConstraint('club_id', 'month', name='uq_cashier_month_summary_club_month'),
+    )
+    _backfill(op.get_bind())
+
+
+def _backfill(bind):
+    """Свёртка по уже существующим отчётам (то же, что flask rebuild-cashier-summary)."""
+    if not sa.inspect(bind).has_table('cashier_report'):
+        return
+    cols = ', '.join(f'COALESCE({c},0)' for c in SUM_COLS)
+    days = {}  # (club_id, день) -> [отчётов, есть день, есть ночь, суммы]
+    for club_id, shift_date, shift_type, *vals in bind.execute(
+        sa.text(f'SELECT club_id, shift_date, shift_type, {cols} FROM "cashier_report"')
+    ):
+        d = days.setdefault((int(club_id), str(shift_date)[:10]), [0, False, False, [0.0] * len(SUM_COLS)])
+        d[0] += 1
+        d[1] = d[1] or shift_type == 'day'
+        d[2] = d[2] or shift_type == 'night'
+        d[3] = [a + float(v or 0) for a, v in zip(d[3], vals)]
+
+    months = {}
+    for (club_id, day), (n, has_day, has_night, sums) in days.items():
+        y, m = int(day[:4]), int(day[5:7])
+        row = months.setdefault((club_id, date(y, m, 1)), dict(
+            reports=0, full_days=0, full_days_z=0.0, **{c: 0.0 for c in SUM_COLS}))
+        row['reports'] += n
+        if has_day and has_night:
+            row['full_days'] += 1
+            row['full_days_z'] += sums[SUM_COLS.index('cash')] + sums[SUM_COLS.index('extended')]
+        for c, v in zip(SUM_COLS, sums):
+            row[c] += v
+    if not months:
+        return
+    names = ('club_id', 'month', 'reports', 'full_days', 'full_days_z', *SUM_COLS)
+    bind.execute(
+        sa.text(f'INSERT INTO "cashier_month_summary"({", ".join(names)}) '
+                f'VALUES ({", ".join(":" + c for c in names)})'),
+        [dict(r, club_id=club_id, month=month) for (club_id, month), r in months.items()],
+    )
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('cashier_month_summary'):
+        op.drop_table('cashier_month_summary')
@@ -0,0 +1,36 @@
+"""inventory_session (club_id, closed_at) index
+
+Revision ID: c6d2a9f4e813
+Revises: b1f7d3e9c482
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6d2a9f4e813'
+down_revision = 'b1f7d3e9c482'
+branch_labels = None
+depends_on = None
+
+
+def _existing(table):
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table(table):
+        return None
+    return {ix['name'] for ix in insp.get_indexes(table)}
+
+
+def upgrade():
+    # Сводка на главной ищет открытую сессию и последнее закрытие по каждому клубу
+    have = _existing('inventory_session')
+    if have is not None and 'ix_inventory_session_club_closed' not in have:
+        op.create_index('ix_inventory_session_club_closed', 'inventory_session', ['club_id', 'closed_at'])
+
+
+def downgrade():
+    have = _existing('inventory_session')
+    if have and 'ix_inventory_session_club_closed' in have:
+        op.drop_index('ix_inventory_session_club_closed', table_name='inventory_session')
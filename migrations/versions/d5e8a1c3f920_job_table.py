@@ -0,0 +1,42 @@
+"""job table for background imports
+
+Revision ID: d5e8a1c3f920
+Revises: c41d8e2f9a57
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e8a1c3f920'
+down_revision = 'c41d8e2f9a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Таблица могла быть создана scripts/ensure_schema.py (create_all)
+    if sa.inspect(op.get_bind()).has_table('job'):
+        return
+    op.create_table(
+        'job',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('kind', sa.String(length=64), nullable=False),
+        sa.Column('club_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=16), nullable=False, server_default='queued'),
+        sa.Column('processed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_job_user_created', 'job', ['user_id', 'created_at'])
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('job'):
+        op.drop_table('job')
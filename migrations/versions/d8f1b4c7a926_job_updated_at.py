@@ -0,0 +1,38 @@
+"""job.updated_at
+
+Revision ID: d8f1b4c7a926
+Revises: c6d2a9f4e813
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f1b4c7a926'
+down_revision = 'c6d2a9f4e813'
+branch_labels = None
+depends_on = None
+
+
+def _columns(table):
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table(table):
+        return None
+    return {c['name'] for c in insp.get_columns(table)}
+
+
+def upgrade():
+    # Отметка последнего обновления задачи: по ней при старте находятся прерванные задачи
+    cols = _columns('job')
+    if cols is not None and 'updated_at' not in cols:
+        with op.batch_alter_table('job') as batch:
+            batch.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    cols = _columns('job')
+    if cols and 'updated_at' in cols:
+        with op.batch_alter_table('job') as batch:
+            batch.drop_column('updated_at')
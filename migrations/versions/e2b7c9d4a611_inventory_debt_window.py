@@ -0,0 +1,54 @@
+"""debt_transaction window index and inventory_snapshot_item
+
+Revision ID: e2b7c9d4a611
+Revises: d5e8a1c3f920
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7c9d4a611'
+down_revision = 'd5e8a1c3f920'
+branch_labels = None
+depends_on = None
+
+
+INDEX = ('ix_debt_transaction_club_created_product', 'debt_transaction', ['club_id', 'created_at', 'product_id'])
+
+
+def upgrade():
+    insp = sa.inspect(op.get_bind())
+    name, table, cols = INDEX
+    if insp.has_table(table) and name not in {ix['name'] for ix in insp.get_indexes(table)}:
+        op.create_index(name, table, cols)
+
+    # Таблица могла быть создана scripts/ensure_schema.py (create_all)
+    if insp.has_table('inventory_snapshot_item'):
+        return
+    op.create_table(
+        'inventory_snapshot_item',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('session_id', sa.Integer(), sa.ForeignKey('inventory_session.id'), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=180), nullable=False),
+        sa.Column('expected_qty', sa.Integer(), server_default='0'),
+        sa.Column('counted_qty', sa.Integer(), server_default='0'),
+        sa.Column('debt_qty', sa.Integer(), server_default='0'),
+        sa.Column('price', sa.Numeric(12, 2), server_default='0'),
+        sa.Column('shortage_qty', sa.Integer(), server_default='0'),
+        sa.Column('shortage', sa.Numeric(14, 2), server_default='0'),
+        sa.UniqueConstraint('session_id', 'product_id', name='uq_inventory_snapshot_item_session_product'),
+    )
+    # Снимки уже закрытых сессий: flask inventory-snapshots
+
+
+def downgrade():
+    insp = sa.inspect(op.get_bind())
+    if insp.has_table('inventory_snapshot_item'):
+        op.drop_table('inventory_snapshot_item')
+    name, table, _cols = INDEX
+    if insp.has_table(table) and name in {ix['name'] for ix in insp.get_indexes(table)}:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,40 @@
+"""inventory_session.snapshot_at
+
+Revision ID: e4a7c2d9b518
+Revises: d8f1b4c7a926
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c2d9b518'
+down_revision = 'd8f1b4c7a926'
+branch_labels = None
+depends_on = None
+
+
+def _columns(table):
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table(table):
+        return None
+    return {c['name'] for c in insp.get_columns(table)}
+
+
+def upgrade():
+    # Отметка сохранённого снимка сверки (в том числе пустого), чтобы история не
+    # пересчитывала сессию при каждом просмотре. Снимки уже закрытых сессий
+    # досоздаёт flask inventory-snapshots.
+    cols = _columns('inventory_session')
+    if cols is not None and 'snapshot_at' not in cols:
+        with op.batch_alter_table('inventory_session') as batch:
+            batch.add_column(sa.Column('snapshot_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    cols = _columns('inventory_session')
+    if cols and 'snapshot_at' in cols:
+        with op.batch_alter_table('inventory_session') as batch:
+            batch.drop_column('snapshot_at')
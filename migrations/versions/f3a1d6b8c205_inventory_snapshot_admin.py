@@ -0,0 +1,38 @@
+"""inventory_snapshot_admin
+
+Revision ID: f3a1d6b8c205
+Revises: e2b7c9d4a611
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a1d6b8c205'
+down_revision = 'e2b7c9d4a611'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Таблица могла быть создана scripts/ensure_schema.py (create_all)
+    if sa.inspect(op.get_bind()).has_table('inventory_snapshot_admin'):
+        return
+    op.create_table(
+        'inventory_snapshot_admin',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('session_id', sa.Integer(), sa.ForeignKey('inventory_session.id'), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=128), nullable=False, server_default=''),
+        sa.Column('shifts', sa.Integer(), server_default='0'),
+        sa.Column('share', sa.Float(), server_default='0'),
+        sa.Column('allocated', sa.Numeric(14, 2), server_default='0'),
+        sa.UniqueConstraint('session_id', 'user_id', name='uq_inventory_snapshot_admin_session_user'),
+    )
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('inventory_snapshot_admin'):
+        op.drop_table('inventory_snapshot_admin')
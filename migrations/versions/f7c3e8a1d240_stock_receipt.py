@@ -0,0 +1,39 @@
+"""stock_receipt
+
+Revision ID: f7c3e8a1d240
+Revises: e4a7c2d9b518
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7c3e8a1d240'
+down_revision = 'e4a7c2d9b518'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Таблица могла быть создана scripts/ensure_schema.py (create_all)
+    if sa.inspect(op.get_bind()).has_table('stock_receipt'):
+        return
+    op.create_table(
+        'stock_receipt',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('club_id', sa.Integer(), sa.ForeignKey('club.id'), nullable=False),
+        sa.Column('digest', sa.String(length=64), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=True),
+        sa.Column('job_id', sa.Integer(), nullable=True),
+        sa.Column('qty', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('uq_stock_receipt_club_digest', 'stock_receipt', ['club_id', 'digest'], unique=True)
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('stock_receipt'):
+        op.drop_index('uq_stock_receipt_club_digest', table_name='stock_receipt')
+        op.drop_table('stock_receipt')
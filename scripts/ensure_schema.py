@@ -3,7 +3,8 @@
 
 Создаёт недостающие таблицы, объявленные в моделях, не трогая существующие
 данные. Полезно, чтобы привести файл instance/colizeum.db в порядок перед
-импортом товаров/штрих‑кодов.
+импортом товаров/штрих‑кодов. Та же проверка выполняется один раз при старте
+приложения (app/schema.py); здесь она запускается явно и с подробным выводом.
 
 Запуск:
   python scripts/ensure_schema.py
@@ -11,28 +12,22 @@
 
 from __future__ import annotations
 
+import os
 import sys
-from typing import Iterable
-from sqlalchemy import text
-
 from pathlib import Path
 
 print("[ensure] Загружаю приложение...")
-from pathlib import Path
-import sys
 
 # Гарантируем, что корень проекта есть в sys.path
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from app import create_app  # type: ignore
-from app.extensions import db  # type: ignore
-
+# Проверку выполняем сами (с логами), а не внутри create_app()
+os.environ["SCHEMA_BOOTSTRAP"] = "0"
 
-def _tables(conn) -> set[str]:
-    rows = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'"))
-    return {r[0] for r in rows}
+from app import create_app  # type: ignore
+from app import schema  # type: ignore
 
 
 def main() -> int:
@@ -41,20 +36,9 @@ def main() -> int:
         uri = app.config.get("SQLALCHEMY_DATABASE_URI", "")
         print(f"[ensure] SQLALCHEMY_DATABASE_URI = {uri}")
 
-        # Что есть «до»
-        before = _tables(db.session)
-        print(f"[ensure] Таблиц до: {len(before)}")
-
-        # Импортируем пакет моделей, чтобы они зарегистрировались в метаданных
-        print("[ensure] Импорт моделей...")
-        from app import models  # noqa: F401
-
-        # Создаём только недостающие таблицы
+        # Создаём только недостающие таблицы и колонки
         print("[ensure] Создание недостающих таблиц (если есть)...")
-        db.create_all()
-
-        after = _tables(db.session)
-        created = sorted(list(after - before))
+        created = schema.ensure_schema()
         if created:
             print(f"[ensure] Созданы таблицы: {', '.join(created)}")
         else:
@@ -69,7 +53,7 @@ def main() -> int:
             "inventory_session",
             "inventory_count",
         ]
-        present = [t for t in interesting if t in after]
+        present = [t for t in interesting if schema.has_table(t)]
         if present:
             print(f"[ensure] Таблицы учёта есть: {', '.join(present)}")
         print("[ensure] Готово.")
@@ -24,6 +24,10 @@ if not (ROOT / "app" / "__init__.py").exists():
     raise SystemExit("[recreate] ошибка: app/__init__.py отсутствует")
 
 # --- импорт приложения/ORM ---
+# БД будет удалена и создана заново — проверка схемы при старте не нужна
+import os
+os.environ["SCHEMA_BOOTSTRAP"] = "0"
+
 print("[recreate] импорт приложения…")
 from app import create_app  # type: ignore
 from app.extensions import db  # type: ignore
@@ -35,6 +39,7 @@ from app.models.club import Club  # type: ignore
 
 # ACL утилиты
 from app.acl import _ensure_user_club_table  # type: ignore
+from app.sqlcompat import insert_ignore  # type: ignore
 
 
 def _db_path_from_uri(uri: str) -> Optional[Path]:
@@ -77,7 +82,11 @@ def main() -> int:
             db_path.parent.mkdir(parents=True, exist_ok=True)
             if db_path.exists():
                 print(f"[recreate] удаляю файл БД: {db_path}")
+                # закрываем соединения пула (и WAL-файлы), иначе Windows не даст удалить файл
+                db.engine.dispose()
                 db_path.unlink()
+                for side in ("-wal", "-shm"):
+                    Path(str(db_path) + side).unlink(missing_ok=True)
             else:
                 print(f"[recreate] файл БД ещё не существует: {db_path}")
         else:
@@ -118,11 +127,11 @@ def main() -> int:
         # --- членства ---
         print("[recreate] назначаю членства и роли внутри клубов…")
         db.session.execute(
-            text('INSERT OR IGNORE INTO "user_club"(user_id, club_id, role) VALUES (:u,:c,:r)'),
+            insert_ignore("user_club", ("user_id", "club_id", "role"), ("user_id", "club_id")),
             [
-                {"u": owner.id, "c": moscow.id, "r": "owner"},
-                {"u": owner.id, "c": vienna.id, "r": "owner"},
-                {"u": club_admin.id, "c": moscow.id, "r": "club_admin"},
+                {"user_id": owner.id, "club_id": moscow.id, "role": "owner"},
+                {"user_id": owner.id, "club_id": vienna.id, "role": "owner"},
+                {"user_id": club_admin.id, "club_id": moscow.id, "role": "club_admin"},
             ],
         )
         db.session.commit()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Общие фикстуры тестов.
+
+По умолчанию тесты идут на временной SQLite-БД. Тот же набор прогоняется на
+Postgres, если задать TEST_DATABASE_URL=postgresql://... (БД будет очищаться).
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="colizeum-test-")
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL") or f"sqlite:///{_TMP}/test.db"
+os.environ["SCHEMA_BOOTSTRAP"] = "0"
+os.environ["JOB_WORKERS"] = "0"
+os.environ["SQLITE_PROFILE"] = "off"
+
+from sqlalchemy import text  # noqa: E402
+
+from app import create_app, schema  # noqa: E402
+from app.extensions import db  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        schema.ensure_schema()
+    yield app
+
+
+def _truncate() -> None:
+    db.session.rollback()
+    tables = [t.name for t in reversed(db.metadata.sorted_tables)] + ["user_club"]
+    for name in tables:
+        db.session.execute(text(f'DELETE FROM "{name}"'))
+    db.session.commit()
+
+
+@pytest.fixture()
+def ctx(app):
+    """Контекст приложения на чистой БД; после теста все таблицы очищаются."""
+    with app.test_request_context():
+        yield app
+        _truncate()
+        db.session.remove()
+
+
+@pytest.fixture()
+def make(ctx):
+    """Фабрика строк: make.club(), make.product(), make.user()."""
+    from app.models import Club, Product, User
+
+    class _Make:
+        n = 0
+
+        def _next(self) -> int:
+            self.n += 1
+            return self.n
+
+        def club(self, **kw):
+            c = Club(name=kw.pop("name", f"Клуб {self._next()}"), **kw)
+            db.session.add(c)
+            db.session.commit()
+            return c
+
+        def product(self, **kw):
+            p = Product(name=kw.pop("name", f"Товар {self._next()}"), **kw)
+            db.session.add(p)
+            db.session.commit()
+            return p
+
+        def user(self, **kw):
+            u = User(username=kw.pop("username", f"user{self._next()}"), password_hash="-", **kw)
+            db.session.add(u)
+            db.session.commit()
+            return u
+
+    return _Make()
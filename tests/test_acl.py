@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Права доступа: редактирование отчётов по членствам в клубах."""
+from __future__ import annotations
+
+from sqlalchemy import text
+
+from app.acl import bump_membership_version, can_edit_report
+from app.extensions import db
+
+
+def _member(user_id: int, club_id: int, role: str) -> None:
+    db.session.execute(text('INSERT INTO "user_club"(user_id, club_id, role) VALUES (:u, :c, :r)'),
+                       {"u": user_id, "c": club_id, "r": role})
+    db.session.commit()
+    bump_membership_version()
+
+
+def test_owner_and_admin_edit_reports_of_active_club(make):
+    club = make.club()
+    owner, admin, staff = make.user(role="owner"), make.user(role="club_admin"), make.user()
+    _member(owner.id, club.id, "owner")
+    _member(admin.id, club.id, "club_admin")
+    _member(staff.id, club.id, "staff")
+    assert can_edit_report(owner, club.id)
+    assert can_edit_report(admin, club.id)
+    assert not can_edit_report(staff, club.id)
+
+
+def test_inactive_club_reports_are_not_editable(make):
+    club = make.club(is_active=False)
+    owner, admin = make.user(role="owner"), make.user(role="club_admin")
+    _member(owner.id, club.id, "owner")
+    _member(admin.id, club.id, "club_admin")
+    assert not can_edit_report(owner, club.id)
+    assert not can_edit_report(admin, club.id)
+    assert can_edit_report(make.user(role="superadmin"), club.id)
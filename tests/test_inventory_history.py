@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""История инвентаризаций: снимки закрытых сессий, их досоздание и чтение без записи."""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.extensions import db
+from app.models.inventory import InventorySession
+from app.modules.inventory import inventory_snapshots_command
+
+T0 = datetime(2025, 3, 1, 12, 0, 0)
+
+
+def _closed(club_id: int, counts: dict[int, tuple[int, int]], days: int) -> InventorySession:
+    sess = InventorySession(club_id=club_id, started_at=T0, closed_at=T0 + timedelta(days=days))
+    db.session.add(sess)
+    db.session.flush()
+    if counts:
+        db.session.execute(
+            text('INSERT INTO "inventory_count"(session_id, product_id, expected_qty, counted_qty) VALUES (:s, :p, :e, :c)'),
+            [{"s": sess.id, "p": pid, "e": e, "c": c} for pid, (e, c) in counts.items()],
+        )
+    db.session.commit()
+    return sess
+
+
+def _count(table: str) -> int:
+    return db.session.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+
+
+def _login(ctx, user):
+    client = ctx.test_client()
+    with client.session_transaction() as s:
+        s["_user_id"] = str(user.id)
+    return client
+
+
+def test_history_view_does_not_write(ctx, make):
+    club, owner = make.club(), make.user(role="superadmin")
+    cola = make.product(name="Кола", purchase_price=10)
+    a = _closed(club.id, {cola.id: (5, 4)}, 1)
+    b = _closed(club.id, {cola.id: (5, 2)}, 2)
+
+    resp = _login(ctx, owner).get(f"/inventory/history?club_id={club.id}&a={a.id}&b={b.id}")
+    assert resp.status_code == 200
+    assert "нет снимка" in resp.get_data(as_text=True)
+    assert _count("inventory_snapshot_item") == 0
+    assert _count("inventory_snapshot_admin") == 0
+
+
+def test_backfill_command_snapshots_once_including_empty_sessions(ctx, make):
+    club = make.club()
+    cola = make.product(name="Кола", purchase_price=10)
+    full = _closed(club.id, {cola.id: (5, 3)}, 1)
+    empty = _closed(club.id, {}, 2)
+
+    runner = ctx.test_cli_runner()
+    assert "Снимков создано: 2" in runner.invoke(inventory_snapshots_command).output
+    assert "Снимков создано: 0" in runner.invoke(inventory_snapshots_command).output
+
+    db.session.expire_all()
+    assert db.session.get(InventorySession, full.id).snapshot_at is not None
+    assert db.session.get(InventorySession, empty.id).snapshot_at is not None
+    shortage = db.session.execute(
+        text('SELECT shortage FROM "inventory_snapshot_item" WHERE session_id=:s'), {"s": full.id}
+    ).scalar()
+    assert float(shortage) == 20.0
+
+
+def test_backfill_keeps_existing_item_snapshot(ctx, make):
+    club = make.club()
+    cola = make.product(name="Кола", purchase_price=10)
+    sess = _closed(club.id, {cola.id: (5, 3)}, 1)
+    db.session.execute(text('''
+        INSERT INTO "inventory_snapshot_item"(session_id, product_id, name, expected_qty, counted_qty,
+                                              debt_qty, price, shortage_qty, shortage)
+        VALUES (:s, :p, 'Кола', 5, 3, 0, 7, 2, 14)
+    '''), {"s": sess.id, "p": cola.id})
+    db.session.commit()
+
+    ctx.test_cli_runner().invoke(inventory_snapshots_command)
+    rows = db.session.execute(
+        text('SELECT price, shortage FROM "inventory_snapshot_item" WHERE session_id=:s'), {"s": sess.id}
+    ).all()
+    assert [(float(p), float(s)) for p, s in rows] == [(7.0, 14.0)]
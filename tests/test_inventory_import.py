@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Импорт остатков в сессию инвентаризации: сопоставление по названию и штрих-кодам."""
+from __future__ import annotations
+
+from sqlalchemy import text
+
+from app.extensions import db
+from app.import_reader import read_batches
+from app.models.inventory import ClubProductBarcode
+from app.modules import inventory
+from app.modules.inventory import _run_import
+
+
+class _Job:
+    def track(self, batches):
+        return batches
+
+
+def _import(tmp_path, club_id: int, csv: str) -> dict:
+    path = tmp_path / "stock.csv"
+    path.write_text(csv, encoding="utf-8")
+    return _run_import(_Job(), club_id, str(path), path.name)
+
+
+def _expected(club_id: int) -> dict[int, int]:
+    rows = db.session.execute(text('''
+        SELECT ic.product_id, ic.expected_qty FROM "inventory_count" ic
+        JOIN "inventory_session" s ON s.id = ic.session_id
+        WHERE s.club_id = :c AND s.closed_at IS NULL
+    '''), {"c": club_id}).all()
+    return {int(p): int(q) for p, q in rows}
+
+
+def test_match_by_name_then_club_barcode(ctx, make, tmp_path):
+    club = make.club()
+    cola = make.product(name="Кола  0,5")
+    chips = make.product(name="Чипсы")
+    db.session.add(ClubProductBarcode(club_id=club.id, product_id=chips.id, barcode="4600001"))
+    db.session.commit()
+
+    res = _import(tmp_path, club.id,
+                  "Название;Ост. на складе;Артикулы\n"
+                  "кола 0,5;12;\n"
+                  "Lays старое имя;7;4600001\n"
+                  "Неизвестный;3;\n"
+                  "Нулевой;0;\n"
+                  ";5;\n")
+    assert res["imported"] == 2
+    assert res["errors"] == ['Не найден товар: "Неизвестный"', "Пропущена строка: отсутствует название"]
+    assert _expected(club.id) == {cola.id: 12, chips.id: 7}
+
+
+def test_replay_updates_the_open_session(ctx, make, tmp_path):
+    club = make.club()
+    cola = make.product(name="Кола")
+    chips = make.product(name="Чипсы")
+    _import(tmp_path, club.id, "Название;Остаток\nКола;10\n")
+    _import(tmp_path, club.id, "Название;Остаток\nКола;4\nЧипсы;2\nКола;5\n")
+
+    assert _expected(club.id) == {cola.id: 5, chips.id: 2}
+    sessions = db.session.execute(
+        text('SELECT COUNT(*) FROM "inventory_session" WHERE club_id=:c'), {"c": club.id}
+    ).scalar()
+    assert sessions == 1
+
+
+def test_rows_are_written_batch_by_batch(ctx, make, tmp_path, monkeypatch):
+    monkeypatch.setattr(inventory, "read_batches", lambda *a: read_batches(*a, batch_size=2))
+    club = make.club()
+    cola = make.product(name="Кола")
+    chips = make.product(name="Чипсы")
+    res = _import(tmp_path, club.id, "Название;Остаток\nКола;4\nЧипсы;2\nНеизвестный;1\nКола;5\nЧипсы;3\n")
+    assert res["imported"] == 4
+    assert _expected(club.id) == {cola.id: 5, chips.id: 3}
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Сверка инвентаризации: формула недостачи, окно долгов сессии и снимок при закрытии."""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app.extensions import db
+from app.models.debt import DebtTransaction
+from app.models.inventory import ClubProductBarcode, InventorySession
+from app.modules.inventory import _debt_window, _reconcile
+
+T0 = datetime(2025, 3, 1, 12, 0, 0)
+
+
+@pytest.fixture()
+def club(make):
+    return make.club()
+
+
+@pytest.fixture()
+def cashier(make):
+    return make.user(role="cashier")
+
+
+def _session(club_id: int, counts: dict[int, tuple[int, int]], closed_at=None) -> InventorySession:
+    sess = InventorySession(club_id=club_id, started_at=T0, closed_at=closed_at)
+    db.session.add(sess)
+    db.session.flush()
+    db.session.execute(
+        text('INSERT INTO "inventory_count"(session_id, product_id, expected_qty, counted_qty) VALUES (:s, :p, :e, :c)'),
+        [{"s": sess.id, "p": pid, "e": e, "c": c} for pid, (e, c) in counts.items()],
+    )
+    db.session.commit()
+    return sess
+
+
+def _debt(club_id: int, user_id: int, product_id: int, qty: int, at: datetime | None = None) -> DebtTransaction:
+    rec = DebtTransaction(club_id=club_id, user_id=user_id, product_id=product_id, qty=qty, kind="normal")
+    if at is not None:
+        rec.created_at = at
+    db.session.add(rec)
+    db.session.commit()
+    return rec
+
+
+def _by_id(items: list[dict]) -> dict[int, dict]:
+    return {int(it["id"]): it for it in items}
+
+
+def test_shortage_formula_and_club_price(club, cashier, make):
+    cola = make.product(name="Кола", purchase_price=50)
+    chips = make.product(name="Чипсы", purchase_price=80)
+    db.session.add(ClubProductBarcode(club_id=club.id, product_id=cola.id, barcode="111", purchase_price=60))
+    db.session.commit()
+    sess = _session(club.id, {cola.id: (10, 6), chips.id: (3, 5)})
+    _debt(club.id, cashier.id, cola.id, 1)
+
+    items, total = _reconcile(club.id, sess)
+    rows = _by_id(items)
+    assert rows[cola.id]["debt_qty"] == 1
+    assert rows[cola.id]["price"] == 60.0            # цена клуба важнее цены товара
+    assert rows[cola.id]["shortage_qty"] == 3        # 10 − 6 − 1
+    assert rows[chips.id]["shortage_qty"] == -2      # излишек
+    assert total == 3 * 60 - 2 * 80
+
+
+def test_debt_window_between_closings(club, cashier, make):
+    cola = make.product(name="Кола", purchase_price=10)
+    first = _session(club.id, {cola.id: (0, 0)}, closed_at=T0 + timedelta(days=1))
+    second = _session(club.id, {cola.id: (10, 0)}, closed_at=T0 + timedelta(days=10))
+
+    _debt(club.id, cashier.id, cola.id, 1, T0 + timedelta(hours=1))     # окно первой сессии
+    _debt(club.id, cashier.id, cola.id, 2, T0 + timedelta(days=1))      # ровно в момент закрытия первой
+    _debt(club.id, cashier.id, cola.id, 4, T0 + timedelta(days=5))
+    _debt(club.id, cashier.id, cola.id, 8, T0 + timedelta(days=11))     # после закрытия второй
+
+    assert _debt_window(first)[0] is None
+    assert _by_id(_reconcile(club.id, first)[0])[cola.id]["debt_qty"] == 1
+    assert _by_id(_reconcile(club.id, second)[0])[cola.id]["debt_qty"] == 2 + 4
+
+
+def test_debts_of_other_clubs_do_not_count(club, cashier, make):
+    other = make.club()
+    cola = make.product(name="Кола", purchase_price=10)
+    sess = _session(club.id, {cola.id: (5, 5)})
+    _debt(other.id, cashier.id, cola.id, 3)
+    assert _by_id(_reconcile(club.id, sess)[0])[cola.id]["debt_qty"] == 0
+
+
+def test_reconcile_of_closed_session_without_snapshot_is_read_only(club, cashier, make):
+    cola = make.product(name="Кола", purchase_price=10)
+    sess = _session(club.id, {cola.id: (5, 2)}, closed_at=T0 + timedelta(days=1))
+    items, total = _reconcile(club.id, sess)
+    assert total == 30.0
+    assert not db.session.new and not db.session.dirty
+    assert db.session.execute(text('SELECT COUNT(*) FROM "inventory_snapshot_item"')).scalar() == 0
+
+
+def test_debt_right_after_close_belongs_to_next_session(ctx, club, cashier, make):
+    cola = make.product(name="Кола", purchase_price=10)
+    sess = _session(club.id, {cola.id: (5, 5)})
+    sess.closed_at = datetime.utcnow()
+    db.session.commit()
+    _debt(club.id, cashier.id, cola.id, 2)  # время ставит приложение, с микросекундами
+
+    nxt = _session(club.id, {cola.id: (5, 5)})
+    assert _by_id(_reconcile(club.id, sess)[0])[cola.id]["debt_qty"] == 0
+    assert _by_id(_reconcile(club.id, nxt)[0])[cola.id]["debt_qty"] == 2
+
+
+def test_close_stores_snapshot_that_later_debts_do_not_change(ctx, club, cashier, make):
+    owner = make.user(role="superadmin")
+    cola = make.product(name="Кола", purchase_price=10)
+    sess = _session(club.id, {cola.id: (5, 3)})
+    client = ctx.test_client()
+    with client.session_transaction() as s:
+        s["_user_id"] = str(owner.id)
+    assert client.post("/inventory/close-session", data={"club_id": club.id}).status_code == 302
+
+    db.session.expire_all()
+    sess = db.session.get(InventorySession, sess.id)
+    assert sess.closed_at is not None
+    _debt(club.id, cashier.id, cola.id, 1, sess.closed_at - timedelta(seconds=1))  # задним числом
+
+    items, total = _reconcile(club.id, sess)
+    assert _by_id(items)[cola.id]["debt_qty"] == 0
+    assert total == 20.0
+
+
+def test_save_counts_only_session_rows(ctx, club, make):
+    owner = make.user(role="superadmin")
+    cola, chips, other = make.product(name="Кола"), make.product(name="Чипсы"), make.product(name="Вне сессии")
+    sess = _session(club.id, {cola.id: (5, 0), chips.id: (2, 0)})
+    client = ctx.test_client()
+    with client.session_transaction() as s:
+        s["_user_id"] = str(owner.id)
+    r = client.post("/inventory/save", json={"club_id": club.id, "rows": [
+        {"product_id": cola.id, "fridge": 2, "store": 1},
+        {"product_id": other.id, "fridge": 4},
+        {"product_id": "x"},
+    ]})
+    assert r.get_json() == {"ok": True, "saved": 1}
+    counted = dict(db.session.execute(
+        text('SELECT product_id, counted_qty FROM "inventory_count" WHERE session_id=:s'), {"s": sess.id}
+    ).all())
+    assert counted == {cola.id: 3, chips.id: 0}
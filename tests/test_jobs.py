@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Фоновые задачи: прерванные задачи при старте и запись ошибки задачи."""
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta
+
+from app import jobs
+from app.extensions import db
+from app.models.job import Job
+
+
+def _job(status: str, **ts) -> Job:
+    job = Job(kind="test", status=status, **ts)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def test_fail_stale_jobs_by_last_update(ctx, monkeypatch):
+    old = datetime.utcnow() - timedelta(hours=2)
+    stale_running = _job("running", created_at=old, started_at=old, updated_at=old)
+    stale_queued = _job("queued", created_at=old)
+    alive = _job("running", created_at=old, started_at=old, updated_at=datetime.utcnow())
+    done = _job("done", created_at=old, finished_at=old)
+
+    monkeypatch.setitem(ctx.config, "JOB_STALE_MINUTES", 30)
+    assert jobs.fail_stale_jobs(ctx) == 2
+
+    db.session.expire_all()
+    assert db.session.get(Job, stale_running.id).status == "failed"
+    assert db.session.get(Job, stale_queued.id).status == "failed"
+    assert db.session.get(Job, stale_running.id).error
+    assert db.session.get(Job, alive.id).status == "running"
+    assert db.session.get(Job, done.id).status == "done"
+
+
+def test_fail_stale_jobs_disabled(ctx, monkeypatch):
+    old = datetime.utcnow() - timedelta(days=1)
+    job = _job("running", created_at=old)
+    monkeypatch.setitem(ctx.config, "JOB_STALE_MINUTES", 0)
+    assert jobs.fail_stale_jobs(ctx) == 0
+    db.session.expire_all()
+    assert db.session.get(Job, job.id).status == "running"
+
+
+def test_failed_status_write_keeps_original_error(ctx, monkeypatch, caplog):
+    def boom(job):
+        raise ValueError("bad row 7")
+
+    real_update = jobs._update
+
+    def update(job_id, **cols):
+        if cols.get("status") == "failed":
+            raise RuntimeError("database is locked")
+        real_update(job_id, **cols)
+
+    monkeypatch.setattr(jobs, "_update", update)
+    with caplog.at_level(logging.ERROR, logger="app.jobs"):
+        job_id = jobs.submit("test", boom)
+
+    assert "bad row 7" in caplog.text
+    assert "database is locked" in caplog.text
+    db.session.expire_all()
+    assert db.session.get(Job, job_id).status == "running"  # дождётся fail_stale_jobs
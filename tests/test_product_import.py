@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Импорт номенклатуры клуба: проигрывание строк по словарям в памяти."""
+from __future__ import annotations
+
+from sqlalchemy import text
+
+from app.admin.product_import import ImportResult, import_products, placeholder_barcode
+from app.extensions import db
+
+
+def _run(club_id: int, rows: list[dict]) -> ImportResult:
+    return import_products(club_id, [rows])
+
+
+def _links(club_id: int) -> dict[str, tuple[str, float]]:
+    rows = db.session.execute(text('''
+        SELECT b.barcode, p.name, b.purchase_price FROM "club_product_barcode" b
+        JOIN "product" p ON p.id = b.product_id WHERE b.club_id = :c
+    '''), {"c": club_id}).all()
+    return {bc: (name, float(pp or 0)) for bc, name, pp in rows}
+
+
+def _product_id(name: str) -> int:
+    return db.session.execute(text('SELECT id FROM "product" WHERE name=:n'), {"n": name}).scalar()
+
+
+def test_new_products_codes_and_placeholders(make):
+    club = make.club()
+    res = _run(club.id, [
+        {"name": "Кола", "purchase_price": "55,5", "barcode": "111, 222"},
+        {"name": "Чипсы", "purchase_price": "80"},
+        {"name": "", "barcode": "333"},
+        {"name": "Удалённый", "category": "-", "barcode": "444"},
+    ])
+    assert (res.created, res.linked, res.updated, res.skipped) == (2, 3, 0, 1)
+    assert _links(club.id) == {
+        "111": ("Кола", 55.5),
+        "222": ("Кола", 55.5),
+        placeholder_barcode(_product_id("Чипсы")): ("Чипсы", 80.0),
+    }
+
+
+def test_replay_of_same_file_changes_nothing(make):
+    club = make.club()
+    rows = [
+        {"name": "Кола", "purchase_price": "50", "barcode": "111"},
+        {"name": "Чипсы", "purchase_price": "80"},
+    ]
+    _run(club.id, rows)
+    before = _links(club.id)
+    res = _run(club.id, rows)
+    assert (res.created, res.linked, res.updated) == (0, 0, 0)
+    assert _links(club.id) == before
+
+
+def test_code_replaces_placeholder_and_moves_between_products(make):
+    club = make.club()
+    _run(club.id, [
+        {"name": "Кола", "purchase_price": "50", "barcode": "111"},
+        {"name": "Чипсы", "purchase_price": "80"},
+    ])
+    res = _run(club.id, [
+        {"name": "Чипсы", "purchase_price": "85", "barcode": "222"},
+        {"name": "Кола Zero", "purchase_price": "60", "barcode": "111"},
+    ])
+    assert (res.created, res.linked, res.updated) == (1, 1, 1)
+    assert _links(club.id) == {
+        "111": ("Кола Zero", 60.0),
+        "222": ("Чипсы", 85.0),
+    }
+
+
+def test_price_without_codes_updates_existing_links(make):
+    club = make.club()
+    _run(club.id, [{"name": "Кола", "purchase_price": "50", "barcode": "111, 222"}])
+    _run(club.id, [{"name": "Кола", "purchase_price": "65"}])
+    assert _links(club.id) == {"111": ("Кола", 65.0), "222": ("Кола", 65.0)}
+
+
+def test_clubs_are_independent(make):
+    a, b = make.club(), make.club()
+    _run(a.id, [{"name": "Кола", "purchase_price": "50", "barcode": "111"}])
+    res = _run(b.id, [{"name": "Кола", "purchase_price": "70", "barcode": "111"}])
+    assert (res.created, res.linked) == (0, 1)
+    assert _links(a.id) == {"111": ("Кола", 50.0)}
+    assert _links(b.id) == {"111": ("Кола", 70.0)}
+
+
+def test_rows_split_across_batches(make):
+    club = make.club()
+    rows = [
+        {"name": "Чипсы", "purchase_price": "80"},
+        {"name": "Кола", "purchase_price": "50", "barcode": "111"},
+        {"name": "Чипсы", "purchase_price": "85", "barcode": "222"},
+        {"name": "Кола Zero", "purchase_price": "60", "barcode": "111"},
+    ]
+    res = import_products(club.id, [rows[:1], rows[1:3], rows[3:]])
+    assert (res.created, res.linked, res.updated) == (3, 3, 1)
+    assert _links(club.id) == {
+        "111": ("Кола Zero", 60.0),
+        "222": ("Чипсы", 85.0),
+    }
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""Советник по индексам: разбор планов EXPLAIN в app/query_advisor.py."""
+from __future__ import annotations
+
+from app.query_advisor import explain, full_scans
+
+
+def test_aliased_scan_is_reported_by_table(ctx):
+    # по full_name индекса нет — SQLite пишет в плане псевдоним ("SCAN u")
+    sql = 'SELECT u.id FROM "user" u WHERE u.full_name = \'x\''
+    assert full_scans(explain(sql), sql) == ["user"]
+
+
+def test_index_search_is_not_a_scan(ctx):
+    sql = 'SELECT u.id FROM "user" u WHERE u.id = 1'
+    assert full_scans(explain(sql), sql) == []
+
+
+def test_derived_table_scan_is_skipped(ctx):
+    sql = 'SELECT t.n FROM (SELECT COUNT(*) AS n FROM "club" WHERE id = 1) t'
+    plan = ["CO-ROUTINE t", "SEARCH club USING INTEGER PRIMARY KEY (rowid=?)", "SCAN t"]
+    assert full_scans(plan, sql) == []
+
+
+def test_old_sqlite_and_postgres_plans(ctx):
+    assert full_scans(["SCAN TABLE user AS u"]) == ["user"]
+    assert full_scans(["SCAN shift USING INDEX ix_shift_club"]) == []
+    assert full_scans(["Seq Scan on product  (cost=0.00..1.10 rows=10 width=4)"]) == ["product"]
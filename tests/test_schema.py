@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Реестр схемы: воркеры перечитывают его после миграций из другого процесса."""
+from __future__ import annotations
+
+from sqlalchemy import text
+
+from app import schema
+from app.extensions import db
+
+
+def test_registry_follows_shared_version(ctx):
+    schema.refresh()
+    db.session.execute(text('CREATE TABLE "t_schema_probe"(id INTEGER)'))
+    db.session.commit()
+    try:
+        schema.check_shared_version()
+        assert not schema.has_table("t_schema_probe")  # версия не менялась — в БД не ходим
+
+        schema.bump_shared_version()  # flask db upgrade в другом процессе
+        schema.check_shared_version()
+        assert schema.has_table("t_schema_probe")
+    finally:
+        db.session.execute(text('DROP TABLE "t_schema_probe"'))
+        db.session.commit()
+        schema.refresh()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Хелперы app/sqlcompat.py: одни и те же запросы выполняются на текущем бэкенде
+(SQLite; Postgres — через TEST_DATABASE_URL) и компилируются под postgresql/mysql.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, UniqueConstraint, text
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from app import sqlcompat
+from app.extensions import db
+from app.sqlcompat import ilike, insert_ignore, string_agg, ts_bound, upsert, upsert_add
+
+_meta = MetaData()
+_t = Table(
+    "t_compat", _meta,
+    Column("id", Integer, primary_key=True),
+    Column("k1", Integer, nullable=False),
+    Column("k2", Integer, nullable=False),
+    Column("v", Integer),
+    Column("s", String(64)),
+    Column("ts", DateTime),
+    UniqueConstraint("k1", "k2"),
+)
+
+COLS = ("k1", "k2", "v")
+KEY = ("k1", "k2")
+
+
+@pytest.fixture()
+def table(ctx):
+    _t.create(db.engine, checkfirst=True)
+    yield _t
+    db.session.rollback()
+    _t.drop(db.engine)
+
+
+def _rows():
+    return db.session.execute(text('SELECT k1, k2, v FROM "t_compat" ORDER BY k1, k2')).all()
+
+
+# --- на текущем бэкенде ---
+
+def test_insert_ignore_keeps_first_row(table):
+    stmt = insert_ignore("t_compat", COLS, KEY)
+    db.session.execute(stmt, {"k1": 1, "k2": 1, "v": 10})
+    db.session.execute(stmt, [{"k1": 1, "k2": 1, "v": 20}, {"k1": 1, "k2": 2, "v": 30}])
+    assert _rows() == [(1, 1, 10), (1, 2, 30)]
+
+
+def test_upsert_replaces_values(table):
+    stmt = upsert("t_compat", COLS, KEY, ("v",))
+    db.session.execute(stmt, {"k1": 1, "k2": 1, "v": 10})
+    db.session.execute(stmt, [{"k1": 1, "k2": 1, "v": 20}, {"k1": 2, "k2": 1, "v": 5}])
+    assert _rows() == [(1, 1, 20), (2, 1, 5)]
+
+
+def test_upsert_add_accumulates(table):
+    db.session.execute(text('INSERT INTO "t_compat"(k1, k2, v) VALUES (3, 3, NULL)'))
+    stmt = upsert_add("t_compat", COLS, KEY, ("v",))
+    db.session.execute(stmt, {"k1": 1, "k2": 1, "v": 10})
+    db.session.execute(stmt, [{"k1": 1, "k2": 1, "v": -3}, {"k1": 1, "k2": 1, "v": 5}, {"k1": 3, "k2": 3, "v": 7}])
+    assert _rows() == [(1, 1, 12), (3, 3, 7)]  # NULL считается нулём
+
+
+def test_string_agg(table):
+    db.session.execute(
+        text('INSERT INTO "t_compat"(k1, k2, s) VALUES (:k1, :k2, :s)'),
+        [{"k1": 1, "k2": 1, "s": "a"}, {"k1": 1, "k2": 2, "s": "b'c"}, {"k1": 2, "k2": 1, "s": "d"}],
+    )
+    rows = dict(db.session.execute(
+        text(f'SELECT k1, {string_agg("s", "; ")} FROM "t_compat" GROUP BY k1')
+    ).all())
+    assert sorted(rows[1].split("; ")) == ["a", "b'c"]
+    assert rows[2] == "d"
+
+
+def test_ilike_ascii_case_insensitive(table):
+    db.session.execute(text('INSERT INTO "t_compat"(k1, k2, s) VALUES (1, 1, \'Adrenaline Rush\')'))
+    n = db.session.execute(text(f'SELECT COUNT(*) FROM "t_compat" WHERE s {ilike()} :q'), {"q": "%rush%"}).scalar()
+    assert n == 1
+
+
+def test_ts_bound_day_range(table):
+    assert ts_bound(date(2025, 1, 2)) == "2025-01-02 00:00:00"
+    stamps = [datetime(2025, 1, 1, 23, 59, 59, 999999), datetime(2025, 1, 2), datetime(2025, 1, 2, 23, 0),
+              datetime(2025, 1, 3)]
+    db.session.execute(
+        text('INSERT INTO "t_compat"(k1, k2, ts) VALUES (:k1, 1, :ts)'),
+        [{"k1": i, "ts": ts} for i, ts in enumerate(stamps)],
+    )
+    got = db.session.execute(
+        text('SELECT k1 FROM "t_compat" WHERE ts >= :d1 AND ts < :d2 ORDER BY k1'),
+        {"d1": ts_bound(date(2025, 1, 2)), "d2": ts_bound(date(2025, 1, 3))},
+    ).scalars().all()
+    assert got == [1, 2]
+
+
+# --- SQL под другие диалекты ---
+
+@pytest.fixture()
+def as_dialect(ctx, monkeypatch):
+    dialects = {"postgresql": postgresql.dialect(), "mysql": mysql.dialect(), "sqlite": sqlite.dialect()}
+
+    def _set(name: str):
+        monkeypatch.setattr(sqlcompat, "_bind_dialect", lambda: dialects[name])
+    return _set
+
+
+def _pg(stmt) -> str:
+    return str(stmt.compile(dialect=postgresql.dialect()))
+
+
+def test_postgres_sql(as_dialect):
+    as_dialect("postgresql")
+    assert _pg(insert_ignore("t", COLS, KEY)) == (
+        'INSERT INTO "t"(k1,k2,v) VALUES (%(k1)s,%(k2)s,%(v)s) ON CONFLICT (k1,k2) DO NOTHING'
+    )
+    assert _pg(upsert("t", COLS, KEY, ("v",))).endswith("ON CONFLICT (k1,k2) DO UPDATE SET v=excluded.v")
+    assert _pg(upsert_add("t", COLS, KEY, ("v",))).endswith(
+        'ON CONFLICT (k1,k2) DO UPDATE SET v=COALESCE("t".v,0)+excluded.v'
+    )
+    assert string_agg("s", "'; ") == "STRING_AGG(CAST(s AS TEXT), '''; ')"
+    assert ilike() == "ILIKE"
+
+
+def test_mysql_sql(as_dialect):
+    as_dialect("mysql")
+    compile_ = lambda s: str(s.compile(dialect=mysql.dialect()))  # noqa: E731
+    assert compile_(insert_ignore("t", COLS, KEY)) == (
+        "INSERT IGNORE INTO `t`(k1,k2,v) VALUES (%s,%s,%s)"
+    )
+    assert compile_(upsert("user", COLS, KEY, ("v",))).startswith("INSERT INTO `user`(k1,k2,v)")
+    assert compile_(upsert("t", COLS, KEY, ("v",))).endswith("ON DUPLICATE KEY UPDATE v=VALUES(v)")
+    assert compile_(upsert_add("t", COLS, KEY, ("v",))).endswith("ON DUPLICATE KEY UPDATE v=v+VALUES(v)")
+    assert string_agg("s") == "GROUP_CONCAT(s SEPARATOR ', ')"
+    assert ilike() == "LIKE"
+
+
+def test_sqlite_sql(as_dialect):
+    as_dialect("sqlite")
+    assert str(insert_ignore("t", COLS)) == 'INSERT INTO "t"(k1,k2,v) VALUES (:k1,:k2,:v) ON CONFLICT DO NOTHING'
+    assert string_agg("s") == "GROUP_CONCAT(s, ', ')"
+    assert ilike() == "LIKE"
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""Складской журнал: движения и остатки, приход из файла, открытие журнала, снимки и остатки на дату."""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.admin.product_import import run_import
+from app.extensions import db
+from app.models.debt import DebtTransaction
+from app.models.inventory import InventorySession
+from app.models.job import Job
+from app.stock_ledger import (
+    apply_moves, checkpoint, last_checkpoint, ledger_opened, levels_at, rebuild, set_levels, stock_levels, verify,
+)
+
+
+class _Job:
+    id = None
+
+    def track(self, batches):
+        return batches
+
+
+def _moves(club_id: int) -> list[tuple[int, int, str]]:
+    return [tuple(r) for r in db.session.execute(text(
+        'SELECT product_id, qty_delta, reason FROM "stock_move" WHERE club_id=:c ORDER BY id'
+    ), {"c": club_id}).all()]
+
+
+def _login(ctx, user):
+    client = ctx.test_client()
+    with client.session_transaction() as s:
+        s["_user_id"] = str(user.id)
+    return client
+
+
+def test_apply_moves_sums_per_product_and_skips_zero(make):
+    club = make.club()
+    a, b, c = make.product(), make.product(), make.product()
+    assert apply_moves(club.id, [(a.id, 5), (b.id, 2), (a.id, -1), (c.id, 3), (c.id, -3)], "purchase") == 2
+    assert apply_moves(club.id, [(a.id, -2)], "debt") == 1
+    db.session.commit()
+
+    assert stock_levels(club.id) == {a.id: 2, b.id: 2}
+    assert stock_levels(club.id, [b.id]) == {b.id: 2}
+    assert stock_levels(club.id, []) == {}
+    assert _moves(club.id) == [(a.id, 4, "purchase"), (b.id, 2, "purchase"), (a.id, -2, "debt")]
+    assert verify(club.id) == []
+
+
+def test_set_levels_writes_corrections(make):
+    club = make.club()
+    a, b = make.product(), make.product()
+    apply_moves(club.id, [(a.id, 10)], "purchase")
+    set_levels(club.id, {a.id: 7, b.id: 4})
+    db.session.commit()
+    assert stock_levels(club.id) == {a.id: 7, b.id: 4}
+    assert _moves(club.id)[1:] == [(a.id, -3, "inventory"), (b.id, 4, "inventory")]
+    assert ledger_opened(club.id)
+
+
+def test_purchase_from_same_file_is_posted_once(ctx, make, tmp_path):
+    club = make.club()
+    path = tmp_path / "price.csv"
+    path.write_text("Название;Цена закупки;Приход\nКола;50;12\nЧипсы;80;3\n", encoding="utf-8")
+
+    first = run_import(_Job(), club.id, str(path), path.name)
+    again = run_import(_Job(), club.id, str(path), path.name)
+    assert (first["received"], first["repeated"]) == (15, 0)
+    assert (again["received"], again["repeated"]) == (0, 15)
+    assert sum(stock_levels(club.id).values()) == 15
+
+    other = make.club()
+    assert run_import(_Job(), other.id, str(path), path.name)["received"] == 15
+
+    path.write_text("Название;Цена закупки;Приход\nКола;50;6\n", encoding="utf-8")
+    assert run_import(_Job(), club.id, str(path), path.name)["received"] == 6
+    assert sum(stock_levels(club.id).values()) == 21
+
+
+def test_start_from_ledger_needs_an_inventory_first(ctx, make):
+    club, owner, cashier = make.club(), make.user(role="superadmin"), make.user()
+    cola = make.product(name="Кола")
+    apply_moves(club.id, [(cola.id, 10)], "purchase")
+    db.session.commit()
+    client = _login(ctx, owner)
+
+    client.post("/inventory/start-from-ledger", data={"club_id": club.id})
+    assert db.session.execute(text('SELECT COUNT(*) FROM "inventory_session"')).scalar() == 0
+
+    set_levels(club.id, {cola.id: 8})
+    db.session.add(DebtTransaction(club_id=club.id, user_id=cashier.id, product_id=cola.id, qty=2))
+    apply_moves(club.id, [(cola.id, -2)], "debt")
+    db.session.commit()
+
+    client.post("/inventory/start-from-ledger", data={"club_id": club.id})
+    expected = db.session.execute(text('SELECT product_id, expected_qty FROM "inventory_count"')).all()
+    assert [tuple(r) for r in expected] == [(cola.id, 8)]  # журнал 6 + долги окна 2
+
+
+# --- снимки и остатки на дату ---
+
+D1 = datetime(2025, 3, 1, 10, 0, 0)
+
+
+def _at(club_id: int, pid: int, qty: int, when: datetime, reason: str = "purchase") -> None:
+    """Движение с заданной меткой времени (как будто записано тогда)."""
+    apply_moves(club_id, [(pid, qty)], reason)
+    db.session.execute(text('UPDATE "stock_move" SET created_at=:t WHERE id=(SELECT MAX(id) FROM "stock_move")'),
+                       {"t": when})
+    db.session.commit()
+
+
+def test_levels_at_uses_checkpoint_and_tail(make):
+    club = make.club()
+    a, b = make.product(), make.product()
+    _at(club.id, a.id, 5, D1)
+    _at(club.id, b.id, 2, D1)
+    _at(club.id, a.id, -2, D1 + timedelta(days=2))
+    assert checkpoint(club.id, D1 + timedelta(days=1)) == 2
+    _at(club.id, a.id, 1, D1 + timedelta(days=3))
+    db.session.commit()
+
+    assert levels_at(club.id, D1) == ({}, None)
+    assert levels_at(club.id, D1 + timedelta(days=1))[0] == {a.id: 5, b.id: 2}
+    levels, cp = levels_at(club.id, D1 + timedelta(days=5), [a.id])
+    assert levels == {a.id: 4}
+    assert str(cp).startswith("2025-03-02 10:00:00")
+    assert verify(club.id) == []
+
+
+def test_checkpoint_skips_when_nothing_moved(make):
+    club = make.club()
+    a = make.product()
+    _at(club.id, a.id, 5, D1)
+    assert checkpoint(club.id, D1 + timedelta(days=1)) == 1
+    assert checkpoint(club.id, D1 + timedelta(days=2)) == 0
+    _at(club.id, a.id, 1, D1 + timedelta(days=2, hours=1))
+    assert checkpoint(club.id, D1 + timedelta(days=3)) == 1
+
+
+def test_checkpoint_lags_behind_uncommitted_moves(ctx, make, monkeypatch):
+    monkeypatch.setitem(ctx.config, "STOCK_CHECKPOINT_LAG", 300)
+    club = make.club()
+    a = make.product()
+    _at(club.id, a.id, 5, datetime.utcnow() - timedelta(hours=1))
+    assert checkpoint(club.id, datetime.utcnow()) == 1
+    db.session.commit()
+    now = datetime.utcnow()
+    assert datetime.fromisoformat(str(last_checkpoint(club.id))) <= now - timedelta(seconds=300)
+
+    # движение, записанное до снимка, но закоммиченное после него, всё равно учтено
+    _at(club.id, a.id, 2, now - timedelta(seconds=10))
+    assert levels_at(club.id, datetime.utcnow())[0] == {a.id: 7}
+    assert verify(club.id) == []
+
+
+def test_checkpoint_waits_for_running_club_job(ctx, make, monkeypatch):
+    monkeypatch.setitem(ctx.config, "STOCK_CHECKPOINT_LAG", 300)
+    club, other = make.club(), make.club()
+    a = make.product()
+    started = datetime.utcnow() - timedelta(hours=1)
+    _at(club.id, a.id, 5, started - timedelta(hours=1))
+    _at(other.id, a.id, 5, started - timedelta(hours=1))
+    db.session.add(Job(kind="product_import", club_id=club.id, status="running", started_at=started))
+    db.session.commit()
+
+    # импорт идёт час: его движения ещё не закоммичены, снимок клуба — не позже старта задачи
+    assert checkpoint(club.id) == 1
+    assert checkpoint(other.id) == 1
+    assert datetime.fromisoformat(str(last_checkpoint(club.id))) <= started
+    assert datetime.fromisoformat(str(last_checkpoint(other.id))) > started
+
+
+def test_rebuild_recomputes_checkpoints_and_stock(make):
+    club = make.club()
+    a = make.product()
+    _at(club.id, a.id, 5, D1)
+    checkpoint(club.id, D1 + timedelta(days=1))
+    db.session.execute(text('UPDATE "stock_checkpoint" SET qty = 99'))
+    db.session.execute(text('UPDATE "stock" SET qty = 1'))
+    db.session.commit()
+
+    assert {(r["stock"], r["ledger"], r["checkpoint"]) for r in verify(club.id)} == {(1, 5, 99)}
+    assert rebuild(club.id) == (1, 1)
+    assert verify(club.id) == []
+
+
+def test_second_close_does_not_correct_stock_again(ctx, make):
+    club, owner = make.club(), make.user(role="superadmin")
+    cola = make.product(name="Кола")
+    apply_moves(club.id, [(cola.id, 10)], "purchase")
+    sess = InventorySession(club_id=club.id)
+    db.session.add(sess)
+    db.session.flush()
+    db.session.execute(text('INSERT INTO "inventory_count"(session_id, product_id, expected_qty, counted_qty) '
+                            'VALUES (:s, :p, 10, 7)'), {"s": sess.id, "p": cola.id})
+    db.session.commit()
+
+    client = _login(ctx, owner)
+    client.post("/inventory/close-session", data={"club_id": club.id})
+    client.post("/inventory/close-session", data={"club_id": club.id})
+    assert stock_levels(club.id) == {cola.id: 7}
+    assert [m for m in _moves(club.id) if m[2] == "inventory"] == [(cola.id, -3, "inventory")]